@@ -0,0 +1,143 @@
+# account_registry.py
+"""
+Модуль реестра рекламных аккаунтов
+Хранит метаданные аккаунтов (название, валюта, часовой пояс, статус)
+в таблице ad_accounts и во внутрипроцессном кэше с ограниченным временем жизни
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Статусы аккаунта Graph API, при которых сбор данных не выполняется
+# (2 - DISABLED, 101 - CLOSED)
+INACTIVE_ACCOUNT_STATUSES = {2, 101}
+
+
+class AccountRegistry:
+    """Потокобезопасный кэш метаданных рекламных аккаунтов"""
+
+    def __init__(self, ttl: float = 21600):
+        """
+        Инициализация реестра
+
+        Args:
+            ttl: Время жизни метаданных в памяти и в таблице ad_accounts (секунды)
+        """
+        self.ttl = ttl
+        self._accounts: Dict[str, Dict[str, Any]] = {}
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(account: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Преобразует аккаунт из ответа Graph API в запись реестра
+
+        Args:
+            account: Аккаунт из ответа /adaccounts
+
+        Returns:
+            Словарь с полями ad_account_id, name, currency, timezone_name, account_status
+        """
+        ad_account_id = account.get('account_id') or str(account.get('id', '')).replace('act_', '', 1)
+        status = account.get('account_status')
+        return {
+            'ad_account_id': ad_account_id,
+            'name': account.get('name'),
+            'currency': account.get('currency'),
+            'timezone_name': account.get('timezone_name'),
+            'account_status': int(status) if status is not None else None
+        }
+
+    def get_accounts(self, facebook_client, db_manager) -> Dict[str, Dict[str, Any]]:
+        """
+        Возвращает метаданные всех доступных аккаунтов
+
+        Порядок источников: кэш в памяти, таблица ad_accounts (если данные
+        в ней не старше ttl), постраничный запрос /me/adaccounts. Свежие
+        данные из API заменяют содержимое таблицы: аккаунты, которые API
+        больше не возвращает, удаляются.
+
+        Args:
+            facebook_client: Клиент Graph API (FacebookAPIClient)
+            db_manager: Менеджер базы данных (DatabaseManager)
+
+        Returns:
+            Словарь {ad_account_id: метаданные аккаунта}
+
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        with self._lock:
+            now = time.time()
+            if self._accounts and now - self._refreshed_at < self.ttl:
+                return self._accounts
+
+            stored = db_manager.get_ad_accounts()
+            if stored:
+                refreshed_at = min(row['refreshed_at'] for row in stored)
+                if now - refreshed_at < self.ttl:
+                    self._accounts = {row['ad_account_id']: row for row in stored}
+                    self._refreshed_at = refreshed_at
+                    logger.info(f"Реестр аккаунтов загружен из базы: {len(stored)} аккаунтов")
+                    return self._accounts
+
+            accounts = {}
+            for page in facebook_client.iter_ad_accounts():
+                for account in page:
+                    record = self.normalize(account)
+                    accounts[record['ad_account_id']] = record
+
+            db_manager.upsert_ad_accounts(list(accounts.values()), now, remove_missing=True)
+            self._accounts = accounts
+            self._refreshed_at = now
+            logger.info(f"Реестр аккаунтов обновлен из Graph API: {len(accounts)} аккаунтов")
+            return self._accounts
+
+    def invalidate(self):
+        """Сбрасывает кэш в памяти (следующий get_accounts прочитает таблицу или API)"""
+        with self._lock:
+            self._accounts = {}
+            self._refreshed_at = 0.0
+
+    @staticmethod
+    def is_active(account: Optional[Dict[str, Any]]) -> bool:
+        """
+        Проверяет, нужно ли собирать данные по аккаунту
+
+        Args:
+            account: Метаданные аккаунта или None, если аккаунта нет в реестре
+
+        Returns:
+            False только для отключенных и закрытых аккаунтов
+        """
+        if not account:
+            return True
+        return account.get('account_status') not in INACTIVE_ACCOUNT_STATUSES
+
+
+_shared_registries: Dict[str, AccountRegistry] = {}
+_shared_registries_lock = threading.Lock()
+
+
+def get_shared_account_registry(access_token: str, **kwargs) -> AccountRegistry:
+    """
+    Возвращает общий для процесса реестр аккаунтов для указанного токена
+
+    Args:
+        access_token: Facebook Access Token
+        **kwargs: Параметры AccountRegistry (используются при первом создании)
+
+    Returns:
+        Экземпляр AccountRegistry
+    """
+    with _shared_registries_lock:
+        registry = _shared_registries.get(access_token)
+        if registry is None:
+            registry = AccountRegistry(**kwargs)
+            _shared_registries[access_token] = registry
+        return registry
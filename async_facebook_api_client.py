@@ -0,0 +1,914 @@
+# async_facebook_api_client.py
+"""
+Асинхронный клиент Facebook Graph API на asyncio
+Повторяет методы FacebookAPIClient, использует пул keep-alive соединений
+(опционально HTTP/2) и ограничивает количество одновременных запросов к хосту
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, AsyncIterator, Union
+from urllib.parse import urlencode, urlsplit
+
+from facebook_api_client import (
+    DEFAULT_PAGE_SIZE, DEFAULT_FILTER_CHUNK_SIZE, DEFAULT_MAX_PARALLEL_CHUNKS,
+    DEFAULT_STREAM_BATCH_SIZE, DEFAULT_CACHE_BUFFER_ROWS,
+    AD_ACCOUNT_FIELDS, ADS_FIELDS, AD_INSIGHTS_FIELDS, DAILY_INSIGHTS_FIELDS,
+    ASYNC_JOB_COMPLETED, ASYNC_JOB_FAILED_STATUSES, MAX_BATCH_SIZE,
+    AsyncReportError, BatchRequestError, build_insights_params, is_throttled_response,
+    get_auth_error, parse_batch_item
+)
+from rate_limiter import AdaptiveRateLimiter
+from response_cache import InsightsCache
+from token_status import TokenStatus
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _ResponseReader:
+    """Асинхронный файлоподобный объект над телом ответа httpx (для ijson.parse_async)"""
+
+    def __init__(self, response):
+        self._chunks = response.aiter_bytes()
+        self._buffer = b""
+
+    async def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += await self._chunks.__anext__()
+            except StopAsyncIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class AsyncFacebookAPIClient:
+    """Асинхронный клиент для работы с Facebook Graph API"""
+
+    def __init__(self, access_token: str, api_version: str = "v18.0",
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 async_poll_interval: float = 5.0,
+                 async_timeout: float = 3600.0,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 max_retries: int = 3,
+                 filter_chunk_size: int = DEFAULT_FILTER_CHUNK_SIZE,
+                 max_parallel_chunks: int = DEFAULT_MAX_PARALLEL_CHUNKS,
+                 cache: Optional[InsightsCache] = None,
+                 cache_buffer_rows: int = DEFAULT_CACHE_BUFFER_ROWS,
+                 streaming_json: bool = False,
+                 stream_batch_size: int = DEFAULT_STREAM_BATCH_SIZE,
+                 token_status: Optional[TokenStatus] = None,
+                 max_connections: int = 20,
+                 max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0,
+                 per_host_limit: int = 10,
+                 http2: bool = False,
+                 timeout: float = 120.0):
+        """
+        Инициализация клиента
+
+        Args:
+            access_token: Facebook Access Token с необходимыми разрешениями
+            api_version: Версия Graph API
+            page_size: Количество записей на одной странице ответа (параметр limit)
+            async_poll_interval: Начальный интервал опроса асинхронного отчета (секунды)
+            async_timeout: Максимальное время ожидания асинхронного отчета (секунды)
+            rate_limiter: Ограничитель частоты запросов (общий для всех клиентов с одним токеном)
+            max_retries: Количество повторов запроса при превышении лимитов API
+            filter_chunk_size: Максимальное количество ad_id в одном фильтре insights
+            max_parallel_chunks: Максимальное количество одновременно запрашиваемых частей фильтра
+            cache: Дисковый кэш дневных insights (None - без кэширования)
+            cache_buffer_rows: Диапазоны дней с большим количеством записей не кэшируются,
+                чтобы не удерживать их в памяти до окончания получения
+            streaming_json: Разбирать страницы ответа потоково, не загружая их целиком (требуется ijson)
+            stream_batch_size: Количество записей, отдаваемых за раз при потоковом разборе
+            token_status: Кэш состояния токена, сбрасываемый при ошибке авторизации
+            max_connections: Максимальный размер пула соединений
+            max_keepalive_connections: Количество соединений, удерживаемых открытыми
+            keepalive_expiry: Время жизни простаивающего keep-alive соединения (секунды)
+            per_host_limit: Максимальное количество одновременных запросов к одному хосту
+            http2: Использовать HTTP/2 (требуется пакет h2)
+            timeout: Таймаут одного запроса (секунды)
+        """
+        try:
+            import httpx
+            self.httpx = httpx
+        except ImportError:
+            raise ImportError("Для асинхронного клиента необходимо установить httpx: pip install httpx[http2]")
+
+        self.access_token = access_token
+        self.api_version = api_version
+        self.base_url = f"https://graph.facebook.com/{api_version}"
+        self.page_size = page_size
+        self.async_poll_interval = async_poll_interval
+        self.async_timeout = async_timeout
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.filter_chunk_size = filter_chunk_size
+        self.max_parallel_chunks = max_parallel_chunks
+        self.cache = cache
+        self.cache_buffer_rows = cache_buffer_rows
+        self.stream_batch_size = stream_batch_size
+        self.token_status = token_status
+        self.per_host_limit = per_host_limit
+        self.http2 = http2
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+
+        self.ijson = None
+        if streaming_json:
+            try:
+                import ijson
+                self.ijson = ijson
+            except ImportError:
+                raise ImportError("Для потокового разбора ответов необходимо установить ijson: pip install ijson")
+
+        # Пулы соединений и семафоры привязаны к циклу событий,
+        # поэтому создаются при первом запросе и сбрасываются в close()
+        self._clients: Dict[Optional[str], Any] = {}
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        # ID объявлений аккаунтов, для которых был получен полный список
+        self._account_ad_ids: Dict[str, frozenset] = {}
+
+    async def __aenter__(self) -> "AsyncFacebookAPIClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Закрывает все пулы соединений (клиент можно использовать в следующем цикле событий)"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self._host_semaphores.clear()
+
+    def _get_client(self, proxies: Optional[Dict[str, str]] = None):
+        """
+        Возвращает HTTP-клиент с пулом соединений для указанного прокси
+
+        Args:
+            proxies: Конфигурация прокси {"http": "...", "https": "..."}
+
+        Returns:
+            Экземпляр httpx.AsyncClient
+        """
+        proxy = (proxies or {}).get('https') or (proxies or {}).get('http') or None
+        client = self._clients.get(proxy)
+        if client is None:
+            client = self.httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout,
+                proxy=proxy
+            )
+            self._clients[proxy] = client
+        return client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """Возвращает семафор, ограничивающий параллельные запросы к хосту"""
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _request(self, method: str, url: str,
+                       proxies: Optional[Dict[str, str]] = None,
+                       stream: bool = False, **kwargs):
+        """
+        Выполняет HTTP-запрос к Graph API с учетом лимитов
+
+        Перед запросом ожидает разрешения ограничителя, после запроса передает
+        ему заголовки использования лимитов. Ответы о превышении лимитов
+        повторяются до max_retries раз после паузы.
+
+        Args:
+            method: HTTP-метод
+            url: URL запроса
+            proxies: Конфигурация прокси
+            stream: Не читать тело ответа (вызывающая сторона закрывает ответ)
+            **kwargs: Параметры для httpx.AsyncClient.build_request
+
+        Returns:
+            Ответ API (raise_for_status вызывает вызывающая сторона)
+        """
+        client = self._get_client(proxies)
+        endpoint = metrics.endpoint_name(url, method)
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                while True:
+                    wait = self.rate_limiter.try_acquire()
+                    if not wait:
+                        break
+                    await asyncio.sleep(wait)
+
+            async with self._host_semaphore(url):
+                with metrics.API_REQUEST_DURATION.time(endpoint=endpoint, method=method):
+                    response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+            # Тело ответа с ошибкой нужно для определения ее кода
+            if stream and response.status_code >= 400:
+                await response.aread()
+            metrics.API_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            response_bytes = 0
+            if not stream or response.is_stream_consumed:
+                response_bytes = len(response.content)
+            elif response.headers.get('Content-Length'):
+                response_bytes = int(response.headers['Content-Length'])
+            metrics.API_RESPONSE_BYTES.inc(response_bytes, endpoint=endpoint)
+            metrics.record_collection(api_calls=1, api_errors=int(response.status_code >= 400),
+                                      response_bytes=response_bytes)
+
+            if self.rate_limiter:
+                self.rate_limiter.update_from_headers(response.headers, url)
+
+            if self.token_status:
+                auth_error = get_auth_error(response)
+                if auth_error:
+                    self.token_status.mark_invalid(auth_error)
+
+            if not is_throttled_response(response):
+                return response
+
+            metrics.API_THROTTLED.inc(endpoint=endpoint)
+            if attempt == self.max_retries:
+                return response
+
+            await response.aclose()
+            metrics.API_RETRIES.inc(endpoint=endpoint)
+            logger.warning(f"Превышен лимит Graph API, повтор {attempt + 1}/{self.max_retries}")
+            if self.rate_limiter:
+                self.rate_limiter.penalize()
+            else:
+                await asyncio.sleep(2 ** attempt * self.async_poll_interval)
+
+        return response
+
+    async def _iter_pages(self, url: str, params: Optional[Dict[str, Any]],
+                          proxies: Optional[Dict[str, str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично обходит ответ Graph API, следуя курсорам paging.next
+
+        Args:
+            url: URL первого запроса
+            params: Параметры первого запроса
+            proxies: Конфигурация прокси
+
+        Yields:
+            Список записей одной страницы (поле data); при потоковом разборе
+            страница отдается частями по stream_batch_size записей
+
+        Raises:
+            httpx.HTTPError: При ошибке запроса к API
+        """
+        next_url = url
+        next_params = params
+
+        while next_url:
+            if self.ijson:
+                paging: Dict[str, Optional[str]] = {}
+                async for batch in self._stream_page(next_url, next_params, proxies, paging):
+                    yield batch
+                next_url = paging.get('next')
+                next_params = None
+                continue
+
+            endpoint = metrics.endpoint_name(next_url)
+            response = await self._request('GET', next_url, params=next_params, proxies=proxies)
+            response.raise_for_status()
+
+            with metrics.PARSE_DURATION.time(endpoint=endpoint):
+                data = response.json()
+            page = data.get('data', [])
+            metrics.PAGES_FETCHED.inc(endpoint=endpoint)
+            metrics.ROWS_FETCHED.inc(len(page), endpoint=endpoint)
+            if page:
+                yield page
+
+            # Ссылка paging.next уже содержит все параметры запроса и курсор after
+            next_url = data.get('paging', {}).get('next')
+            next_params = None
+
+    async def _stream_page(self, url: str, params: Optional[Dict[str, Any]],
+                           proxies: Optional[Dict[str, str]],
+                           paging: Dict[str, Optional[str]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Запрашивает одну страницу и разбирает ее по мере чтения из сокета
+
+        Args:
+            url: URL запроса
+            params: Параметры запроса
+            proxies: Конфигурация прокси
+            paging: Словарь, в который записывается ссылка paging.next (ключ "next")
+
+        Yields:
+            Части записей страницы (поле data) по stream_batch_size записей
+
+        Raises:
+            httpx.HTTPError: При ошибке запроса к API
+        """
+        endpoint = metrics.endpoint_name(url)
+        response = await self._request('GET', url, params=params, proxies=proxies, stream=True)
+        try:
+            response.raise_for_status()
+            metrics.PAGES_FETCHED.inc(endpoint=endpoint)
+
+            batch = []
+            builder = None
+            started = time.perf_counter()
+            # Время разбора включает чтение из сокета: при потоковом разборе они неразделимы
+            async for prefix, event, value in self.ijson.parse_async(_ResponseReader(response), use_float=True):
+                if prefix == 'data.item' and event == 'start_map':
+                    builder = self.ijson.ObjectBuilder()
+
+                if builder is not None:
+                    builder.event(event, value)
+                    if prefix == 'data.item' and event == 'end_map':
+                        batch.append(builder.value)
+                        builder = None
+                        if len(batch) >= self.stream_batch_size:
+                            metrics.ROWS_FETCHED.inc(len(batch), endpoint=endpoint)
+                            yield batch
+                            batch = []
+                elif prefix == 'paging.next':
+                    paging['next'] = value
+
+            metrics.PARSE_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+            metrics.ROWS_FETCHED.inc(len(batch), endpoint=endpoint)
+            if batch:
+                yield batch
+        finally:
+            await response.aclose()
+
+    async def _iter_async_report(self, ad_account_id: str, params: Dict[str, Any],
+                                 proxies: Optional[Dict[str, str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Запускает асинхронный отчет insights, дожидается его готовности
+        и постранично отдает результат
+
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            params: Параметры запроса к /insights
+            proxies: Конфигурация прокси
+
+        Yields:
+            Страницы записей отчета
+
+        Raises:
+            AsyncReportError: Если отчет завершился с ошибкой или превышено время ожидания
+            httpx.HTTPError: При ошибке запроса к API
+        """
+        url = f"{self.base_url}/act_{ad_account_id}/insights"
+        job_params = {key: value for key, value in params.items() if key != "limit"}
+
+        response = await self._request('POST', url, data=job_params, proxies=proxies)
+        response.raise_for_status()
+
+        report_run_id = response.json().get('report_run_id')
+        if not report_run_id:
+            raise AsyncReportError(f"API не вернул report_run_id для аккаунта {ad_account_id}")
+
+        logger.info(f"Запущен асинхронный отчет {report_run_id} для аккаунта {ad_account_id}")
+
+        status_url = f"{self.base_url}/{report_run_id}"
+        status_params = {
+            "fields": "async_status,async_percent_completion",
+            "access_token": self.access_token
+        }
+        delay = self.async_poll_interval
+        deadline = time.monotonic() + self.async_timeout
+
+        while True:
+            response = await self._request('GET', status_url, params=status_params, proxies=proxies)
+            response.raise_for_status()
+
+            job = response.json()
+            status = job.get('async_status')
+            if status == ASYNC_JOB_COMPLETED:
+                break
+            if status in ASYNC_JOB_FAILED_STATUSES:
+                raise AsyncReportError(f"Асинхронный отчет {report_run_id} завершился со статусом '{status}'")
+            if time.monotonic() + delay > deadline:
+                raise AsyncReportError(f"Асинхронный отчет {report_run_id} не завершился за {self.async_timeout} секунд")
+
+            logger.debug(f"Отчет {report_run_id}: {status}, {job.get('async_percent_completion', 0)}%")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+        result_params = {
+            "limit": params.get("limit", self.page_size),
+            "access_token": self.access_token
+        }
+        async for page in self._iter_pages(f"{status_url}/insights", result_params, proxies=proxies):
+            yield page
+
+    def _effective_ad_ids(self, ad_account_id: str,
+                          ad_ids: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        Убирает дубликаты из фильтра по ad.id и отбрасывает фильтр,
+        если он охватывает все объявления аккаунта
+
+        Returns:
+            Список ID объявлений для фильтра или None
+        """
+        if not ad_ids:
+            return None
+
+        ad_ids = list(dict.fromkeys(ad_ids))
+        account_ad_ids = self._account_ad_ids.get(ad_account_id)
+        if account_ad_ids is not None and account_ad_ids.issubset(ad_ids):
+            logger.debug(f"Фильтр по ad.id охватывает весь аккаунт {ad_account_id}, пропускаем его")
+            return None
+        return ad_ids
+
+    async def _iter_insights(self, ad_account_id: str, fields: str, start_date: str, end_date: str,
+                             ad_ids: Optional[List[str]] = None,
+                             proxies: Optional[Dict[str, str]] = None,
+                             time_increment: Optional[str] = None,
+                             page_size: Optional[int] = None,
+                             use_async: bool = False) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает insights, разбивая фильтр по ad.id на части,
+        которые запрашиваются параллельно (не более max_parallel_chunks одновременно)
+
+        Yields:
+            Страницы записей insights
+        """
+        ad_ids = self._effective_ad_ids(ad_account_id, ad_ids)
+
+        def fetch(chunk: Optional[List[str]]) -> AsyncIterator[List[Dict[str, Any]]]:
+            params = build_insights_params(self.access_token, fields, start_date, end_date,
+                                           ad_ids=chunk, time_increment=time_increment,
+                                           limit=page_size or self.page_size)
+            if use_async:
+                return self._iter_async_report(ad_account_id, params, proxies=proxies)
+            return self._iter_pages(f"{self.base_url}/act_{ad_account_id}/insights", params, proxies=proxies)
+
+        if not ad_ids or len(ad_ids) <= self.filter_chunk_size:
+            async for page in fetch(ad_ids):
+                yield page
+            return
+
+        chunks = [ad_ids[i:i + self.filter_chunk_size] for i in range(0, len(ad_ids), self.filter_chunk_size)]
+        logger.info(f"Фильтр по {len(ad_ids)} объявлениям разбит на {len(chunks)} частей")
+
+        async def collect(chunk: List[str]) -> List[List[Dict[str, Any]]]:
+            return [page async for page in fetch(chunk)]
+
+        # Скользящее окно, как в FacebookAPIClient: одновременно выполняется не более
+        # max_parallel_chunks частей, так что в памяти находятся результаты только этих частей
+        remaining = iter(chunks)
+        pending = {asyncio.ensure_future(collect(chunk))
+                   for _, chunk in zip(range(self.max_parallel_chunks), remaining)}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for page in task.result():
+                        yield page
+                    next_chunk = next(remaining, None)
+                    if next_chunk is not None:
+                        pending.add(asyncio.ensure_future(collect(next_chunk)))
+        finally:
+            # При ошибке или досрочной остановке не продолжаем оставшиеся части
+            for task in pending:
+                task.cancel()
+
+    async def _iter_cached_daily_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                                          ad_ids: Optional[List[str]] = None,
+                                          proxies: Optional[Dict[str, str]] = None,
+                                          page_size: Optional[int] = None,
+                                          use_async: bool = False) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает ежедневные insights с использованием кэша
+        (см. FacebookAPIClient._iter_cached_daily_insights)
+
+        Обращения к кэшу (SQLite) выполняются в отдельном потоке,
+        чтобы не останавливать цикл событий.
+
+        Yields:
+            Страницы ежедневных записей insights
+        """
+        first_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+        last_day = datetime.strptime(end_date, '%Y-%m-%d').date()
+        days = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d')
+                for i in range((last_day - first_day).days + 1)]
+
+        def key(day: str) -> str:
+            return self.cache.make_key(ad_account_id, "ad", DAILY_INSIGHTS_FIELDS, day, ad_ids)
+
+        async def fetch(missing: List[str]) -> AsyncIterator[List[Dict[str, Any]]]:
+            rows_by_day: Optional[Dict[str, List[Dict[str, Any]]]] = {day: [] for day in missing}
+            buffered = 0
+            async for page in self._iter_insights(
+                ad_account_id, DAILY_INSIGHTS_FIELDS, missing[0], missing[-1],
+                ad_ids=ad_ids, proxies=proxies, time_increment="1",
+                page_size=page_size, use_async=use_async
+            ):
+                if rows_by_day is not None:
+                    buffered += len(page)
+                    if buffered > self.cache_buffer_rows:
+                        logger.info(f"Аккаунт {ad_account_id}: диапазон {missing[0]} - {missing[-1]} "
+                                    f"не кэшируется (более {self.cache_buffer_rows} записей)")
+                        rows_by_day = None
+                    else:
+                        for row in page:
+                            rows_by_day.setdefault(row.get('date_start', missing[0]), []).append(row)
+                yield page
+
+            if rows_by_day is None:
+                return
+
+            # В кэш попадает только полностью полученный диапазон
+            for day, rows in rows_by_day.items():
+                await asyncio.to_thread(self.cache.put, key(day), ad_account_id, day, rows)
+
+        missing: List[str] = []
+        for day in days:
+            rows = await asyncio.to_thread(self.cache.get, key(day))
+            if rows is None:
+                missing.append(day)
+                continue
+
+            if missing:
+                async for page in fetch(missing):
+                    yield page
+                missing = []
+            if rows:
+                yield rows
+
+        if missing:
+            async for page in fetch(missing):
+                yield page
+
+    async def iter_ad_accounts(self, user_id: str = "me",
+                               page_size: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает рекламные аккаунты пользователя
+
+        Args:
+            user_id: ID пользователя (по умолчанию "me")
+            page_size: Размер страницы (по умолчанию self.page_size)
+
+        Yields:
+            Страницы рекламных аккаунтов
+        """
+        url = f"{self.base_url}/{user_id}/adaccounts"
+        params = {
+            "fields": AD_ACCOUNT_FIELDS,
+            "limit": page_size or self.page_size,
+            "access_token": self.access_token
+        }
+
+        try:
+            async for page in self._iter_pages(url, params):
+                yield page
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при получении рекламных аккаунтов: {e}")
+            raise
+
+    async def get_ad_accounts(self, user_id: str = "me") -> List[Dict[str, Any]]:
+        """
+        Получает список рекламных аккаунтов пользователя
+
+        Args:
+            user_id: ID пользователя (по умолчанию "me")
+
+        Returns:
+            Список рекламных аккаунтов
+        """
+        accounts = []
+        async for page in self.iter_ad_accounts(user_id):
+            accounts.extend(page)
+
+        logger.info(f"Получено {len(accounts)} рекламных аккаунтов")
+        return accounts
+
+    async def iter_ads(self, ad_account_id: str,
+                       page_size: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает объявления рекламного аккаунта
+
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            page_size: Размер страницы (по умолчанию self.page_size)
+
+        Yields:
+            Страницы объявлений с их ID и названиями
+        """
+        url = f"{self.base_url}/act_{ad_account_id}/ads"
+        params = {
+            "fields": ADS_FIELDS,
+            "limit": page_size or self.page_size,
+            "access_token": self.access_token
+        }
+
+        try:
+            async for page in self._iter_pages(url, params):
+                yield page
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {e}")
+            raise
+
+    async def count_ads(self, ad_account_id: str, proxy_config: Optional[Dict[str, str]] = None) -> int:
+        """
+        Получает количество объявлений аккаунта одним запросом (summary=total_count)
+
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+
+        Returns:
+            Количество объявлений (без архивных и удаленных)
+        """
+        url = f"{self.base_url}/act_{ad_account_id}/ads"
+        params = {
+            "fields": "id",
+            "limit": 1,
+            "summary": "total_count",
+            "access_token": self.access_token
+        }
+
+        try:
+            response = await self._request('GET', url, params=params, proxies=proxy_config)
+            response.raise_for_status()
+            return int(response.json().get('summary', {}).get('total_count', 0))
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при получении количества объявлений для аккаунта {ad_account_id}: {e}")
+            raise
+
+    async def get_ads(self, ad_account_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получает список объявлений для указанного рекламного аккаунта
+
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            limit: Максимальное количество объявлений для получения
+
+        Returns:
+            Список объявлений с их ID и названиями
+        """
+        ads = []
+        complete = True
+
+        async for page in self.iter_ads(ad_account_id, page_size=min(limit, self.page_size)):
+            ads.extend(page[:limit - len(ads)])
+            if len(ads) >= limit:
+                complete = False
+                break
+
+        if complete:
+            # Получен полный список объявлений аккаунта
+            self._account_ad_ids[ad_account_id] = frozenset(ad['id'] for ad in ads)
+
+        logger.info(f"Получено {len(ads)} объявлений для аккаунта {ad_account_id}")
+        return ads
+
+    async def iter_ad_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                               ad_ids: Optional[List[str]] = None,
+                               proxy_config: Optional[Dict[str, str]] = None,
+                               page_size: Optional[int] = None,
+                               use_async: bool = False) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает данные о расходах на рекламу за указанный период
+
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            start_date: Начальная дата в формате YYYY-MM-DD
+            end_date: Конечная дата в формате YYYY-MM-DD
+            ad_ids: Список ID объявлений (если None, получает данные по всем объявлениям)
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            page_size: Размер страницы (по умолчанию self.page_size)
+            use_async: Получать данные через асинхронный отчет (для больших периодов)
+
+        Yields:
+            Страницы данных о расходах
+        """
+        try:
+            async for page in self._iter_insights(
+                ad_account_id, AD_INSIGHTS_FIELDS, start_date, end_date,
+                ad_ids=ad_ids, proxies=proxy_config or None,
+                page_size=page_size, use_async=use_async
+            ):
+                yield page
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при получении данных о расходах для аккаунта {ad_account_id}: {e}")
+            raise
+
+    async def get_ad_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                              ad_ids: Optional[List[str]] = None,
+                              proxy_config: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Получает данные о расходах на рекламу за указанный период
+
+        Returns:
+            Список данных о расходах
+        """
+        insights = []
+        async for page in self.iter_ad_insights(ad_account_id, start_date, end_date,
+                                                ad_ids=ad_ids, proxy_config=proxy_config):
+            insights.extend(page)
+
+        logger.info(f"Получено {len(insights)} записей о расходах для аккаунта {ad_account_id}")
+        return insights
+
+    async def iter_daily_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                                  ad_ids: Optional[List[str]] = None,
+                                  proxy_config: Optional[Dict[str, str]] = None,
+                                  page_size: Optional[int] = None,
+                                  use_async: bool = False) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает ежедневные данные о расходах на рекламу
+
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            start_date: Начальная дата в формате YYYY-MM-DD
+            end_date: Конечная дата в формате YYYY-MM-DD
+            ad_ids: Список ID объявлений (если None, получает данные по всем объявлениям)
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            page_size: Размер страницы (по умолчанию self.page_size)
+            use_async: Получать данные через асинхронный отчет (для больших периодов)
+
+        Yields:
+            Страницы ежедневных данных о расходах
+        """
+        try:
+            if self.cache:
+                pages = self._iter_cached_daily_insights(
+                    ad_account_id, start_date, end_date, ad_ids=ad_ids,
+                    proxies=proxy_config or None, page_size=page_size, use_async=use_async
+                )
+            else:
+                pages = self._iter_insights(
+                    ad_account_id, DAILY_INSIGHTS_FIELDS, start_date, end_date,
+                    ad_ids=ad_ids, proxies=proxy_config or None,
+                    time_increment="1",  # Ежедневная разбивка
+                    page_size=page_size, use_async=use_async
+                )
+            async for page in pages:
+                yield page
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при получении ежедневных данных для аккаунта {ad_account_id}: {e}")
+            raise
+
+    async def get_daily_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                                 ad_ids: Optional[List[str]] = None,
+                                 proxy_config: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Получает ежедневные данные о расходах на рекламу
+
+        Returns:
+            Список ежедневных данных о расходах
+        """
+        insights = []
+        async for page in self.iter_daily_insights(ad_account_id, start_date, end_date,
+                                                   ad_ids=ad_ids, proxy_config=proxy_config):
+            insights.extend(page)
+
+        logger.info(f"Получено {len(insights)} ежедневных записей для аккаунта {ad_account_id}")
+        return insights
+
+    async def execute_batch(self, batch_requests: List[Dict[str, Any]]) -> List[Union[Dict[str, Any], BatchRequestError]]:
+        """
+        Выполняет независимые запросы к Graph API пачками через batch-запрос
+        (пачки по MAX_BATCH_SIZE отправляются параллельно)
+
+        Args:
+            batch_requests: Список запросов вида {"method": "GET", "relative_url": "..."}
+
+        Returns:
+            Для каждого запроса - разобранное тело ответа или BatchRequestError
+        """
+        chunks = [batch_requests[i:i + MAX_BATCH_SIZE] for i in range(0, len(batch_requests), MAX_BATCH_SIZE)]
+
+        async def send(chunk: List[Dict[str, Any]]) -> List[Any]:
+            response = await self._request('POST', self.base_url + "/", data={
+                "batch": json.dumps(chunk),
+                "include_headers": "false",
+                "access_token": self.access_token
+            })
+            response.raise_for_status()
+            return [parse_batch_item(item) for item in response.json()]
+
+        try:
+            responses = await asyncio.gather(*(send(chunk) for chunk in chunks))
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при выполнении batch-запроса: {e}")
+            raise
+
+        logger.info(f"Выполнено {len(batch_requests)} запросов в {len(chunks)} batch-запросах")
+        return [item for chunk_results in responses for item in chunk_results]
+
+    async def get_ads_batch(self, ad_account_ids: List[str], limit: int = 100) -> Dict[str, Union[List[Dict[str, Any]], BatchRequestError]]:
+        """
+        Получает объявления для нескольких рекламных аккаунтов через batch-запросы
+        (см. FacebookAPIClient.get_ads_batch)
+
+        Args:
+            ad_account_ids: Список ID рекламных аккаунтов (без префикса "act_")
+            limit: Максимальное количество объявлений на аккаунт
+
+        Returns:
+            Словарь {ad_account_id: список объявлений или BatchRequestError}
+        """
+        query = urlencode({
+            "fields": ADS_FIELDS,
+            "limit": min(limit, self.page_size)
+        })
+        batch_requests = [
+            {"method": "GET", "relative_url": f"act_{ad_account_id}/ads?{query}"}
+            for ad_account_id in ad_account_ids
+        ]
+
+        async def complete_ads(ad_account_id: str, body: Any) -> Union[List[Dict[str, Any]], BatchRequestError]:
+            if isinstance(body, BatchRequestError):
+                logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {body}")
+                return body
+
+            ads = body.get('data', [])[:limit]
+            next_url = body.get('paging', {}).get('next')
+            complete = not next_url and len(body.get('data', [])) <= limit
+            if next_url and len(ads) < limit:
+                complete = True
+                try:
+                    async for page in self._iter_pages(next_url, None):
+                        ads.extend(page[:limit - len(ads)])
+                        if len(ads) >= limit:
+                            complete = False
+                            break
+                except self.httpx.HTTPError as e:
+                    logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {e}")
+                    return BatchRequestError(str(e))
+
+            if complete:
+                self._account_ad_ids[ad_account_id] = frozenset(ad['id'] for ad in ads)
+            return ads
+
+        bodies = await self.execute_batch(batch_requests)
+        results = await asyncio.gather(*(complete_ads(ad_account_id, body)
+                                         for ad_account_id, body in zip(ad_account_ids, bodies)))
+        return dict(zip(ad_account_ids, results))
+
+    async def debug_token(self) -> Dict[str, Any]:
+        """
+        Получает сведения о токене одним запросом /debug_token
+
+        Returns:
+            Поле data ответа (is_valid, expires_at, scopes и др.)
+        """
+        url = f"{self.base_url}/debug_token"
+        params = {
+            "input_token": self.access_token,
+            "access_token": self.access_token
+        }
+
+        try:
+            response = await self._request('GET', url, params=params)
+            response.raise_for_status()
+            return response.json().get('data', {})
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при проверке токена Facebook: {e}")
+            raise
+
+    async def test_connection(self) -> bool:
+        """
+        Тестирует подключение к Facebook API
+
+        Returns:
+            True если подключение успешно
+        """
+        url = f"{self.base_url}/me"
+        params = {
+            "fields": "id,name",
+            "access_token": self.access_token
+        }
+
+        try:
+            response = await self._request('GET', url, params=params)
+            response.raise_for_status()
+
+            logger.info(f"Подключение к Facebook API успешно. Пользователь: {response.json().get('name')}")
+            return True
+
+        except self.httpx.HTTPError as e:
+            logger.error(f"Ошибка при тестировании подключения к Facebook API: {e}")
+            raise
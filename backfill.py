@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Скрипт загрузки исторических данных Facebook Ad Spend
+Делит период на части по аккаунтам и интервалам, выполняет их параллельно
+и отмечает завершенные части в базе, чтобы после сбоя продолжить с места остановки
+
+Пример:
+    python backfill.py --start 2024-01-01 --end 2024-06-30 --chunk-days 7 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Tuple
+
+# Добавляем текущую директорию в PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from config_manager import config_manager
+from orchestrator import FacebookSpendOrchestrator
+from account_registry import AccountRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def split_period(start_date: str, end_date: str, chunk_days: int) -> List[Tuple[str, str]]:
+    """
+    Делит период на последовательные интервалы не длиннее chunk_days дней
+
+    Args:
+        start_date: Начальная дата в формате YYYY-MM-DD
+        end_date: Конечная дата в формате YYYY-MM-DD
+        chunk_days: Длина интервала в днях (не меньше 1)
+
+    Returns:
+        Список кортежей (date_start, date_end)
+
+    Raises:
+        ValueError: Если chunk_days меньше 1
+    """
+    if chunk_days < 1:
+        raise ValueError(f"Длина интервала должна быть не меньше 1 дня: {chunk_days}")
+
+    current = datetime.strptime(start_date, '%Y-%m-%d')
+    last = datetime.strptime(end_date, '%Y-%m-%d')
+    periods = []
+
+    while current <= last:
+        period_end = min(current + timedelta(days=chunk_days - 1), last)
+        periods.append((current.strftime('%Y-%m-%d'), period_end.strftime('%Y-%m-%d')))
+        current = period_end + timedelta(days=1)
+
+    return periods
+
+
+def positive_int(value: str) -> int:
+    """Тип аргумента argparse: целое число больше 0"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"ожидается целое число больше 0: {value}")
+    return number
+
+
+def load_profiles(orchestrator: FacebookSpendOrchestrator) -> List[Dict[str, Any]]:
+    """
+    Получает активные профили из таблицы profiles
+
+    Args:
+        orchestrator: Оркестратор (используется его менеджер базы данных)
+
+    Returns:
+        Список конфигураций профилей
+    """
+    db_manager = orchestrator.db_manager
+    select_sql = "SELECT * FROM profiles WHERE is_active = ? ORDER BY created_at"
+    if db_manager.db_type != 'sqlite':
+        select_sql = "SELECT * FROM profiles WHERE is_active = %s ORDER BY created_at"
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(select_sql, (True,))
+        columns = [desc[0] for desc in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    return [{
+        'profile_id': profile['profile_id'],
+        'ad_account_id': profile['ad_account_id'],
+        'currency': profile.get('currency', 'USD'),
+        'proxy_url': profile.get('proxy_url', ''),
+        'ad_ids': profile.get('ad_ids', '').split(',') if profile.get('ad_ids') else []
+    } for profile in rows]
+
+
+def run_backfill(start_date: str, end_date: str, chunk_days: int = 7, workers: int = 4,
+                 account_ids: List[str] = None) -> bool:
+    """
+    Загружает исторические данные за период
+
+    Части (профиль, интервал), уже отмеченные в backfill_chunks, и профили
+    отключенных аккаунтов пропускаются. Часть отмечается завершенной, только
+    если сохранены все полученные записи.
+    Данные запрашиваются напрямую через Graph API (без запуска профилей
+    антидетект-браузера), при необходимости через proxy_url профиля.
+
+    Args:
+        start_date: Начальная дата в формате YYYY-MM-DD
+        end_date: Конечная дата в формате YYYY-MM-DD
+        chunk_days: Длина интервала одной части в днях
+        workers: Количество одновременно выполняемых частей
+        account_ids: Ограничить загрузку указанными аккаунтами
+
+    Returns:
+        True если все части завершены успешно
+    """
+    # Ежедневная разбивка и без инкрементальных отметок: период задается явно
+    config = config_manager.to_legacy_format()
+    config.update({'daily_breakdown': True, 'incremental_collection': False,
+                   'max_concurrent_profiles': workers})
+    orchestrator = FacebookSpendOrchestrator(config_dict=config)
+    orchestrator.token_status.ensure_valid(orchestrator.facebook_client)
+
+    profiles = load_profiles(orchestrator)
+    if account_ids:
+        profiles = [p for p in profiles if p['ad_account_id'] in account_ids]
+
+    periods = split_period(start_date, end_date, chunk_days)
+    accounts = orchestrator.load_accounts()
+    finished = orchestrator.db_manager.get_finished_backfill_chunks()
+
+    active_profiles = []
+    for profile_config in profiles:
+        account = accounts.get(profile_config['ad_account_id'])
+        if not AccountRegistry.is_active(account):
+            logger.info(f"Аккаунт {profile_config['ad_account_id']} отключен "
+                        f"(статус {account['account_status']}), профиль {profile_config['profile_id']} пропущен")
+            continue
+        if account and account.get('currency'):
+            profile_config = dict(profile_config, currency=account['currency'])
+        active_profiles.append(profile_config)
+    profiles = active_profiles
+
+    chunks = []
+    for profile_config in profiles:
+        for period_start, period_end in periods:
+            if (profile_config['profile_id'], period_start, period_end) not in finished:
+                chunks.append((profile_config, period_start, period_end))
+
+    total = len(profiles) * len(periods)
+    logger.info(f"Загрузка {start_date} - {end_date}: {len(profiles)} профилей, {len(periods)} интервалов, "
+                f"осталось {len(chunks)} из {total} частей")
+    if not chunks:
+        return True
+
+    progress_lock = threading.Lock()
+    started_at = time.monotonic()
+    done = 0
+    failed = 0
+    rows_total = 0
+
+    def process(chunk: Tuple[Dict[str, Any], str, str]) -> int:
+        profile_config, period_start, period_end = chunk
+        proxy_config = None
+        if profile_config.get('proxy_url'):
+            proxy_config = {'http': profile_config['proxy_url'], 'https': profile_config['proxy_url']}
+
+        # collect_profile завершается SpendWriteError, если сохранены не все
+        # полученные записи; такая часть не отмечается и повторится при следующем запуске
+        rows_saved = orchestrator.collect_profile(profile_config, period_start, period_end, proxy_config)
+        orchestrator.db_manager.mark_backfill_chunk(profile_config['profile_id'], profile_config['ad_account_id'],
+                                                    period_start, period_end, rows_saved)
+        return rows_saved
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(process, chunk): chunk for chunk in chunks}
+
+        for future in as_completed(futures):
+            profile_config, period_start, period_end = futures[future]
+            with progress_lock:
+                try:
+                    rows_total += future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Часть {period_start} - {period_end} профиля {profile_config['profile_id']} "
+                                 f"не загружена: {e}")
+
+                elapsed = time.monotonic() - started_at
+                print(f"[{done + failed}/{len(chunks)}] готово {done}, ошибок {failed}, "
+                      f"записей {rows_total}, {rows_total / elapsed:.1f} записей/с, "
+                      f"{(done + failed) / elapsed * 60:.1f} частей/мин", flush=True)
+
+    logger.info(f"Загрузка завершена: {done} частей загружено, {failed} с ошибкой, {rows_total} записей "
+                f"за {time.monotonic() - started_at:.0f} с")
+    if failed:
+        logger.info("Повторный запуск с теми же параметрами загрузит только незавершенные части")
+    return failed == 0
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Загрузка исторических данных Facebook Ad Spend")
+    parser.add_argument('--start', required=True, help="Начальная дата (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Конечная дата (YYYY-MM-DD), по умолчанию вчера")
+    parser.add_argument('--chunk-days', type=positive_int, default=7, help="Длина интервала одной части в днях")
+    parser.add_argument('--workers', type=positive_int, default=config_manager.get('max_concurrent_profiles', 4),
+                        help="Количество одновременно выполняемых частей")
+    parser.add_argument('--account', action='append', dest='accounts',
+                        help="ID рекламного аккаунта (можно указать несколько раз)")
+    args = parser.parse_args()
+
+    end_date = args.end or (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    # Импорт orchestrator уже настроил корневой логгер на журнал сборщика:
+    # force заменяет его обработчики, чтобы backfill писал в свой журнал
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(current_dir, 'facebook_spend_backfill.log')),
+            logging.StreamHandler()
+        ],
+        force=True
+    )
+
+    try:
+        success = run_backfill(args.start, end_date, chunk_days=args.chunk_days,
+                               workers=args.workers, account_ids=args.accounts)
+    except Exception as e:
+        logging.error(f"Критическая ошибка в backfill.py: {e}")
+        sys.exit(1)
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк одновременного чтения и записи SQLite
+Измеряет задержку запроса веб-приложения (get_spend_data за день)
+во время пакетной записи сборщика в режиме по умолчанию (журнал отката:
+запись блокирует читателей) и в режиме высокой пропускной способности
+(WAL, synchronous=NORMAL, mmap). Читатель работает в отдельном процессе
+со своим соединением, как веб-приложение рядом со сборщиком.
+
+Пример:
+    python benchmark_sqlite.py --rows 200000 --batch-size 1000
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import logging
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+# Добавляем текущую директорию в PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from database_manager import DatabaseManager
+
+
+def generate_rows(count: int, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Генерирует записи о расходах: 500 объявлений в день по 4 профилям
+
+    Args:
+        count: Количество записей
+        offset: Номер первой записи
+
+    Returns:
+        Список записей для DatabaseManager
+    """
+    rows = []
+    for i in range(offset, offset + count):
+        block = i // 500
+        day = (datetime(2024, 1, 1) + timedelta(days=block // 4)).strftime('%Y-%m-%d')
+        rows.append({
+            'profile_id': f"profile-{block % 4}",
+            'ad_account_id': f"account-{block % 4}",
+            'ad_id': str(i % 500),
+            'ad_name': f"Ad {i % 500}",
+            'date_start': day,
+            'date_end': day,
+            'spend': i % 1000 / 10,
+            'impressions': i % 5000,
+            'clicks': i % 50
+        })
+    return rows
+
+
+def read_loop(db_path: str, options: Dict[str, Any], ready, stop, results):
+    """
+    Читает данные за день, пока не установлен stop (выполняется в отдельном процессе)
+
+    Args:
+        db_path: Путь к базе данных
+        options: Параметры DatabaseManager (те же, что у записывающего процесса)
+        ready: Событие, устанавливаемое после подключения к базе
+        stop: Событие окончания записи
+        results: Очередь, в которую помещается (задержки чтений, количество ошибок)
+    """
+    logging.basicConfig(level=logging.WARNING)
+    db_manager = DatabaseManager(db_path=db_path, db_type="sqlite", pool_max_size=1, **options)
+    latencies: List[float] = []
+    errors = 0
+    ready.set()
+
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            # Методы DatabaseManager возвращают [] при ошибке, поэтому
+            # чтение выполняется тем же запросом, что и get_spend_data, напрямую
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT * FROM ad_spend WHERE profile_id = ? AND ad_account_id = ? "
+                    "AND date_start >= ? AND date_start <= ? AND date_end <= ? "
+                    "ORDER BY date_start DESC, ad_account_id, ad_id",
+                    ("profile-1", "account-1", "2024-01-03", "2024-01-03", "2024-01-03")
+                )
+                cursor.fetchall()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    db_manager.pool.close_all()
+    results.put((latencies, errors))
+
+
+def run_case(name: str, rows: int, batch_size: int, **options) -> Dict[str, Any]:
+    """
+    Выполняет пакетную запись в этом процессе и чтение в отдельном
+
+    Args:
+        name: Название варианта
+        rows: Количество записываемых записей
+        batch_size: Количество записей в одном вызове insert_multiple_spend_data
+        **options: Параметры DatabaseManager
+
+    Returns:
+        Результаты: длительность записи, количество и задержки чтений, ошибки
+    """
+    # Временный каталог с базой удаляется после замера
+    with tempfile.TemporaryDirectory(prefix="spend-bench-") as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path=db_path, db_type="sqlite", change_detection=False,
+                                     bulk_batch_size=batch_size, pool_max_size=4, **options)
+        # Данные, которые читает веб-приложение, сохранены до начала записи
+        db_manager.insert_multiple_spend_data(generate_rows(20000))
+
+        # Читатель - отдельный процесс со своим соединением: в режиме журнала
+        # отката фиксация записи блокирует его так же, как веб-приложение
+        context = multiprocessing.get_context("spawn")
+        ready, stop, results = context.Event(), context.Event(), context.Queue()
+        reader = context.Process(target=read_loop, args=(db_path, options, ready, stop, results),
+                                 name="bench-reader", daemon=True)
+        reader.start()
+        ready.wait()
+
+        started = time.perf_counter()
+        for offset in range(20000, 20000 + rows, batch_size):
+            db_manager.insert_multiple_spend_data(generate_rows(min(batch_size, 20000 + rows - offset), offset))
+        write_seconds = time.perf_counter() - started
+
+        stop.set()
+        latencies, errors = results.get()
+        reader.join()
+        db_manager.pool.close_all()
+
+    latencies.sort()
+    return {
+        'name': name,
+        'write_seconds': write_seconds,
+        'rows_per_second': rows / write_seconds if write_seconds else 0,
+        'reads': len(latencies),
+        'read_p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'read_p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        'read_max_ms': latencies[-1] * 1000 if latencies else 0,
+        'errors': errors
+    }
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк одновременного чтения и записи SQLite")
+    parser.add_argument('--rows', type=int, default=100000, help="Количество записываемых записей")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Записей в одном пакете записи")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = [
+        run_case("default", args.rows, args.batch_size, sqlite_tuning=False),
+        run_case("tuned", args.rows, args.batch_size, sqlite_tuning=True)
+    ]
+
+    print(f"{'Режим':<10}{'Запись, с':>11}{'Записей/с':>12}{'Чтений':>9}"
+          f"{'p50, мс':>10}{'p95, мс':>10}{'max, мс':>10}{'Ошибок':>9}")
+    for result in results:
+        print(f"{result['name']:<10}{result['write_seconds']:>11.2f}{result['rows_per_second']:>12.0f}"
+              f"{result['reads']:>9}{result['read_p50_ms']:>10.1f}{result['read_p95_ms']:>10.1f}"
+              f"{result['read_max_ms']:>10.1f}{result['errors']:>9}")
+
+    default, tuned = results
+    for key, label in (('read_p95_ms', 'p95'), ('read_max_ms', 'max')):
+        if tuned[key]:
+            print(f"Задержка чтения {label} во время записи: {default[key]:.1f} мс -> {tuned[key]:.1f} мс "
+                  f"(в {default[key] / tuned[key]:.1f} раза меньше с WAL)")
+    if default['reads'] and tuned['write_seconds']:
+        print(f"Чтений в секунду во время записи: {default['reads'] / default['write_seconds']:.0f} -> "
+              f"{tuned['reads'] / tuned['write_seconds']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
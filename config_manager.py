@@ -39,7 +39,59 @@ class ConfigManager:
             # Настройки сбора данных
             'days_back': int(os.getenv('DAYS_BACK', '1')),
             'daily_breakdown': os.getenv('DAILY_BREAKDOWN', 'true').lower() == 'true',
-            'delay_between_profiles': int(os.getenv('DELAY_BETWEEN_PROFILES', '10')),
+            'delay_between_profiles': int(os.getenv('DELAY_BETWEEN_PROFILES', '0')),
+            'collection_mode': os.getenv('COLLECTION_MODE', 'browser'),
+            'max_concurrent_profiles': int(os.getenv('MAX_CONCURRENT_PROFILES', '4')),
+            'incremental_collection': os.getenv('INCREMENTAL_COLLECTION', 'true').lower() == 'true',
+            'restatement_days': int(os.getenv('RESTATEMENT_DAYS', '3')),
+            'page_size': int(os.getenv('PAGE_SIZE', '500')),
+            'async_report_threshold': int(os.getenv('ASYNC_REPORT_THRESHOLD', '20000')),
+            'async_poll_interval': float(os.getenv('ASYNC_POLL_INTERVAL', '5')),
+            'async_report_timeout': float(os.getenv('ASYNC_REPORT_TIMEOUT', '3600')),
+            'account_level_insights': os.getenv('ACCOUNT_LEVEL_INSIGHTS', 'true').lower() == 'true',
+            # Пакетное получение ad_ids; применяется только при account_level_insights=False,
+            # в режиме уровня аккаунта список объявлений не запрашивается
+            'batch_requests': os.getenv('BATCH_REQUESTS', 'true').lower() == 'true',
+            'insights_filter_chunk_size': int(os.getenv('INSIGHTS_FILTER_CHUNK_SIZE', '200')),
+            'insights_max_parallel': int(os.getenv('INSIGHTS_MAX_PARALLEL', '4')),
+            'streaming_json': os.getenv('STREAMING_JSON', 'false').lower() == 'true',
+            'stream_batch_size': int(os.getenv('STREAM_BATCH_SIZE', '100')),
+            'write_batch_size': int(os.getenv('WRITE_BATCH_SIZE', '500')),
+            'change_detection': os.getenv('CHANGE_DETECTION', 'true').lower() == 'true',
+            'db_batch_size': int(os.getenv('DB_BATCH_SIZE', '1000')),
+            'db_pool_min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+            'db_pool_max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'db_pool_max_idle': int(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            'sqlite_tuning': os.getenv('SQLITE_TUNING', 'true').lower() == 'true',
+            'sqlite_cache_mb': int(os.getenv('SQLITE_CACHE_MB', '64')),
+            'sqlite_mmap_mb': int(os.getenv('SQLITE_MMAP_MB', '256')),
+            'sqlite_busy_timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '10')),
+            'partition_months_ahead': int(os.getenv('PARTITION_MONTHS_AHEAD', '3')),
+            'pipeline_queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', '4')),
+            
+            # Асинхронный HTTP-клиент Graph API (httpx)
+            'async_http_client': os.getenv('ASYNC_HTTP_CLIENT', 'false').lower() == 'true',
+            'http2': os.getenv('HTTP2', 'false').lower() == 'true',
+            'http_max_connections': int(os.getenv('HTTP_MAX_CONNECTIONS', '20')),
+            'http_per_host_limit': int(os.getenv('HTTP_PER_HOST_LIMIT', '10')),
+            
+            # Реестр рекламных аккаунтов
+            'account_registry_enabled': os.getenv('ACCOUNT_REGISTRY_ENABLED', 'true').lower() == 'true',
+            'account_registry_ttl': float(os.getenv('ACCOUNT_REGISTRY_TTL', '21600')),
+            
+            # Дисковый кэш дневных insights
+            'insights_cache_enabled': os.getenv('INSIGHTS_CACHE_ENABLED', 'true').lower() == 'true',
+            'insights_cache_path': os.getenv('INSIGHTS_CACHE_PATH', 'insights_cache.db'),
+            'insights_cache_max_mb': float(os.getenv('INSIGHTS_CACHE_MAX_MB', '512')),
+            'insights_cache_recent_ttl': float(os.getenv('INSIGHTS_CACHE_RECENT_TTL', '3600')),
+            'insights_cache_buffer_rows': int(os.getenv('INSIGHTS_CACHE_BUFFER_ROWS', '50000')),
+            'attribution_window_days': int(os.getenv('ATTRIBUTION_WINDOW_DAYS', '28')),
+            
+            # Ограничение частоты запросов к Graph API
+            'rate_limit_max_rps': float(os.getenv('RATE_LIMIT_MAX_RPS', '10')),
+            'rate_limit_burst': int(os.getenv('RATE_LIMIT_BURST', '10')),
+            'rate_limit_slowdown_pct': float(os.getenv('RATE_LIMIT_SLOWDOWN_PCT', '75')),
+            'api_max_retries': int(os.getenv('API_MAX_RETRIES', '3')),
             
             # Веб-интерфейс
             'flask_secret_key': os.getenv('FLASK_SECRET_KEY', 'dev-secret-key'),
@@ -53,6 +105,10 @@ class ConfigManager:
             # Логирование
             'log_level': os.getenv('LOG_LEVEL', 'INFO'),
             'log_file': os.getenv('LOG_FILE', '/app/logs/facebook_spend_collector.log'),
+            
+            # Профилирование запусков
+            'profile_runs': os.getenv('PROFILE_RUNS', 'false').lower() == 'true',
+            'profiling_dir': os.getenv('PROFILING_DIR', ''),
         }
     
     def get(self, key: str, default: Any = None) -> Any:
@@ -97,11 +153,57 @@ class ConfigManager:
             'anti_detect_browser_api_url': self.get('anti_detect_browser_api_url'),
             'facebook_access_token': self.get('facebook_access_token'),
             'facebook_api_version': self.get('facebook_api_version'),
+            'database_url': self.get('database_url'),
             'database_path': self.get('database_url'),
             'database_type': self.get('database_type'),
             'days_back': self.get('days_back'),
             'daily_breakdown': self.get('daily_breakdown'),
             'delay_between_profiles': self.get('delay_between_profiles'),
+            'collection_mode': self.get('collection_mode'),
+            'max_concurrent_profiles': self.get('max_concurrent_profiles'),
+            'incremental_collection': self.get('incremental_collection'),
+            'restatement_days': self.get('restatement_days'),
+            'page_size': self.get('page_size'),
+            'async_report_threshold': self.get('async_report_threshold'),
+            'async_poll_interval': self.get('async_poll_interval'),
+            'async_report_timeout': self.get('async_report_timeout'),
+            'account_level_insights': self.get('account_level_insights'),
+            'batch_requests': self.get('batch_requests'),
+            'insights_filter_chunk_size': self.get('insights_filter_chunk_size'),
+            'insights_max_parallel': self.get('insights_max_parallel'),
+            'streaming_json': self.get('streaming_json'),
+            'stream_batch_size': self.get('stream_batch_size'),
+            'write_batch_size': self.get('write_batch_size'),
+            'change_detection': self.get('change_detection'),
+            'db_batch_size': self.get('db_batch_size'),
+            'db_pool_min_size': self.get('db_pool_min_size'),
+            'db_pool_max_size': self.get('db_pool_max_size'),
+            'db_pool_max_idle': self.get('db_pool_max_idle'),
+            'sqlite_tuning': self.get('sqlite_tuning'),
+            'sqlite_cache_mb': self.get('sqlite_cache_mb'),
+            'sqlite_mmap_mb': self.get('sqlite_mmap_mb'),
+            'sqlite_busy_timeout': self.get('sqlite_busy_timeout'),
+            'partition_months_ahead': self.get('partition_months_ahead'),
+            'pipeline_queue_size': self.get('pipeline_queue_size'),
+            'async_http_client': self.get('async_http_client'),
+            'http2': self.get('http2'),
+            'http_max_connections': self.get('http_max_connections'),
+            'http_per_host_limit': self.get('http_per_host_limit'),
+            'account_registry_enabled': self.get('account_registry_enabled'),
+            'account_registry_ttl': self.get('account_registry_ttl'),
+            'insights_cache_enabled': self.get('insights_cache_enabled'),
+            'insights_cache_path': self.get('insights_cache_path'),
+            'insights_cache_max_mb': self.get('insights_cache_max_mb'),
+            'insights_cache_recent_ttl': self.get('insights_cache_recent_ttl'),
+            'insights_cache_buffer_rows': self.get('insights_cache_buffer_rows'),
+            'attribution_window_days': self.get('attribution_window_days'),
+            'rate_limit_max_rps': self.get('rate_limit_max_rps'),
+            'rate_limit_burst': self.get('rate_limit_burst'),
+            'rate_limit_slowdown_pct': self.get('rate_limit_slowdown_pct'),
+            'api_max_retries': self.get('api_max_retries'),
+            'log_file': self.get('log_file'),
+            'profile_runs': self.get('profile_runs'),
+            'profiling_dir': self.get('profiling_dir'),
             'profiles': []  # Профили будут загружаться из базы данных
         }
 
@@ -0,0 +1,188 @@
+# connection_pool.py
+"""
+Модуль пула соединений с базой данных
+Соединения переиспользуются между вызовами DatabaseManager.get_connection
+вместо установки нового соединения (TCP и аутентификации) на каждый запрос
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с ограничением размера"""
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = 1, max_size: int = 10,
+                 max_idle: float = 300.0, health_check_interval: float = 30.0,
+                 timeout: float = 30.0):
+        """
+        Инициализация пула
+
+        Args:
+            connect: Функция, создающая новое соединение
+            min_size: Количество соединений, которые не закрываются при простое
+            max_size: Максимальное количество открытых соединений
+            max_idle: Время простоя (секунды), после которого лишнее соединение закрывается
+            health_check_interval: Соединения, простаивавшие дольше (секунды),
+                проверяются запросом SELECT 1 перед выдачей
+            timeout: Время ожидания свободного соединения (секунды)
+        """
+        self.connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        # Свободные соединения с временем возврата; последние возвращенные
+        # выдаются первыми, чтобы лишние простаивали и закрывались
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> Any:
+        """
+        Выдает исправное соединение (свободное или новое)
+
+        Returns:
+            Соединение с базой данных
+
+        Raises:
+            PoolTimeoutError: Если все max_size соединений заняты дольше timeout
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                self._close_expired()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"Все {self.max_size} соединений с базой данных заняты")
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                else:
+                    conn, released_at = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self._discarded()
+                    raise
+
+            if self._is_healthy(conn, time.monotonic() - released_at):
+                return conn
+            logger.warning("Соединение с базой данных из пула неисправно и будет заменено")
+            self._close(conn)
+            self._discarded()
+
+    def release(self, conn: Any, discard: bool = False):
+        """
+        Возвращает соединение в пул
+
+        Args:
+            conn: Соединение, полученное через acquire
+            discard: Закрыть соединение вместо возврата (например, после ошибки соединения)
+        """
+        if discard or getattr(conn, 'closed', 0):
+            self._close(conn)
+            self._discarded()
+            return
+
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def close_all(self):
+        """Закрывает все свободные соединения"""
+        with self._condition:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close(conn)
+                self._size -= 1
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Возвращает состояние пула
+
+        Returns:
+            Словарь с количеством открытых, свободных и занятых соединений
+        """
+        with self._condition:
+            return {'size': self._size, 'idle': len(self._idle), 'in_use': self._size - len(self._idle)}
+
+    def _discarded(self):
+        """Уменьшает счетчик открытых соединений после закрытия выданного соединения"""
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _close_expired(self):
+        """Закрывает простаивающие дольше max_idle соединения сверх min_size (вызывается под блокировкой)"""
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._close(conn)
+            self._size -= 1
+
+    def _is_healthy(self, conn: Any, idle_seconds: float) -> bool:
+        """Проверяет соединение перед выдачей"""
+        if getattr(conn, 'closed', 0):
+            return False
+        if idle_seconds < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn: Any):
+        """Закрывает соединение, игнорируя ошибки"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_shared_pools: Dict[Tuple[str, str], ConnectionPool] = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(db_type: str, db_path: str, connect: Callable[[], Any], **options) -> ConnectionPool:
+    """
+    Возвращает общий для процесса пул соединений с указанной базой данных
+
+    Args:
+        db_type: Тип базы данных
+        db_path: Путь к файлу базы данных или строка подключения
+        connect: Функция, создающая новое соединение (используется при создании пула)
+        **options: Параметры ConnectionPool (используются при создании пула)
+
+    Returns:
+        Экземпляр ConnectionPool
+    """
+    key = (db_type, db_path)
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(connect, **options)
+            _shared_pools[key] = pool
+        return pool
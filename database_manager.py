@@ -4,27 +4,102 @@
 Поддерживает SQLite и PostgreSQL
 """
 
+import hashlib
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterable, Tuple
 from contextlib import contextmanager
 
+import metrics
+import migrations
+import partitioning
+from connection_pool import get_shared_pool
+
 logger = logging.getLogger(__name__)
 
+# Поля записи о расходах, изменение которых требует перезаписи строки
+CONTENT_FIELDS = ('ad_name', 'spend', 'currency', 'impressions', 'clicks', 'ctr', 'cpc', 'cpm')
+
+
+def spend_content_hash(data: Dict[str, Any]) -> str:
+    """
+    Вычисляет компактный хэш содержимого записи о расходах
+    
+    Значения приводятся к тем же типам, что и при сохранении, поэтому
+    "1.50" из API и 1.5 из базы дают одинаковый хэш.
+    
+    Args:
+        data: Словарь с данными о расходах
+        
+    Returns:
+        Хэш (16 шестнадцатеричных символов)
+    """
+    values = (
+        data.get('ad_name') or '',
+        float(data.get('spend', 0)),
+        data.get('currency', 'USD'),
+        int(data.get('impressions', 0)),
+        int(data.get('clicks', 0)),
+        float(data.get('ctr', 0)),
+        float(data.get('cpc', 0)),
+        float(data.get('cpm', 0))
+    )
+    return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def spend_key(data: Dict[str, Any]) -> Tuple[str, str, str, str, str]:
+    """Возвращает уникальный ключ записи о расходах"""
+    return (str(data['profile_id']), str(data['ad_account_id']), str(data['ad_id']),
+            str(data['date_start']), str(data['date_end']))
+
+
+class SpendWriteError(Exception):
+    """Часть полученных записей о расходах не удалось сохранить"""
+
+
 class DatabaseManager:
     """Менеджер для работы с базой данных"""
     
-    def __init__(self, db_path: str = "facebook_spend_data.db", db_type: str = "sqlite"):
+    def __init__(self, db_path: str = "facebook_spend_data.db", db_type: str = "sqlite",
+                 change_detection: bool = True, bulk_batch_size: int = 1000,
+                 pool_min_size: int = 1, pool_max_size: int = 10, pool_max_idle: float = 300.0,
+                 sqlite_tuning: bool = True, sqlite_cache_mb: int = 64, sqlite_mmap_mb: int = 256,
+                 sqlite_busy_timeout: float = 10.0,
+                 partition_months_ahead: int = partitioning.PARTITION_MONTHS_AHEAD):
         """
         Инициализация менеджера базы данных
         
         Args:
             db_path: Путь к файлу базы данных (для SQLite) или строка подключения (для PostgreSQL)
             db_type: Тип базы данных ("sqlite" или "postgresql")
+            change_detection: Не перезаписывать записи о расходах, содержимое которых не изменилось
+            bulk_batch_size: Количество записей в одной транзакции пакетной записи
+            pool_min_size: Количество соединений, которые пул держит открытыми при простое
+            pool_max_size: Максимальное количество открытых соединений
+            pool_max_idle: Время простоя (секунды), после которого лишнее соединение закрывается
+            sqlite_tuning: Режим высокой пропускной способности SQLite (WAL, synchronous=NORMAL, mmap)
+            sqlite_cache_mb: Размер кэша страниц SQLite на соединение (МБ)
+            sqlite_mmap_mb: Объем файла базы SQLite, отображаемый в память (МБ)
+            sqlite_busy_timeout: Время ожидания снятия блокировки SQLite (секунды)
+            partition_months_ahead: На сколько месяцев вперед создаются секции ad_spend (PostgreSQL)
         """
         self.db_path = db_path
         self.db_type = db_type
+        self.change_detection = change_detection
+        self.bulk_batch_size = max(1, bulk_batch_size)
+        self.sqlite_tuning = sqlite_tuning
+        self.sqlite_cache_mb = sqlite_cache_mb
+        self.sqlite_mmap_mb = sqlite_mmap_mb
+        self.sqlite_busy_timeout = sqlite_busy_timeout
+        self.partition_months_ahead = max(0, partition_months_ahead)
+        
+        # Месяцы, секции которых уже проверены этим менеджером
+        self._partition_months = set()
+        self._partition_checked_at = time.monotonic()
+        self._partition_lock = threading.Lock()
         
         if db_type == "postgresql":
             try:
@@ -32,107 +107,192 @@ class DatabaseManager:
                 self.psycopg2 = psycopg2
             except ImportError:
                 raise ImportError("Для работы с PostgreSQL необходимо установить psycopg2: pip install psycopg2-binary")
+        elif db_type != "sqlite":
+            raise ValueError(f"Неподдерживаемый тип базы данных: {db_type}")
+        
+        # Пул общий для всех менеджеров процесса с той же базой данных
+        # (веб-приложение, планировщик, оркестраторы отдельных запусков)
+        self.pool = get_shared_pool(db_type, db_path, self._connect, min_size=pool_min_size,
+                                    max_size=pool_max_size, max_idle=pool_max_idle)
         
         self.create_tables()
         
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'DatabaseManager':
+        """
+        Создает менеджер по конфигурации (config_manager.get_all() или to_legacy_format())
+        
+        Args:
+            config: Словарь конфигурации
+            
+        Returns:
+            Экземпляр DatabaseManager
+        """
+        return cls(
+            db_path=config.get('database_url', 'facebook_spend_data.db'),
+            db_type=config.get('database_type', 'sqlite'),
+            change_detection=config.get('change_detection', True),
+            bulk_batch_size=config.get('db_batch_size', 1000),
+            pool_min_size=config.get('db_pool_min_size', 1),
+            pool_max_size=config.get('db_pool_max_size', 10),
+            pool_max_idle=config.get('db_pool_max_idle', 300),
+            sqlite_tuning=config.get('sqlite_tuning', True),
+            sqlite_cache_mb=config.get('sqlite_cache_mb', 64),
+            sqlite_mmap_mb=config.get('sqlite_mmap_mb', 256),
+            sqlite_busy_timeout=config.get('sqlite_busy_timeout', 10.0),
+            partition_months_ahead=config.get('partition_months_ahead', partitioning.PARTITION_MONTHS_AHEAD)
+        )
+        
+    def _connect(self):
+        """Создает новое соединение с базой данных (используется пулом)"""
+        if self.db_type == "sqlite":
+            # Соединение может быть выдано пулом разным потокам (не одновременно)
+            conn = sqlite3.connect(self.db_path, timeout=self.sqlite_busy_timeout, check_same_thread=False)
+            conn.row_factory = sqlite3.Row  # Для доступа к колонкам по имени
+            if self.sqlite_tuning:
+                self._apply_sqlite_pragmas(conn)
+            return conn
+        return self.psycopg2.connect(self.db_path)
+        
+    def _apply_sqlite_pragmas(self, conn: sqlite3.Connection):
+        """
+        Настраивает соединение SQLite для одновременной записи и чтения
+        
+        WAL позволяет читателям (веб-приложению) не ждать завершения записи
+        сборщика, synchronous=NORMAL в режиме WAL выполняет fsync только при
+        контрольной точке, а кэш страниц и mmap сокращают число системных вызовов.
+        """
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{int(self.sqlite_cache_mb * 1024)}")
+        cursor.execute(f"PRAGMA mmap_size={int(self.sqlite_mmap_mb * 1024 * 1024)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(self.sqlite_busy_timeout * 1000)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+        
+    def maintain(self):
+        """
+        Периодическое обслуживание базы данных после записи
+        
+        SQLite: переносит журнал WAL в основной файл и усекает его (иначе при
+        постоянных читателях журнал растет), затем обновляет статистику
+        планировщика запросов (PRAGMA optimize). PostgreSQL: создает секции
+        ad_spend на partition_months_ahead месяцев вперед.
+        """
+        if self.db_type == "postgresql":
+            self.ensure_partitions(partitioning.months_ahead(self.partition_months_ahead))
+            return
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if self.sqlite_tuning:
+                    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                cursor.execute("PRAGMA optimize")
+        except Exception as e:
+            logger.warning(f"Ошибка при обслуживании базы данных SQLite: {e}")
+            
     @contextmanager
     def get_connection(self):
         """
-        Контекстный менеджер для получения соединения с базой данных
+        Контекстный менеджер для получения соединения с базой данных из пула
         
         Yields:
             Соединение с базой данных
         """
-        if self.db_type == "sqlite":
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Для доступа к колонкам по имени
-        elif self.db_type == "postgresql":
-            conn = self.psycopg2.connect(self.db_path)
-        else:
-            raise ValueError(f"Неподдерживаемый тип базы данных: {self.db_type}")
+        conn = self.pool.acquire()
+        discard = False
             
         try:
             yield conn
             conn.commit()
-        except Exception:
-            conn.rollback()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            # После обрыва соединения PostgreSQL его нельзя возвращать в пул
+            if self.db_type == "postgresql" and isinstance(e, (self.psycopg2.OperationalError,
+                                                               self.psycopg2.InterfaceError)):
+                discard = True
             raise
         finally:
-            conn.close()
+            self.pool.release(conn, discard=discard)
             
     def create_tables(self):
-        """Создает необходимые таблицы в базе данных"""
+        """Создает таблицы или обновляет схему базы данных до последней версии (см. migrations.py)"""
+        applied_count = migrations.migrate(self)
+        if applied_count:
+            logger.info(f"Применено миграций схемы: {applied_count}")
+        logger.info("Таблицы базы данных созданы или уже существуют")
+            
+    def ensure_partitions(self, dates: Iterable) -> None:
+        """
+        Создает недостающие месячные секции ad_spend для дат (только PostgreSQL)
         
-        if self.db_type == "sqlite":
-            create_sql = """
-            CREATE TABLE IF NOT EXISTS ad_spend (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                profile_id TEXT NOT NULL,
-                ad_account_id TEXT NOT NULL,
-                ad_id TEXT NOT NULL,
-                ad_name TEXT,
-                date_start DATE NOT NULL,
-                date_end DATE NOT NULL,
-                spend REAL NOT NULL DEFAULT 0,
-                currency TEXT DEFAULT 'USD',
-                impressions INTEGER DEFAULT 0,
-                clicks INTEGER DEFAULT 0,
-                ctr REAL DEFAULT 0,
-                cpc REAL DEFAULT 0,
-                cpm REAL DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(profile_id, ad_account_id, ad_id, date_start, date_end)
-            )
-            """
-        elif self.db_type == "postgresql":
-            create_sql = """
-            CREATE TABLE IF NOT EXISTS ad_spend (
-                id SERIAL PRIMARY KEY,
-                profile_id VARCHAR(255) NOT NULL,
-                ad_account_id VARCHAR(255) NOT NULL,
-                ad_id VARCHAR(255) NOT NULL,
-                ad_name TEXT,
-                date_start DATE NOT NULL,
-                date_end DATE NOT NULL,
-                spend DECIMAL(10,2) NOT NULL DEFAULT 0,
-                currency VARCHAR(10) DEFAULT 'USD',
-                impressions INTEGER DEFAULT 0,
-                clicks INTEGER DEFAULT 0,
-                ctr DECIMAL(5,4) DEFAULT 0,
-                cpc DECIMAL(10,2) DEFAULT 0,
-                cpm DECIMAL(10,2) DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(profile_id, ad_account_id, ad_id, date_start, date_end)
-            )
-            """
+        Секции месяцев, уже проверенных этим менеджером, повторно не запрашиваются
+        (до истечения partitioning.PARTITION_CACHE_TTL или вызова forget_partitions),
+        поэтому вызов перед каждой записью обходится без обращения к базе.
         
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(create_sql)
-            logger.info("Таблицы базы данных созданы или уже существуют")
-            
-    def insert_spend_data(self, data: Dict[str, Any]) -> bool:
+        Args:
+            dates: Даты (date_start записей или первые дни месяцев)
         """
-        Вставляет данные о расходах в базу данных
+        if self.db_type != "postgresql":
+            return
+        
+        if time.monotonic() - self._partition_checked_at > partitioning.PARTITION_CACHE_TTL:
+            self.forget_partitions()
+        
+        try:
+            months = {partitioning.month_start(value) for value in dates} - self._partition_months
+        except (TypeError, ValueError) as e:
+            logger.error(f"Некорректная дата при проверке секций ad_spend: {e}")
+            return
+        if not months:
+            return
+        
+        with self._partition_lock:
+            months -= self._partition_months
+            if not months:
+                return
+            try:
+                with self.get_connection() as conn:
+                    partitioning.create_partitions(conn.cursor(), months)
+                self._partition_months |= months
+            except Exception as e:
+                logger.error(f"Ошибка при создании секций ad_spend: {e}")
+        
+    def forget_partitions(self):
+        """Сбрасывает список проверенных месяцев (после отсоединения секций)"""
+        with self._partition_lock:
+            self._partition_months = set()
+            self._partition_checked_at = time.monotonic()
+        
+    def _spend_upsert_sql(self, bulk: bool = False) -> str:
+        """
+        Возвращает SQL вставки или обновления записи о расходах
         
         Args:
-            data: Словарь с данными о расходах
+            bulk: Для PostgreSQL - шаблон VALUES %s для execute_values
+                (SQLite выполняет запрос через executemany)
             
         Returns:
-            True если данные успешно вставлены
+            Текст запроса
         """
-        insert_sql = """
-        INSERT OR REPLACE INTO ad_spend 
+        columns = """
         (profile_id, ad_account_id, ad_id, ad_name, date_start, date_end, 
-         spend, currency, impressions, clicks, ctr, cpc, cpm, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """ if self.db_type == "sqlite" else """
-        INSERT INTO ad_spend 
-        (profile_id, ad_account_id, ad_id, ad_name, date_start, date_end, 
-         spend, currency, impressions, clicks, ctr, cpc, cpm, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+         spend, currency, impressions, clicks, ctr, cpc, cpm, content_hash, updated_at)
+        """
+        # Обновление на месте сохраняет id и created_at строки (INSERT OR REPLACE
+        # удалил бы строку и вставил новую, перезаписывая все индексы)
+        if self.db_type == "sqlite":
+            values = "(" + ", ".join(["?"] * 15) + ")"
+        else:
+            values = "%s" if bulk else "(" + ", ".join(["%s"] * 15) + ")"
+        return f"""
+        INSERT INTO ad_spend {columns}
+        VALUES {values}
         ON CONFLICT (profile_id, ad_account_id, ad_id, date_start, date_end)
         DO UPDATE SET
             ad_name = EXCLUDED.ad_name,
@@ -143,28 +303,51 @@ class DatabaseManager:
             ctr = EXCLUDED.ctr,
             cpc = EXCLUDED.cpc,
             cpm = EXCLUDED.cpm,
+            content_hash = EXCLUDED.content_hash,
             updated_at = EXCLUDED.updated_at
         """
         
+    @staticmethod
+    def _spend_row(data: Dict[str, Any], updated_at: datetime) -> tuple:
+        """
+        Преобразует запись о расходах в параметры запроса _spend_upsert_sql
+        
+        Raises:
+            KeyError, ValueError: Если запись не содержит обязательных полей или содержит некорректные значения
+        """
+        return (
+            data['profile_id'],
+            data['ad_account_id'],
+            data['ad_id'],
+            data.get('ad_name', ''),
+            data['date_start'],
+            data['date_end'],
+            float(data.get('spend', 0)),
+            data.get('currency', 'USD'),
+            int(data.get('impressions', 0)),
+            int(data.get('clicks', 0)),
+            float(data.get('ctr', 0)),
+            float(data.get('cpc', 0)),
+            float(data.get('cpm', 0)),
+            data.get('content_hash') or spend_content_hash(data),
+            updated_at
+        )
+        
+    def insert_spend_data(self, data: Dict[str, Any]) -> bool:
+        """
+        Вставляет данные о расходах в базу данных
+        
+        Args:
+            data: Словарь с данными о расходах
+            
+        Returns:
+            True если данные успешно вставлены
+        """
         try:
+            self.ensure_partitions([data['date_start']])
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(insert_sql, (
-                    data['profile_id'],
-                    data['ad_account_id'],
-                    data['ad_id'],
-                    data.get('ad_name', ''),
-                    data['date_start'],
-                    data['date_end'],
-                    float(data.get('spend', 0)),
-                    data.get('currency', 'USD'),
-                    int(data.get('impressions', 0)),
-                    int(data.get('clicks', 0)),
-                    float(data.get('ctr', 0)),
-                    float(data.get('cpc', 0)),
-                    float(data.get('cpm', 0)),
-                    datetime.now()
-                ))
+                cursor.execute(self._spend_upsert_sql(), self._spend_row(data, datetime.now()))
                 logger.debug(f"Данные для ad_id {data['ad_id']} успешно сохранены")
                 return True
                 
@@ -172,25 +355,511 @@ class DatabaseManager:
             logger.error(f"Ошибка при сохранении данных для ad_id {data.get('ad_id')}: {e}")
             return False
             
-    def insert_multiple_spend_data(self, data_list: List[Dict[str, Any]]) -> int:
+    def bulk_upsert_spend_data(self, data_list: List[Dict[str, Any]]) -> int:
         """
-        Вставляет множественные данные о расходах в базу данных
+        Сохраняет пакеты записей о расходах одной транзакцией на пакет
+        
+        SQLite: executemany в одной транзакции. PostgreSQL: многострочный
+        INSERT ... ON CONFLICT через psycopg2.extras.execute_values.
+        Если пакет не удалось сохранить, ошибка записывается в лог, а записи
+        пакета сохраняются по одной, чтобы некорректная запись не мешала остальным.
+        Записи с одинаковым ключом в пакете сохраняются одной строкой (последняя).
         
         Args:
-            data_list: Список словарей с данными о расходах
+            data_list: Записи о расходах
             
         Returns:
-            Количество успешно вставленных записей
+            Количество сохраненных строк (после объединения записей с одинаковым ключом)
         """
         success_count = 0
+        updated_at = datetime.now()
+        upsert_sql = self._spend_upsert_sql(bulk=True)
+        # Записи за месяц без секции PostgreSQL отклонил бы
+        self.ensure_partitions(data['date_start'] for data in data_list if data.get('date_start'))
         
-        for data in data_list:
-            if self.insert_spend_data(data):
-                success_count += 1
+        for offset in range(0, len(data_list), self.bulk_batch_size):
+            batch = data_list[offset:offset + self.bulk_batch_size]
+            
+            try:
+                # В одном многострочном INSERT ... ON CONFLICT ключ не может повторяться
+                rows = {spend_key(data): self._spend_row(data, updated_at) for data in batch}
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    if self.db_type == "sqlite":
+                        cursor.executemany(upsert_sql, list(rows.values()))
+                    else:
+                        from psycopg2.extras import execute_values
+                        execute_values(cursor, upsert_sql, list(rows.values()), page_size=len(rows))
+                success_count += len(rows)
+                
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении пакета записей {offset + 1}-{offset + len(batch)}: {e}, "
+                             f"записи пакета будут сохранены по одной")
+                try:
+                    success_count += self._upsert_each(batch, updated_at)
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении записей пакета {offset + 1}-{offset + len(batch)} "
+                                 f"по одной: {e}")
                 
-        logger.info(f"Успешно сохранено {success_count} из {len(data_list)} записей")
         return success_count
         
+    def _upsert_each(self, batch: List[Dict[str, Any]], updated_at: datetime) -> int:
+        """
+        Сохраняет записи пакета по одной в одном соединении
+        
+        Все записи выполняются в одной транзакции, каждая - после точки
+        сохранения: ошибка откатывает только эту запись, не прерывая
+        транзакцию остальных, а фиксация выполняется один раз в конце.
+        
+        Args:
+            batch: Записи о расходах
+            updated_at: Время обновления записей
+            
+        Returns:
+            Количество сохраненных строк
+        """
+        rows = {}
+        for data in batch:
+            try:
+                rows[spend_key(data)] = self._spend_row(data, updated_at)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Некорректная запись о расходах для ad_id {data.get('ad_id')}: {e}")
+        
+        saved_count = 0
+        upsert_sql = self._spend_upsert_sql()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if self.db_type == "sqlite":
+                # Модуль sqlite3 не открывает транзакцию перед SAVEPOINT, и без
+                # явного BEGIN каждая точка сохранения фиксировалась бы отдельно.
+                # PostgreSQL (psycopg2) открывает транзакцию сам при первом запросе
+                cursor.execute("BEGIN")
+            for key, row in rows.items():
+                cursor.execute("SAVEPOINT spend_row")
+                try:
+                    cursor.execute(upsert_sql, row)
+                    saved_count += 1
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении данных для ad_id {key[2]}: {e}")
+                    cursor.execute("ROLLBACK TO SAVEPOINT spend_row")
+                cursor.execute("RELEASE SAVEPOINT spend_row")
+        return saved_count
+        
+    def get_content_hashes(self, data_list: List[Dict[str, Any]]) -> Dict[Tuple[str, str, str, str, str], Optional[str]]:
+        """
+        Получает хэши содержимого сохраненных записей для пакета
+        
+        Для каждой пары (профиль, аккаунт) выполняется один запрос по диапазону
+        дат пакета, использующий уникальный индекс ad_spend.
+        
+        Args:
+            data_list: Пакет записей о расходах
+            
+        Returns:
+            Словарь {ключ записи (см. spend_key): хэш или None для записей без хэша}
+        """
+        ranges: Dict[Tuple[str, str], List[str]] = {}
+        for data in data_list:
+            account_range = ranges.setdefault((str(data['profile_id']), str(data['ad_account_id'])), [])
+            account_range.append(str(data['date_start']))
+        
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
+        select_sql = f"""
+        SELECT ad_id, date_start, date_end, content_hash FROM ad_spend
+        WHERE profile_id = {placeholder} AND ad_account_id = {placeholder}
+          AND date_start >= {placeholder} AND date_start <= {placeholder}
+        """
+        
+        hashes = {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for (profile_id, ad_account_id), dates in ranges.items():
+                cursor.execute(select_sql, (profile_id, ad_account_id, min(dates), max(dates)))
+                for ad_id, date_start, date_end, stored_hash in cursor.fetchall():
+                    hashes[(profile_id, ad_account_id, str(ad_id), str(date_start), str(date_end))] = stored_hash
+        return hashes
+        
+    def insert_multiple_spend_data(self, data_list: Iterable[Dict[str, Any]]) -> int:
+        """
+        Вставляет множественные данные о расходах в базу данных
+        
+        При включенном change_detection записи сравниваются с сохраненными по
+        хэшу содержимого; записываются только новые и изменившиеся, остальные
+        пропускаются без перезаписи строки и обновления updated_at.
+        
+        Args:
+            data_list: Список или итератор словарей с данными о расходах
+            
+        Returns:
+            Количество записей, сохраненных или уже актуальных в базе (меньше
+            длины data_list, если часть записей сохранить не удалось)
+        """
+        data_list = list(data_list)
+        invalid_count = 0
+        unchanged_count = 0
+        started = time.perf_counter()
+        
+        existing = {}
+        if self.change_detection and data_list:
+            try:
+                existing = self.get_content_hashes(data_list)
+            except Exception as e:
+                logger.warning(f"Не удалось получить хэши сохраненных записей, пакет будет записан полностью: {e}")
+        
+        # Записи с одинаковым ключом сохраняются одной строкой (последняя)
+        pending = {}
+        pending_changed = 0
+        for data in data_list:
+            try:
+                key = spend_key(data)
+                data = dict(data, content_hash=spend_content_hash(data))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Некорректная запись о расходах для ad_id {data.get('ad_id')}: {e}")
+                invalid_count += 1
+                continue
+            
+            if key not in existing:
+                pending[key] = data
+            elif existing[key] != data['content_hash']:
+                pending_changed += key not in pending
+                pending[key] = data
+            else:
+                unchanged_count += 1
+        
+        written_count = self.bulk_upsert_spend_data(list(pending.values()))
+        saved_count = len(data_list) - invalid_count - (len(pending) - written_count)
+        # Если часть записей не сохранилась, считаем их среди измененных
+        changed_count = min(pending_changed, written_count)
+        inserted_count = written_count - changed_count
+        
+        elapsed = time.perf_counter() - started
+        metrics.DB_WRITE_DURATION.observe(elapsed, db_type=self.db_type)
+        metrics.DB_ROWS_WRITTEN.inc(written_count, db_type=self.db_type)
+        metrics.DB_ROWS_UNCHANGED.inc(unchanged_count, db_type=self.db_type)
+        if elapsed > 0:
+            metrics.DB_WRITE_ROWS_PER_SECOND.set(written_count / elapsed, db_type=self.db_type)
+        metrics.record_collection(rows_written=written_count, rows_inserted=inserted_count,
+                                  rows_changed=changed_count, rows_unchanged=unchanged_count)
+                
+        logger.info(f"Успешно сохранено {saved_count} из {len(data_list)} записей: "
+                    f"новых {inserted_count}, измененных {changed_count}, без изменений {unchanged_count}")
+        return saved_count
+        
+    def count_ads(self, ad_account_id: str) -> int:
+        """
+        Возвращает количество различных объявлений, сохраненных для аккаунта
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта
+            
+        Returns:
+            Количество объявлений (0 если данных нет или произошла ошибка)
+        """
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
+        select_sql = f"SELECT COUNT(DISTINCT ad_id) FROM ad_spend WHERE ad_account_id = {placeholder}"
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(select_sql, (ad_account_id,))
+                row = cursor.fetchone()
+                return int(row[0] or 0) if row else 0
+                
+        except Exception as e:
+            logger.error(f"Ошибка при подсчете объявлений аккаунта {ad_account_id}: {e}")
+            return 0
+            
+    def upsert_ad_accounts(self, accounts: List[Dict[str, Any]], refreshed_at: float,
+                           remove_missing: bool = False) -> int:
+        """
+        Сохраняет метаданные рекламных аккаунтов в реестр
+        
+        Args:
+            accounts: Список аккаунтов (ad_account_id, name, currency, timezone_name, account_status)
+            refreshed_at: Время обновления (Unix time)
+            remove_missing: accounts - полный список аккаунтов токена: аккаунты,
+                которых в нем нет (доступ к ним потерян), удаляются из реестра
+            
+        Returns:
+            Количество сохраненных аккаунтов
+        """
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
+        placeholders = ", ".join([placeholder] * 6)
+        upsert_sql = f"""
+        INSERT INTO ad_accounts
+        (ad_account_id, name, currency, timezone_name, account_status, refreshed_at)
+        VALUES ({placeholders})
+        ON CONFLICT (ad_account_id) DO UPDATE SET
+            name = EXCLUDED.name,
+            currency = EXCLUDED.currency,
+            timezone_name = EXCLUDED.timezone_name,
+            account_status = EXCLUDED.account_status,
+            refreshed_at = EXCLUDED.refreshed_at
+        """
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(upsert_sql, [(
+                    account['ad_account_id'],
+                    account.get('name'),
+                    account.get('currency'),
+                    account.get('timezone_name'),
+                    account.get('account_status'),
+                    refreshed_at
+                ) for account in accounts])
+                
+                if remove_missing:
+                    # Все полученные аккаунты только что получили refreshed_at, иначе
+                    # устаревшая запись недоступного аккаунта вызывала бы полное
+                    # обновление реестра из API при каждом запуске
+                    cursor.execute(f"DELETE FROM ad_accounts WHERE refreshed_at < {placeholder}", (refreshed_at,))
+                    if cursor.rowcount:
+                        logger.info(f"Из реестра удалено {cursor.rowcount} недоступных рекламных аккаунтов")
+                return len(accounts)
+                
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении реестра рекламных аккаунтов: {e}")
+            return 0
+            
+    def get_ad_accounts(self) -> List[Dict[str, Any]]:
+        """
+        Получает реестр рекламных аккаунтов
+        
+        Returns:
+            Список аккаунтов с метаданными и временем обновления
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT * FROM ad_accounts")
+                
+                if self.db_type == "sqlite":
+                    rows = cursor.fetchall()
+                    return [dict(row) for row in rows]
+                else:
+                    columns = [desc[0] for desc in cursor.description]
+                    rows = cursor.fetchall()
+                    return [dict(zip(columns, row)) for row in rows]
+                    
+        except Exception as e:
+            logger.error(f"Ошибка при получении реестра рекламных аккаунтов: {e}")
+            return []
+            
+    def get_watermarks(self) -> Dict[Tuple[str, str], str]:
+        """
+        Получает отметки инкрементального сбора всех профилей
+        
+        Returns:
+            Словарь {(profile_id, ad_account_id): последняя полностью собранная дата (YYYY-MM-DD)}
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT profile_id, ad_account_id, last_collected_date FROM collection_watermarks")
+                return {(row[0], row[1]): str(row[2]) for row in cursor.fetchall()}
+                
+        except Exception as e:
+            logger.error(f"Ошибка при получении отметок сбора: {e}")
+            return {}
+            
+    def set_watermark(self, profile_id: str, ad_account_id: str, last_collected_date: str) -> bool:
+        """
+        Сохраняет отметку инкрементального сбора аккаунта профиля
+        
+        Отметка не сдвигается назад, если ранее был собран более поздний день.
+        
+        Args:
+            profile_id: ID профиля
+            ad_account_id: ID рекламного аккаунта
+            last_collected_date: Последняя полностью собранная дата (YYYY-MM-DD)
+            
+        Returns:
+            True если отметка сохранена
+        """
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
+        upsert_sql = f"""
+        INSERT INTO collection_watermarks (profile_id, ad_account_id, last_collected_date, last_run_at)
+        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+        ON CONFLICT (profile_id, ad_account_id) DO UPDATE SET
+            last_collected_date = CASE
+                WHEN EXCLUDED.last_collected_date > collection_watermarks.last_collected_date
+                THEN EXCLUDED.last_collected_date
+                ELSE collection_watermarks.last_collected_date
+            END,
+            last_run_at = EXCLUDED.last_run_at
+        """
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(upsert_sql, (profile_id, ad_account_id, last_collected_date, datetime.now()))
+                return True
+                
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении отметки сбора для профиля {profile_id} "
+                         f"и аккаунта {ad_account_id}: {e}")
+            return False
+            
+    def get_finished_backfill_chunks(self) -> set:
+        """
+        Получает завершенные части загрузки исторических данных
+        
+        Returns:
+            Множество кортежей (profile_id, date_start, date_end)
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT profile_id, date_start, date_end FROM backfill_chunks")
+                return {(row[0], str(row[1]), str(row[2])) for row in cursor.fetchall()}
+                
+        except Exception as e:
+            logger.error(f"Ошибка при получении завершенных частей загрузки: {e}")
+            return set()
+            
+    def mark_backfill_chunk(self, profile_id: str, ad_account_id: str,
+                            date_start: str, date_end: str, rows_saved: int) -> bool:
+        """
+        Отмечает часть загрузки исторических данных как завершенную
+        
+        Args:
+            profile_id: ID профиля
+            ad_account_id: ID рекламного аккаунта
+            date_start: Начальная дата части (YYYY-MM-DD)
+            date_end: Конечная дата части (YYYY-MM-DD)
+            rows_saved: Количество сохраненных записей
+            
+        Returns:
+            True если отметка сохранена
+        """
+        placeholders = ", ".join(["?" if self.db_type == "sqlite" else "%s"] * 6)
+        upsert_sql = f"""
+        INSERT INTO backfill_chunks
+        (profile_id, ad_account_id, date_start, date_end, rows_saved, finished_at)
+        VALUES ({placeholders})
+        ON CONFLICT (profile_id, date_start, date_end) DO UPDATE SET
+            rows_saved = EXCLUDED.rows_saved,
+            finished_at = EXCLUDED.finished_at
+        """
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(upsert_sql, (profile_id, ad_account_id, date_start, date_end,
+                                            rows_saved, datetime.now()))
+                return True
+                
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении отметки части {date_start} - {date_end} "
+                         f"для профиля {profile_id}: {e}")
+            return False
+            
+    def record_collection_run(self, run: Dict[str, Any]) -> bool:
+        """
+        Сохраняет результат сбора одного аккаунта в журнал запусков
+        
+        Args:
+            run: Словарь с полями таблицы collection_runs (run_id, profile_id,
+                ad_account_id, status, started_at, finished_at, счетчики)
+            
+        Returns:
+            True если запись сохранена
+        """
+        columns = ['run_id', 'profile_id', 'ad_account_id', 'status', 'started_at', 'finished_at',
+                   'duration_seconds', 'date_start', 'date_end', 'rows_fetched', 'rows_written',
+                   'rows_inserted', 'rows_changed', 'rows_unchanged',
+                   'api_calls', 'api_errors', 'response_bytes', 'error']
+        placeholders = ", ".join(["?" if self.db_type == "sqlite" else "%s"] * len(columns))
+        insert_sql = f"""
+        INSERT INTO collection_runs ({", ".join(columns)})
+        VALUES ({placeholders})
+        ON CONFLICT (run_id, profile_id) DO UPDATE SET
+            {", ".join(f"{column} = EXCLUDED.{column}" for column in columns[2:])}
+        """
+        values = dict.fromkeys(['duration_seconds', 'rows_fetched', 'rows_written', 'rows_inserted',
+                                'rows_changed', 'rows_unchanged', 'api_calls', 'api_errors',
+                                'response_bytes'], 0)
+        values.update(run)
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(insert_sql, tuple(values.get(column) for column in columns))
+                return True
+                
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении журнала запуска {run.get('run_id')} "
+                         f"для профиля {run.get('profile_id')}: {e}")
+            return False
+            
+    def get_collection_runs(self, run_id: Optional[str] = None,
+                            profile_id: Optional[str] = None,
+                            ad_account_id: Optional[str] = None,
+                            status: Optional[str] = None,
+                            since: Optional[str] = None,
+                            until: Optional[str] = None,
+                            limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получает записи журнала запусков сбора с фильтрацией, новые первыми
+        
+        Args:
+            run_id: ID запуска
+            profile_id: ID профиля
+            ad_account_id: ID рекламного аккаунта
+            status: Статус ("success" или "failed")
+            since: Начало запуска не раньше (YYYY-MM-DD или YYYY-MM-DD HH:MM:SS)
+            until: Начало запуска раньше (YYYY-MM-DD или YYYY-MM-DD HH:MM:SS)
+            limit: Максимальное количество записей
+            
+        Returns:
+            Список записей журнала
+        """
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
+        where_conditions = []
+        params = []
+        
+        for column, value in (('run_id', run_id), ('profile_id', profile_id),
+                              ('ad_account_id', ad_account_id), ('status', status)):
+            if value:
+                where_conditions.append(f"{column} = {placeholder}")
+                params.append(value)
+                
+        if since:
+            where_conditions.append(f"started_at >= {placeholder}")
+            params.append(since)
+            
+        if until:
+            where_conditions.append(f"started_at < {placeholder}")
+            params.append(until)
+            
+        where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+        params.append(limit)
+        
+        select_sql = f"""
+        SELECT * FROM collection_runs
+        {where_clause}
+        ORDER BY started_at DESC
+        LIMIT {placeholder}
+        """
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(select_sql, params)
+                
+                if self.db_type == "sqlite":
+                    rows = cursor.fetchall()
+                    return [dict(row) for row in rows]
+                else:
+                    columns = [desc[0] for desc in cursor.description]
+                    rows = cursor.fetchall()
+                    return [dict(zip(columns, row)) for row in rows]
+                    
+        except Exception as e:
+            logger.error(f"Ошибка при получении журнала запусков: {e}")
+            return []
+            
     def get_spend_data(self, profile_id: Optional[str] = None, 
                       ad_account_id: Optional[str] = None,
                       start_date: Optional[str] = None,
@@ -209,22 +878,26 @@ class DatabaseManager:
         """
         where_conditions = []
         params = []
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
         
         if profile_id:
-            where_conditions.append("profile_id = ?")
+            where_conditions.append(f"profile_id = {placeholder}")
             params.append(profile_id)
             
         if ad_account_id:
-            where_conditions.append("ad_account_id = ?")
+            where_conditions.append(f"ad_account_id = {placeholder}")
             params.append(ad_account_id)
             
         if start_date:
-            where_conditions.append("date_start >= ?")
+            where_conditions.append(f"date_start >= {placeholder}")
             params.append(start_date)
             
         if end_date:
-            where_conditions.append("date_end <= ?")
-            params.append(end_date)
+            # date_start <= date_end, поэтому условие по date_start не меняет
+            # результат, но позволяет использовать индексы и секции по date_start
+            where_conditions.append(f"date_start <= {placeholder}")
+            where_conditions.append(f"date_end <= {placeholder}")
+            params.extend([end_date, end_date])
             
         where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
         
@@ -265,14 +938,18 @@ class DatabaseManager:
         """
         where_conditions = []
         params = []
+        placeholder = "?" if self.db_type == "sqlite" else "%s"
         
         if start_date:
-            where_conditions.append("date_start >= ?")
+            where_conditions.append(f"date_start >= {placeholder}")
             params.append(start_date)
             
         if end_date:
-            where_conditions.append("date_end <= ?")
-            params.append(end_date)
+            # date_start <= date_end, поэтому условие по date_start не меняет
+            # результат, но позволяет использовать индексы и секции по date_start
+            where_conditions.append(f"date_start <= {placeholder}")
+            where_conditions.append(f"date_end <= {placeholder}")
+            params.extend([end_date, end_date])
             
         where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
         
@@ -5,29 +5,666 @@
 """
 
 import requests
+import contextvars
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator, Generator, Union
+from urllib.parse import urlencode
+
+from rate_limiter import AdaptiveRateLimiter, THROTTLE_ERROR_CODES
+from response_cache import InsightsCache
+from token_status import TokenStatus, AUTH_ERROR_CODES
+import metrics
 
 logger = logging.getLogger(__name__)
 
+# Размер страницы по умолчанию для запросов с курсорной пагинацией
+DEFAULT_PAGE_SIZE = 500
+
+# Запрашиваемые поля
+AD_ACCOUNT_FIELDS = "account_id,name,account_status,currency,timezone_name"
+ADS_FIELDS = "id,name,status,created_time"
+AD_INSIGHTS_FIELDS = "ad_id,ad_name,spend,impressions,clicks,ctr,cpc,cpm"
+DAILY_INSIGHTS_FIELDS = "ad_id,ad_name,spend,impressions,clicks,date_start,date_stop"
+
+# Статусы асинхронного отчета, означающие его окончательное завершение
+ASYNC_JOB_COMPLETED = "Job Completed"
+ASYNC_JOB_FAILED_STATUSES = ("Job Failed", "Job Skipped")
+
+
+# Максимальное количество запросов в одном batch-запросе Graph API
+MAX_BATCH_SIZE = 50
+
+# Параметры разбиения фильтра по ad.id на части
+DEFAULT_FILTER_CHUNK_SIZE = 200
+DEFAULT_MAX_PARALLEL_CHUNKS = 4
+
+# Количество записей, отдаваемых за раз при потоковом разборе страницы
+DEFAULT_STREAM_BATCH_SIZE = 100
+
+# Максимальное количество записей диапазона, удерживаемых в памяти до записи в кэш
+DEFAULT_CACHE_BUFFER_ROWS = 50000
+
+
+class AsyncReportError(requests.RequestException):
+    """Асинхронный отчет завершился с ошибкой или не успел выполниться"""
+
+
+class BatchRequestError(requests.RequestException):
+    """Ошибка отдельного запроса внутри batch-запроса"""
+    
+    def __init__(self, message: str, code: Optional[int] = None,
+                 error: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.code = code
+        self.error = error or {}
+
+
+def build_insights_params(access_token: str, fields: str, start_date: str, end_date: str,
+                          ad_ids: Optional[List[str]] = None,
+                          time_increment: Optional[str] = None,
+                          limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Формирует параметры запроса к /insights
+    
+    Args:
+        access_token: Facebook Access Token
+        fields: Список полей через запятую
+        start_date: Начальная дата в формате YYYY-MM-DD
+        end_date: Конечная дата в формате YYYY-MM-DD
+        ad_ids: Список ID объявлений для фильтрации
+        time_increment: Разбивка по дням ("1") или None для всего периода
+        limit: Размер страницы
+        
+    Returns:
+        Словарь параметров запроса
+    """
+    params = {
+        "fields": fields,
+        "time_range": json.dumps({
+            "since": start_date,
+            "until": end_date
+        }),
+        "level": "ad",
+        "limit": limit,
+        "access_token": access_token
+    }
+    
+    if time_increment:
+        params["time_increment"] = time_increment
+    
+    # Если указаны конкретные ad_ids, добавляем их в фильтр
+    if ad_ids:
+        params["filtering"] = json.dumps([{
+            "field": "ad.id",
+            "operator": "IN",
+            "value": ad_ids
+        }])
+        
+    return params
+
+
+def is_throttled_response(response: Any) -> bool:
+    """
+    Проверяет, является ли ответ ошибкой превышения лимитов Graph API
+    
+    Args:
+        response: Ответ API (requests.Response или совместимый объект)
+        
+    Returns:
+        True если запрос был отклонен из-за лимитов
+    """
+    if response.status_code == 429:
+        return True
+    if response.status_code < 400:
+        return False
+    try:
+        error = response.json().get('error', {})
+    except ValueError:
+        return False
+    return error.get('code') in THROTTLE_ERROR_CODES
+
+
+def get_auth_error(response: Any) -> Optional[str]:
+    """
+    Проверяет, является ли ответ ошибкой недействительного токена
+    
+    Args:
+        response: Ответ API (requests.Response или совместимый объект)
+        
+    Returns:
+        Сообщение об ошибке авторизации или None
+    """
+    if response.status_code < 400:
+        return None
+    try:
+        error = response.json().get('error', {})
+    except ValueError:
+        return None
+    if error.get('code') in AUTH_ERROR_CODES:
+        return error.get('message', 'OAuthException')
+    return None
+
+
+def parse_batch_item(item: Optional[Dict[str, Any]]) -> Union[Dict[str, Any], BatchRequestError]:
+    """
+    Разбирает ответ на отдельный запрос внутри batch-запроса
+    
+    Args:
+        item: Элемент ответа batch-запроса ({"code": ..., "body": "..."} или None)
+        
+    Returns:
+        Разобранное тело ответа или BatchRequestError
+    """
+    # Graph API возвращает null для запросов, не успевших выполниться
+    if item is None:
+        return BatchRequestError("Запрос внутри batch-запроса не был выполнен")
+    
+    code = item.get('code')
+    try:
+        body = json.loads(item.get('body') or '{}')
+    except ValueError:
+        return BatchRequestError(f"Некорректное тело ответа (код {code})", code=code)
+    
+    if code != 200 or 'error' in body:
+        error = body.get('error', {})
+        return BatchRequestError(error.get('message', f"Код ответа {code}"), code=code, error=error)
+        
+    return body
+
+
 class FacebookAPIClient:
     """Клиент для работы с Facebook Graph API"""
     
-    def __init__(self, access_token: str, api_version: str = "v18.0"):
+    def __init__(self, access_token: str, api_version: str = "v18.0",
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 async_poll_interval: float = 5.0,
+                 async_timeout: float = 3600.0,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 max_retries: int = 3,
+                 filter_chunk_size: int = DEFAULT_FILTER_CHUNK_SIZE,
+                 max_parallel_chunks: int = DEFAULT_MAX_PARALLEL_CHUNKS,
+                 cache: Optional[InsightsCache] = None,
+                 cache_buffer_rows: int = DEFAULT_CACHE_BUFFER_ROWS,
+                 streaming_json: bool = False,
+                 stream_batch_size: int = DEFAULT_STREAM_BATCH_SIZE,
+                 token_status: Optional[TokenStatus] = None,
+                 pool_maxsize: int = 10):
         """
         Инициализация клиента
         
         Args:
             access_token: Facebook Access Token с необходимыми разрешениями
             api_version: Версия Graph API
+            page_size: Количество записей на одной странице ответа (параметр limit)
+            async_poll_interval: Начальный интервал опроса асинхронного отчета (секунды)
+            async_timeout: Максимальное время ожидания асинхронного отчета (секунды)
+            rate_limiter: Ограничитель частоты запросов (общий для всех клиентов с одним токеном)
+            max_retries: Количество повторов запроса при превышении лимитов API
+            filter_chunk_size: Максимальное количество ad_id в одном фильтре insights
+            max_parallel_chunks: Максимальное количество одновременно запрашиваемых частей фильтра
+            cache: Дисковый кэш дневных insights (None - без кэширования)
+            cache_buffer_rows: Диапазоны дней с большим количеством записей не кэшируются,
+                чтобы не удерживать их в памяти до окончания получения
+            streaming_json: Разбирать страницы ответа потоково, не загружая их целиком (требуется ijson)
+            stream_batch_size: Количество записей, отдаваемых за раз при потоковом разборе
+            token_status: Кэш состояния токена, сбрасываемый при ошибке авторизации
+            pool_maxsize: Количество keep-alive соединений с хостом (не меньше числа потоков, использующих клиент)
         """
         self.access_token = access_token
         self.api_version = api_version
         self.base_url = f"https://graph.facebook.com/{api_version}"
+        self.page_size = page_size
+        self.async_poll_interval = async_poll_interval
+        self.async_timeout = async_timeout
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.filter_chunk_size = filter_chunk_size
+        self.max_parallel_chunks = max_parallel_chunks
+        self.cache = cache
+        self.cache_buffer_rows = cache_buffer_rows
+        self.stream_batch_size = stream_batch_size
+        self.token_status = token_status
         self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_maxsize, 10))
+        self.session.mount("https://", adapter)
         
+        self.ijson = None
+        if streaming_json:
+            try:
+                import ijson
+                self.ijson = ijson
+            except ImportError:
+                raise ImportError("Для потокового разбора ответов необходимо установить ijson: pip install ijson")
+        
+        # ID объявлений аккаунтов, для которых был получен полный список
+        self._account_ad_ids: Dict[str, frozenset] = {}
+        
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Выполняет HTTP-запрос к Graph API с учетом лимитов
+        
+        Перед запросом ожидает разрешения ограничителя, после запроса передает
+        ему заголовки использования лимитов. Ответы о превышении лимитов
+        повторяются до max_retries раз после паузы.
+        
+        Args:
+            method: HTTP-метод
+            url: URL запроса
+            **kwargs: Параметры для requests.Session.request
+            
+        Returns:
+            Ответ API (raise_for_status вызывает вызывающая сторона)
+        """
+        endpoint = metrics.endpoint_name(url, method)
+        
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            
+            with metrics.API_REQUEST_DURATION.time(endpoint=endpoint, method=method):
+                response = self.session.request(method, url, **kwargs)
+            metrics.API_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            response_bytes = 0
+            if not kwargs.get('stream'):
+                response_bytes = len(response.content)
+            elif response.headers.get('Content-Length'):
+                response_bytes = int(response.headers['Content-Length'])
+            metrics.API_RESPONSE_BYTES.inc(response_bytes, endpoint=endpoint)
+            metrics.record_collection(api_calls=1, api_errors=int(response.status_code >= 400),
+                                      response_bytes=response_bytes)
+            
+            if self.rate_limiter:
+                self.rate_limiter.update_from_headers(response.headers, url)
+            
+            if self.token_status:
+                auth_error = get_auth_error(response)
+                if auth_error:
+                    self.token_status.mark_invalid(auth_error)
+            
+            if not is_throttled_response(response):
+                return response
+            
+            metrics.API_THROTTLED.inc(endpoint=endpoint)
+            if attempt == self.max_retries:
+                return response
+            
+            metrics.API_RETRIES.inc(endpoint=endpoint)
+            logger.warning(f"Превышен лимит Graph API, повтор {attempt + 1}/{self.max_retries}")
+            if self.rate_limiter:
+                self.rate_limiter.penalize()
+            else:
+                time.sleep(2 ** attempt * self.async_poll_interval)
+                
+        return response
+        
+    def _iter_pages(self, url: str, params: Dict[str, Any],
+                    proxies: Optional[Dict[str, str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично обходит ответ Graph API, следуя курсорам paging.next
+        
+        Args:
+            url: URL первого запроса
+            params: Параметры первого запроса
+            proxies: Конфигурация прокси для requests
+            
+        Yields:
+            Список записей одной страницы (поле data); при потоковом разборе
+            страница отдается частями по stream_batch_size записей
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        next_url = url
+        next_params = params
+        
+        while next_url:
+            if self.ijson:
+                next_url = yield from self._stream_page(next_url, next_params, proxies)
+                next_params = None
+                continue
+            
+            endpoint = metrics.endpoint_name(next_url)
+            response = self._request('GET', next_url, params=next_params, proxies=proxies)
+            response.raise_for_status()
+            
+            with metrics.PARSE_DURATION.time(endpoint=endpoint):
+                data = response.json()
+            page = data.get('data', [])
+            metrics.PAGES_FETCHED.inc(endpoint=endpoint)
+            metrics.ROWS_FETCHED.inc(len(page), endpoint=endpoint)
+            if page:
+                yield page
+            
+            # Ссылка paging.next уже содержит все параметры запроса и курсор after
+            next_url = data.get('paging', {}).get('next')
+            next_params = None
+            
+    def _stream_page(self, url: str, params: Optional[Dict[str, Any]],
+                     proxies: Optional[Dict[str, str]] = None) -> Generator[List[Dict[str, Any]], None, Optional[str]]:
+        """
+        Запрашивает одну страницу и разбирает ее по мере чтения из сокета
+        
+        Записи поля data отдаются частями по stream_batch_size, так что
+        страница целиком не хранится в памяти ни в виде текста, ни в виде объектов.
+        
+        Args:
+            url: URL запроса
+            params: Параметры запроса
+            proxies: Конфигурация прокси для requests
+            
+        Yields:
+            Части записей страницы (поле data)
+            
+        Returns:
+            Ссылка paging.next или None для последней страницы
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        endpoint = metrics.endpoint_name(url)
+        response = self._request('GET', url, params=params, proxies=proxies, stream=True)
+        try:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            metrics.PAGES_FETCHED.inc(endpoint=endpoint)
+            
+            next_url = None
+            batch = []
+            builder = None
+            started = time.perf_counter()
+            # Время разбора включает чтение из сокета: при потоковом разборе они неразделимы
+            for prefix, event, value in self.ijson.parse(response.raw, use_float=True):
+                if prefix == 'data.item' and event == 'start_map':
+                    builder = self.ijson.ObjectBuilder()
+                
+                if builder is not None:
+                    builder.event(event, value)
+                    if prefix == 'data.item' and event == 'end_map':
+                        batch.append(builder.value)
+                        builder = None
+                        if len(batch) >= self.stream_batch_size:
+                            metrics.ROWS_FETCHED.inc(len(batch), endpoint=endpoint)
+                            yield batch
+                            batch = []
+                elif prefix == 'paging.next':
+                    next_url = value
+            
+            metrics.PARSE_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+            metrics.ROWS_FETCHED.inc(len(batch), endpoint=endpoint)
+            if batch:
+                yield batch
+            return next_url
+        finally:
+            response.close()
+            
+    def _iter_async_report(self, ad_account_id: str, params: Dict[str, Any],
+                           proxies: Optional[Dict[str, str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Запускает асинхронный отчет insights, дожидается его готовности
+        и постранично отдает результат
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            params: Параметры запроса к /insights
+            proxies: Конфигурация прокси для requests
+            
+        Yields:
+            Страницы записей отчета
+            
+        Raises:
+            AsyncReportError: Если отчет завершился с ошибкой или превышено время ожидания
+            requests.RequestException: При ошибке запроса к API
+        """
+        # 1. Создаем задание на построение отчета
+        url = f"{self.base_url}/act_{ad_account_id}/insights"
+        job_params = {key: value for key, value in params.items() if key != "limit"}
+        
+        response = self._request('POST', url, data=job_params, proxies=proxies)
+        response.raise_for_status()
+        
+        report_run_id = response.json().get('report_run_id')
+        if not report_run_id:
+            raise AsyncReportError(f"API не вернул report_run_id для аккаунта {ad_account_id}")
+        
+        logger.info(f"Запущен асинхронный отчет {report_run_id} для аккаунта {ad_account_id}")
+        
+        # 2. Опрашиваем статус задания с экспоненциальной задержкой
+        status_url = f"{self.base_url}/{report_run_id}"
+        status_params = {
+            "fields": "async_status,async_percent_completion",
+            "access_token": self.access_token
+        }
+        delay = self.async_poll_interval
+        deadline = time.monotonic() + self.async_timeout
+        
+        while True:
+            response = self._request('GET', status_url, params=status_params, proxies=proxies)
+            response.raise_for_status()
+            
+            job = response.json()
+            status = job.get('async_status')
+            if status == ASYNC_JOB_COMPLETED:
+                break
+            if status in ASYNC_JOB_FAILED_STATUSES:
+                raise AsyncReportError(f"Асинхронный отчет {report_run_id} завершился со статусом '{status}'")
+            if time.monotonic() + delay > deadline:
+                raise AsyncReportError(f"Асинхронный отчет {report_run_id} не завершился за {self.async_timeout} секунд")
+            
+            logger.debug(f"Отчет {report_run_id}: {status}, {job.get('async_percent_completion', 0)}%")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+        
+        # 3. Постранично читаем результат
+        result_params = {
+            "limit": params.get("limit", self.page_size),
+            "access_token": self.access_token
+        }
+        yield from self._iter_pages(f"{status_url}/insights", result_params, proxies=proxies)
+        
+    def _effective_ad_ids(self, ad_account_id: str,
+                          ad_ids: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        Убирает дубликаты из фильтра по ad.id и отбрасывает фильтр,
+        если он охватывает все объявления аккаунта
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            ad_ids: Список ID объявлений
+            
+        Returns:
+            Список ID объявлений для фильтра или None
+        """
+        if not ad_ids:
+            return None
+        
+        ad_ids = list(dict.fromkeys(ad_ids))
+        account_ad_ids = self._account_ad_ids.get(ad_account_id)
+        if account_ad_ids is not None and account_ad_ids.issubset(ad_ids):
+            logger.debug(f"Фильтр по ad.id охватывает весь аккаунт {ad_account_id}, пропускаем его")
+            return None
+        return ad_ids
+        
+    def _iter_insights(self, ad_account_id: str, fields: str, start_date: str, end_date: str,
+                       ad_ids: Optional[List[str]] = None,
+                       proxies: Optional[Dict[str, str]] = None,
+                       time_increment: Optional[str] = None,
+                       page_size: Optional[int] = None,
+                       use_async: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает insights, разбивая фильтр по ad.id на части
+        
+        Если фильтр охватывает все объявления аккаунта, он не передается.
+        Иначе список ad_id делится на части по filter_chunk_size, которые
+        запрашиваются параллельно (не более max_parallel_chunks одновременно),
+        а страницы результатов отдаются по мере готовности частей.
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            fields: Список полей через запятую
+            start_date: Начальная дата в формате YYYY-MM-DD
+            end_date: Конечная дата в формате YYYY-MM-DD
+            ad_ids: Список ID объявлений (если None, получает данные по всем объявлениям)
+            proxies: Конфигурация прокси для requests
+            time_increment: Разбивка по дням ("1") или None для всего периода
+            page_size: Размер страницы (по умолчанию self.page_size)
+            use_async: Получать данные через асинхронный отчет
+            
+        Yields:
+            Страницы записей insights
+        """
+        ad_ids = self._effective_ad_ids(ad_account_id, ad_ids)
+        
+        def fetch(chunk: Optional[List[str]]) -> Iterator[List[Dict[str, Any]]]:
+            params = build_insights_params(self.access_token, fields, start_date, end_date,
+                                           ad_ids=chunk, time_increment=time_increment,
+                                           limit=page_size or self.page_size)
+            if use_async:
+                return self._iter_async_report(ad_account_id, params, proxies=proxies)
+            return self._iter_pages(f"{self.base_url}/act_{ad_account_id}/insights", params, proxies=proxies)
+        
+        if not ad_ids or len(ad_ids) <= self.filter_chunk_size:
+            yield from fetch(ad_ids)
+            return
+        
+        chunks = [ad_ids[i:i + self.filter_chunk_size] for i in range(0, len(ad_ids), self.filter_chunk_size)]
+        logger.info(f"Фильтр по {len(ad_ids)} объявлениям разбит на {len(chunks)} частей")
+        
+        # Скользящее окно: одновременно выполняется не более max_parallel_chunks частей,
+        # так что в памяти находятся результаты только этих частей
+        with ThreadPoolExecutor(max_workers=self.max_parallel_chunks) as executor:
+            pending = set()
+            remaining = iter(chunks)
+            
+            for chunk in remaining:
+                pending.add(executor.submit(contextvars.copy_context().run, lambda c: list(fetch(c)), chunk))
+                if len(pending) >= self.max_parallel_chunks:
+                    break
+            
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+                        next_chunk = next(remaining, None)
+                        if next_chunk is not None:
+                            pending.add(executor.submit(contextvars.copy_context().run,
+                                                        lambda c: list(fetch(c)), next_chunk))
+            finally:
+                # При ошибке или досрочной остановке не запускаем оставшиеся части
+                for future in pending:
+                    future.cancel()
+        
+    def _iter_cached_daily_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                                    ad_ids: Optional[List[str]] = None,
+                                    proxies: Optional[Dict[str, str]] = None,
+                                    page_size: Optional[int] = None,
+                                    use_async: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает ежедневные insights с использованием кэша
+        
+        Дни, найденные в кэше, отдаются из него. Подряд идущие дни без записи
+        в кэше запрашиваются одним диапазоном; страницы отдаются по мере
+        получения, а записи каждого дня (в том числе пустые) сохраняются в кэш
+        после получения всего диапазона. Порядок записей по дням API не
+        гарантирует (особенно при параллельных частях фильтра), поэтому до
+        этого момента записи удерживаются в памяти, но не более
+        cache_buffer_rows: диапазон большего объема не кэшируется.
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            start_date: Начальная дата в формате YYYY-MM-DD
+            end_date: Конечная дата в формате YYYY-MM-DD
+            ad_ids: Список ID объявлений (если None, получает данные по всем объявлениям)
+            proxies: Конфигурация прокси для requests
+            page_size: Размер страницы (по умолчанию self.page_size)
+            use_async: Получать данные через асинхронный отчет
+            
+        Yields:
+            Страницы ежедневных записей insights
+        """
+        first_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+        last_day = datetime.strptime(end_date, '%Y-%m-%d').date()
+        days = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d')
+                for i in range((last_day - first_day).days + 1)]
+        
+        def key(day: str) -> str:
+            return self.cache.make_key(ad_account_id, "ad", DAILY_INSIGHTS_FIELDS, day, ad_ids)
+        
+        def fetch(missing: List[str]) -> Iterator[List[Dict[str, Any]]]:
+            rows_by_day: Optional[Dict[str, List[Dict[str, Any]]]] = {day: [] for day in missing}
+            buffered = 0
+            for page in self._iter_insights(
+                ad_account_id, DAILY_INSIGHTS_FIELDS, missing[0], missing[-1],
+                ad_ids=ad_ids, proxies=proxies, time_increment="1",
+                page_size=page_size, use_async=use_async
+            ):
+                if rows_by_day is not None:
+                    buffered += len(page)
+                    if buffered > self.cache_buffer_rows:
+                        logger.info(f"Аккаунт {ad_account_id}: диапазон {missing[0]} - {missing[-1]} "
+                                    f"не кэшируется (более {self.cache_buffer_rows} записей)")
+                        rows_by_day = None
+                    else:
+                        for row in page:
+                            rows_by_day.setdefault(row.get('date_start', missing[0]), []).append(row)
+                yield page
+            
+            if rows_by_day is None:
+                return
+            
+            # В кэш попадает только полностью полученный диапазон
+            for day, rows in rows_by_day.items():
+                self.cache.put(key(day), ad_account_id, day, rows)
+        
+        missing: List[str] = []
+        for day in days:
+            rows = self.cache.get(key(day))
+            if rows is None:
+                missing.append(day)
+                continue
+            
+            if missing:
+                yield from fetch(missing)
+                missing = []
+            if rows:
+                yield rows
+        
+        if missing:
+            yield from fetch(missing)
+        
+    def iter_ad_accounts(self, user_id: str = "me",
+                         page_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает рекламные аккаунты пользователя
+        
+        Args:
+            user_id: ID пользователя (по умолчанию "me")
+            page_size: Размер страницы (по умолчанию self.page_size)
+            
+        Yields:
+            Страницы рекламных аккаунтов
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        url = f"{self.base_url}/{user_id}/adaccounts"
+        params = {
+            "fields": AD_ACCOUNT_FIELDS,
+            "limit": page_size or self.page_size,
+            "access_token": self.access_token
+        }
+        
+        try:
+            yield from self._iter_pages(url, params)
+            
+        except requests.RequestException as e:
+            logger.error(f"Ошибка при получении рекламных аккаунтов: {e}")
+            raise
+            
     def get_ad_accounts(self, user_id: str = "me") -> List[Dict[str, Any]]:
         """
         Получает список рекламных аккаунтов пользователя
@@ -41,57 +678,134 @@ class FacebookAPIClient:
         Raises:
             requests.RequestException: При ошибке запроса к API
         """
-        url = f"{self.base_url}/{user_id}/adaccounts"
+        accounts = []
+        for page in self.iter_ad_accounts(user_id):
+            accounts.extend(page)
+            
+        logger.info(f"Получено {len(accounts)} рекламных аккаунтов")
+        return accounts
+        
+    def iter_ads(self, ad_account_id: str,
+                 page_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает объявления рекламного аккаунта
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            page_size: Размер страницы (по умолчанию self.page_size)
+            
+        Yields:
+            Страницы объявлений с их ID и названиями
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        url = f"{self.base_url}/act_{ad_account_id}/ads"
         params = {
-            "fields": "id,name,account_status,currency",
+            "fields": ADS_FIELDS,
+            "limit": page_size or self.page_size,
             "access_token": self.access_token
         }
         
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            accounts = data.get('data', [])
-            logger.info(f"Получено {len(accounts)} рекламных аккаунтов")
-            return accounts
+            yield from self._iter_pages(url, params)
             
         except requests.RequestException as e:
-            logger.error(f"Ошибка при получении рекламных аккаунтов: {e}")
+            logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {e}")
             raise
             
-    def get_ads(self, ad_account_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    def count_ads(self, ad_account_id: str, proxy_config: Optional[Dict[str, str]] = None) -> int:
         """
-        Получает список объявлений для указанного рекламного аккаунта
+        Получает количество объявлений аккаунта одним запросом (summary=total_count)
         
         Args:
             ad_account_id: ID рекламного аккаунта (без префикса "act_")
-            limit: Максимальное количество объявлений для получения
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
             
         Returns:
-            Список объявлений с их ID и названиями
+            Количество объявлений (без архивных и удаленных)
             
         Raises:
             requests.RequestException: При ошибке запроса к API
         """
         url = f"{self.base_url}/act_{ad_account_id}/ads"
         params = {
-            "fields": "id,name,status,created_time",
-            "limit": limit,
+            "fields": "id",
+            "limit": 1,
+            "summary": "total_count",
             "access_token": self.access_token
         }
         
         try:
-            response = self.session.get(url, params=params)
+            response = self._request('GET', url, params=params, proxies=proxy_config)
             response.raise_for_status()
+            return int(response.json().get('summary', {}).get('total_count', 0))
             
-            data = response.json()
-            ads = data.get('data', [])
-            logger.info(f"Получено {len(ads)} объявлений для аккаунта {ad_account_id}")
-            return ads
+        except requests.RequestException as e:
+            logger.error(f"Ошибка при получении количества объявлений для аккаунта {ad_account_id}: {e}")
+            raise
+            
+    def get_ads(self, ad_account_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получает список объявлений для указанного рекламного аккаунта
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            limit: Максимальное количество объявлений для получения
+            
+        Returns:
+            Список объявлений с их ID и названиями
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        ads = []
+        
+        for page in self.iter_ads(ad_account_id, page_size=min(limit, self.page_size)):
+            ads.extend(page[:limit - len(ads)])
+            if len(ads) >= limit:
+                break
+        else:
+            # Получен полный список объявлений аккаунта
+            self._account_ad_ids[ad_account_id] = frozenset(ad['id'] for ad in ads)
+                
+        logger.info(f"Получено {len(ads)} объявлений для аккаунта {ad_account_id}")
+        return ads
+        
+    def iter_ad_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                         ad_ids: Optional[List[str]] = None,
+                         proxy_config: Optional[Dict[str, str]] = None,
+                         page_size: Optional[int] = None,
+                         use_async: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает данные о расходах на рекламу за указанный период
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            start_date: Начальная дата в формате YYYY-MM-DD
+            end_date: Конечная дата в формате YYYY-MM-DD
+            ad_ids: Список ID объявлений (если None, получает данные по всем объявлениям)
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            page_size: Размер страницы (по умолчанию self.page_size)
+            use_async: Получать данные через асинхронный отчет (для больших периодов)
+            
+        Yields:
+            Страницы данных о расходах
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        try:
+            # Используем прокси, если он предоставлен
+            proxies = proxy_config if proxy_config else None
+            yield from self._iter_insights(
+                ad_account_id, AD_INSIGHTS_FIELDS,
+                start_date, end_date, ad_ids=ad_ids, proxies=proxies,
+                page_size=page_size, use_async=use_async
+            )
             
         except requests.RequestException as e:
-            logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {e}")
+            logger.error(f"Ошибка при получении данных о расходах для аккаунта {ad_account_id}: {e}")
             raise
             
     def get_ad_insights(self, ad_account_id: str, start_date: str, end_date: str, 
@@ -113,40 +827,56 @@ class FacebookAPIClient:
         Raises:
             requests.RequestException: При ошибке запроса к API
         """
-        url = f"{self.base_url}/act_{ad_account_id}/insights"
-        
-        params = {
-            "fields": "ad_id,ad_name,spend,impressions,clicks,ctr,cpc,cpm",
-            "time_range": json.dumps({
-                "since": start_date,
-                "until": end_date
-            }),
-            "level": "ad",
-            "access_token": self.access_token
-        }
+        insights = []
+        for page in self.iter_ad_insights(ad_account_id, start_date, end_date,
+                                          ad_ids=ad_ids, proxy_config=proxy_config):
+            insights.extend(page)
+            
+        logger.info(f"Получено {len(insights)} записей о расходах для аккаунта {ad_account_id}")
+        return insights
         
-        # Если указаны конкретные ad_ids, добавляем их в фильтр
-        if ad_ids:
-            params["filtering"] = json.dumps([{
-                "field": "ad.id",
-                "operator": "IN",
-                "value": ad_ids
-            }])
+    def iter_daily_insights(self, ad_account_id: str, start_date: str, end_date: str,
+                            ad_ids: Optional[List[str]] = None,
+                            proxy_config: Optional[Dict[str, str]] = None,
+                            page_size: Optional[int] = None,
+                            use_async: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично получает ежедневные данные о расходах на рекламу
         
+        Args:
+            ad_account_id: ID рекламного аккаунта (без префикса "act_")
+            start_date: Начальная дата в формате YYYY-MM-DD
+            end_date: Конечная дата в формате YYYY-MM-DD
+            ad_ids: Список ID объявлений (если None, получает данные по всем объявлениям)
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            page_size: Размер страницы (по умолчанию self.page_size)
+            use_async: Получать данные через асинхронный отчет (для больших периодов)
+            
+        Yields:
+            Страницы ежедневных данных о расходах
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
         try:
             # Используем прокси, если он предоставлен
             proxies = proxy_config if proxy_config else None
+            if self.cache:
+                yield from self._iter_cached_daily_insights(
+                    ad_account_id, start_date, end_date, ad_ids=ad_ids, proxies=proxies,
+                    page_size=page_size, use_async=use_async
+                )
+                return
             
-            response = self.session.get(url, params=params, proxies=proxies)
-            response.raise_for_status()
-            
-            data = response.json()
-            insights = data.get('data', [])
-            logger.info(f"Получено {len(insights)} записей о расходах для аккаунта {ad_account_id}")
-            return insights
+            yield from self._iter_insights(
+                ad_account_id, DAILY_INSIGHTS_FIELDS,
+                start_date, end_date, ad_ids=ad_ids, proxies=proxies,
+                time_increment="1",  # Ежедневная разбивка
+                page_size=page_size, use_async=use_async
+            )
             
         except requests.RequestException as e:
-            logger.error(f"Ошибка при получении данных о расходах для аккаунта {ad_account_id}: {e}")
+            logger.error(f"Ошибка при получении ежедневных данных для аккаунта {ad_account_id}: {e}")
             raise
             
     def get_daily_insights(self, ad_account_id: str, start_date: str, end_date: str,
@@ -168,41 +898,134 @@ class FacebookAPIClient:
         Raises:
             requests.RequestException: При ошибке запроса к API
         """
-        url = f"{self.base_url}/act_{ad_account_id}/insights"
+        insights = []
+        for page in self.iter_daily_insights(ad_account_id, start_date, end_date,
+                                             ad_ids=ad_ids, proxy_config=proxy_config):
+            insights.extend(page)
+            
+        logger.info(f"Получено {len(insights)} ежедневных записей для аккаунта {ad_account_id}")
+        return insights
+            
+    def execute_batch(self, batch_requests: List[Dict[str, Any]]) -> List[Union[Dict[str, Any], BatchRequestError]]:
+        """
+        Выполняет независимые запросы к Graph API пачками через batch-запрос
+        
+        Запросы разбиваются на пачки по MAX_BATCH_SIZE, каждая пачка
+        отправляется одним POST-запросом. Ответы возвращаются в том же
+        порядке, что и запросы.
         
+        Args:
+            batch_requests: Список запросов вида {"method": "GET", "relative_url": "..."}
+            
+        Returns:
+            Для каждого запроса - разобранное тело ответа или BatchRequestError
+            
+        Raises:
+            requests.RequestException: При ошибке самого batch-запроса
+        """
+        results = []
+        batch_count = 0
+        
+        for offset in range(0, len(batch_requests), MAX_BATCH_SIZE):
+            chunk = batch_requests[offset:offset + MAX_BATCH_SIZE]
+            
+            try:
+                response = self._request('POST', self.base_url + "/", data={
+                    "batch": json.dumps(chunk),
+                    "include_headers": "false",
+                    "access_token": self.access_token
+                })
+                response.raise_for_status()
+                
+            except requests.RequestException as e:
+                logger.error(f"Ошибка при выполнении batch-запроса: {e}")
+                raise
+            
+            batch_count += 1
+            for item in response.json():
+                results.append(parse_batch_item(item))
+        
+        logger.info(f"Выполнено {len(batch_requests)} запросов в {batch_count} batch-запросах")
+        return results
+        
+    def get_ads_batch(self, ad_account_ids: List[str], limit: int = 100) -> Dict[str, Union[List[Dict[str, Any]], BatchRequestError]]:
+        """
+        Получает объявления для нескольких рекламных аккаунтов через batch-запросы
+        
+        Первая страница объявлений каждого аккаунта запрашивается в общем
+        batch-запросе, последующие страницы (если есть) - по курсору paging.next.
+        
+        Args:
+            ad_account_ids: Список ID рекламных аккаунтов (без префикса "act_")
+            limit: Максимальное количество объявлений на аккаунт
+            
+        Returns:
+            Словарь {ad_account_id: список объявлений или BatchRequestError}
+            
+        Raises:
+            requests.RequestException: При ошибке самого batch-запроса
+        """
+        query = urlencode({
+            "fields": ADS_FIELDS,
+            "limit": min(limit, self.page_size)
+        })
+        batch_requests = [
+            {"method": "GET", "relative_url": f"act_{ad_account_id}/ads?{query}"}
+            for ad_account_id in ad_account_ids
+        ]
+        
+        results = {}
+        for ad_account_id, body in zip(ad_account_ids, self.execute_batch(batch_requests)):
+            if isinstance(body, BatchRequestError):
+                logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {body}")
+                results[ad_account_id] = body
+                continue
+            
+            ads = body.get('data', [])[:limit]
+            next_url = body.get('paging', {}).get('next')
+            complete = not next_url and len(body.get('data', [])) <= limit
+            if next_url and len(ads) < limit:
+                try:
+                    for page in self._iter_pages(next_url, None):
+                        ads.extend(page[:limit - len(ads)])
+                        if len(ads) >= limit:
+                            break
+                    else:
+                        complete = True
+                except requests.RequestException as e:
+                    logger.error(f"Ошибка при получении объявлений для аккаунта {ad_account_id}: {e}")
+                    results[ad_account_id] = BatchRequestError(str(e))
+                    continue
+            
+            if complete:
+                self._account_ad_ids[ad_account_id] = frozenset(ad['id'] for ad in ads)
+            results[ad_account_id] = ads
+            
+        return results
+        
+    def debug_token(self) -> Dict[str, Any]:
+        """
+        Получает сведения о токене одним запросом /debug_token
+        
+        Returns:
+            Поле data ответа (is_valid, expires_at, scopes и др.)
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+        """
+        url = f"{self.base_url}/debug_token"
         params = {
-            "fields": "ad_id,ad_name,spend,impressions,clicks,date_start,date_stop",
-            "time_range": json.dumps({
-                "since": start_date,
-                "until": end_date
-            }),
-            "time_increment": "1",  # Ежедневная разбивка
-            "level": "ad",
+            "input_token": self.access_token,
             "access_token": self.access_token
         }
         
-        # Если указаны конкретные ad_ids, добавляем их в фильтр
-        if ad_ids:
-            params["filtering"] = json.dumps([{
-                "field": "ad.id",
-                "operator": "IN",
-                "value": ad_ids
-            }])
-        
         try:
-            # Используем прокси, если он предоставлен
-            proxies = proxy_config if proxy_config else None
-            
-            response = self.session.get(url, params=params, proxies=proxies)
+            response = self._request('GET', url, params=params)
             response.raise_for_status()
-            
-            data = response.json()
-            insights = data.get('data', [])
-            logger.info(f"Получено {len(insights)} ежедневных записей для аккаунта {ad_account_id}")
-            return insights
+            return response.json().get('data', {})
             
         except requests.RequestException as e:
-            logger.error(f"Ошибка при получении ежедневных данных для аккаунта {ad_account_id}: {e}")
+            logger.error(f"Ошибка при проверке токена Facebook: {e}")
             raise
             
     def test_connection(self) -> bool:
@@ -222,7 +1045,7 @@ class FacebookAPIClient:
         }
         
         try:
-            response = self.session.get(url, params=params)
+            response = self._request('GET', url, params=params)
             response.raise_for_status()
             
             data = response.json()
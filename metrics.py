@@ -0,0 +1,289 @@
+# metrics.py
+"""
+Модуль метрик производительности сбора данных
+Счетчики, гистограммы и показатели хранятся в памяти процесса
+и отдаются в текстовом формате Prometheus (см. /metrics в web_app.py)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple, Iterator, Optional
+
+# Границы гистограмм длительности по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Формирует строку меток вида {name="value",...}"""
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Форматирует число для текстового формата Prometheus"""
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Базовый класс метрики с метками"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Возвращает метрику в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно возрастающий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Увеличивает счетчик"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Показатель, хранящий последнее значение"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        """Устанавливает значение"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Гистограмма распределения значений (как правило, длительностей)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # {метки: [счетчики по границам, сумма, количество]}
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        """Добавляет наблюдение"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Контекстный менеджер, измеряющий длительность блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    """Добавляет метрику в общий реестр процесса"""
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """
+    Возвращает все метрики процесса в текстовом формате Prometheus
+
+    Returns:
+        Текст для ответа /metrics
+    """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def endpoint_name(url: str, method: str = "GET") -> str:
+    """
+    Приводит URL Graph API к имени endpoint без ID объектов
+
+    Args:
+        url: URL запроса (в том числе ссылка paging.next)
+        method: HTTP-метод
+
+    Returns:
+        Имя endpoint, например "insights", "adaccounts", "object", "batch"
+    """
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    segments = [segment for segment in path.split("/")[2:] if segment]
+    if not segments:
+        return "batch" if method == "POST" else "root"
+    last = segments[-1]
+    if last.isdigit() or last.startswith("act_"):
+        return "object"
+    return last
+
+
+class CollectionStats:
+    """Счетчики сбора одного аккаунта в рамках запуска (см. collection_stats)"""
+
+    FIELDS = ('api_calls', 'api_errors', 'response_bytes', 'rows_fetched', 'rows_written',
+              'rows_inserted', 'rows_changed', 'rows_unchanged')
+
+    def __init__(self):
+        self.api_calls = 0
+        self.api_errors = 0
+        self.response_bytes = 0
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.rows_inserted = 0
+        self.rows_changed = 0
+        self.rows_unchanged = 0
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        """Увеличивает счетчики на указанные величины"""
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def to_dict(self) -> Dict[str, int]:
+        """Возвращает значения счетчиков"""
+        with self._lock:
+            return {name: getattr(self, name) for name in self.FIELDS}
+
+
+# Счетчики текущего аккаунта; потоки конвейера и частей фильтра
+# запускаются в копии контекста и пишут в тот же объект
+_current_stats: ContextVar[Optional[CollectionStats]] = ContextVar('collection_stats', default=None)
+
+
+@contextmanager
+def collection_stats() -> Iterator[CollectionStats]:
+    """
+    Контекстный менеджер, собирающий счетчики сбора одного аккаунта
+
+    Yields:
+        Экземпляр CollectionStats, в который пишут record_collection и record_collection_error
+    """
+    stats = CollectionStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def record_collection(**amounts):
+    """Добавляет значения к счетчикам текущего аккаунта (если они собираются)"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(**amounts)
+
+
+def record_collection_error(error: str):
+    """Запоминает ошибку сбора текущего аккаунта (если счетчики собираются)"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.error = error
+
+
+# Graph API
+API_REQUEST_DURATION = _register(Histogram(
+    "fb_api_request_duration_seconds", "Graph API request latency", ("endpoint", "method")))
+API_REQUESTS = _register(Counter(
+    "fb_api_requests_total", "Graph API requests by endpoint and HTTP status", ("endpoint", "status")))
+API_RETRIES = _register(Counter(
+    "fb_api_retries_total", "Graph API requests retried after throttling", ("endpoint",)))
+API_THROTTLED = _register(Counter(
+    "fb_api_throttled_total", "Graph API responses rejected due to rate limits", ("endpoint",)))
+API_RESPONSE_BYTES = _register(Counter(
+    "fb_api_response_bytes_total", "Graph API response body bytes", ("endpoint",)))
+PAGES_FETCHED = _register(Counter(
+    "fb_pages_fetched_total", "Paginated response pages fetched", ("endpoint",)))
+ROWS_FETCHED = _register(Counter(
+    "fb_rows_fetched_total", "Rows fetched from paginated responses", ("endpoint",)))
+PARSE_DURATION = _register(Histogram(
+    "fb_parse_duration_seconds", "Time spent parsing response pages", ("endpoint",)))
+
+# База данных
+DB_WRITE_DURATION = _register(Histogram(
+    "db_write_duration_seconds", "Duration of spend data batch writes", ("db_type",)))
+DB_ROWS_WRITTEN = _register(Counter(
+    "db_rows_written_total", "Spend data rows written", ("db_type",)))
+DB_ROWS_UNCHANGED = _register(Counter(
+    "db_rows_unchanged_total", "Spend data rows skipped because their content did not change", ("db_type",)))
+DB_WRITE_ROWS_PER_SECOND = _register(Gauge(
+    "db_write_rows_per_second", "Throughput of the last spend data batch write", ("db_type",)))
+
+# Оркестратор
+RUN_DURATION = _register(Histogram(
+    "collection_run_duration_seconds", "Duration of collection runs"))
+PHASE_DURATION = _register(Histogram(
+    "collection_phase_duration_seconds", "Duration of collection run phases", ("phase",)))
+PROFILES_PROCESSED = _register(Counter(
+    "collection_profiles_total", "Profiles processed by result", ("result",)))
+LAST_RUN_TIMESTAMP = _register(Gauge(
+    "collection_last_run_timestamp_seconds", "Unix time of the last finished collection run"))
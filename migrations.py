@@ -0,0 +1,348 @@
+# migrations.py
+"""
+Модуль версионных миграций схемы базы данных
+Единый источник схемы для SQLite и PostgreSQL: миграции применяются по порядку
+при создании DatabaseManager, примененные версии хранятся в schema_migrations
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, List, Set, Tuple
+
+import partitioning
+
+logger = logging.getLogger(__name__)
+
+# Ключ блокировки pg_advisory_xact_lock, чтобы несколько процессов
+# (веб-приложение, планировщик) не применяли миграции одновременно
+PG_MIGRATION_LOCK_KEY = 7281946301
+
+
+def _columns(cursor, db_type: str, table: str) -> Set[str]:
+    """Возвращает имена колонок таблицы"""
+    if db_type == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s",
+        (table,)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _add_column(cursor, db_type: str, table: str, column: str, definition: str):
+    """Добавляет колонку, если ее еще нет"""
+    if column not in _columns(cursor, db_type, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _v1_baseline(cursor, db_type: str):
+    """Таблицы профилей, расходов, реестра аккаунтов, отметок сбора, загрузки и журнала запусков"""
+    if db_type == "sqlite":
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id TEXT UNIQUE NOT NULL,
+            ad_account_id TEXT NOT NULL,
+            currency TEXT DEFAULT 'USD',
+            proxy_url TEXT,
+            ad_ids TEXT,
+            collection_mode TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ad_spend (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id TEXT NOT NULL,
+            ad_account_id TEXT NOT NULL,
+            ad_id TEXT NOT NULL,
+            ad_name TEXT,
+            date_start DATE NOT NULL,
+            date_end DATE NOT NULL,
+            spend REAL NOT NULL DEFAULT 0,
+            currency TEXT DEFAULT 'USD',
+            impressions INTEGER DEFAULT 0,
+            clicks INTEGER DEFAULT 0,
+            ctr REAL DEFAULT 0,
+            cpc REAL DEFAULT 0,
+            cpm REAL DEFAULT 0,
+            content_hash TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(profile_id, ad_account_id, ad_id, date_start, date_end)
+        )
+        """)
+    else:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS profiles (
+            id SERIAL PRIMARY KEY,
+            profile_id VARCHAR(255) UNIQUE NOT NULL,
+            ad_account_id VARCHAR(255) NOT NULL,
+            currency VARCHAR(10) DEFAULT 'USD',
+            proxy_url TEXT,
+            ad_ids TEXT,
+            collection_mode VARCHAR(16),
+            is_active BOOLEAN DEFAULT true,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ad_spend (
+            id SERIAL PRIMARY KEY,
+            profile_id VARCHAR(255) NOT NULL,
+            ad_account_id VARCHAR(255) NOT NULL,
+            ad_id VARCHAR(255) NOT NULL,
+            ad_name TEXT,
+            date_start DATE NOT NULL,
+            date_end DATE NOT NULL,
+            spend DECIMAL(10,2) NOT NULL DEFAULT 0,
+            currency VARCHAR(10) DEFAULT 'USD',
+            impressions INTEGER DEFAULT 0,
+            clicks INTEGER DEFAULT 0,
+            ctr DECIMAL(5,4) DEFAULT 0,
+            cpc DECIMAL(10,2) DEFAULT 0,
+            cpm DECIMAL(10,2) DEFAULT 0,
+            content_hash VARCHAR(16),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(profile_id, ad_account_id, ad_id, date_start, date_end)
+        )
+        """)
+
+    # Реестр рекламных аккаунтов (метаданные из Graph API)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ad_accounts (
+        ad_account_id VARCHAR(255) PRIMARY KEY,
+        name TEXT,
+        currency VARCHAR(10),
+        timezone_name VARCHAR(64),
+        account_status INTEGER,
+        refreshed_at DOUBLE PRECISION NOT NULL
+    )
+    """)
+
+    # Отметки инкрементального сбора по аккаунтам
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS collection_watermarks (
+        ad_account_id VARCHAR(255) PRIMARY KEY,
+        last_collected_date DATE NOT NULL,
+        last_run_at TIMESTAMP NOT NULL
+    )
+    """)
+
+    # Завершенные части загрузки исторических данных (backfill.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS backfill_chunks (
+        profile_id VARCHAR(255) NOT NULL,
+        ad_account_id VARCHAR(255) NOT NULL,
+        date_start DATE NOT NULL,
+        date_end DATE NOT NULL,
+        rows_saved INTEGER NOT NULL DEFAULT 0,
+        finished_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (profile_id, date_start, date_end)
+    )
+    """)
+
+    # Журнал запусков сбора: одна строка на аккаунт в каждом запуске
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS collection_runs (
+        run_id VARCHAR(64) NOT NULL,
+        profile_id VARCHAR(255) NOT NULL,
+        ad_account_id VARCHAR(255) NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP NOT NULL,
+        duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+        date_start DATE,
+        date_end DATE,
+        rows_fetched INTEGER NOT NULL DEFAULT 0,
+        rows_written INTEGER NOT NULL DEFAULT 0,
+        rows_inserted INTEGER NOT NULL DEFAULT 0,
+        rows_changed INTEGER NOT NULL DEFAULT 0,
+        rows_unchanged INTEGER NOT NULL DEFAULT 0,
+        api_calls INTEGER NOT NULL DEFAULT 0,
+        api_errors INTEGER NOT NULL DEFAULT 0,
+        response_bytes BIGINT NOT NULL DEFAULT 0,
+        error TEXT,
+        PRIMARY KEY (run_id, profile_id)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_collection_runs_started_at ON collection_runs(started_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_collection_runs_account ON collection_runs(ad_account_id, started_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_collection_runs_status ON collection_runs(status, started_at)")
+
+
+def _v2_date_stop_to_date_end(cursor, db_type: str):
+    """Таблица ad_spend, созданная прежним init.sql, хранила конечную дату в date_stop"""
+    columns = _columns(cursor, db_type, "ad_spend")
+    if "date_stop" in columns and "date_end" not in columns:
+        cursor.execute("ALTER TABLE ad_spend RENAME COLUMN date_stop TO date_end")
+
+
+def _v3_added_columns(cursor, db_type: str):
+    """Колонки, добавленные после создания таблиц предыдущими версиями"""
+    _add_column(cursor, db_type, "profiles", "collection_mode", "VARCHAR(16)")
+    _add_column(cursor, db_type, "ad_spend", "content_hash", "VARCHAR(16)")
+    for column in ("rows_inserted", "rows_changed", "rows_unchanged"):
+        _add_column(cursor, db_type, "collection_runs", column, "INTEGER NOT NULL DEFAULT 0")
+
+
+def _v4_query_indexes(cursor, db_type: str):
+    """
+    Составные индексы под запросы DatabaseManager
+
+    get_spend_data фильтрует по профилю и/или аккаунту и периоду и сортирует
+    по date_start DESC, ad_account_id, ad_id - индексы отдают строки уже в этом
+    порядке. get_total_spend_by_profile группирует по профилю, аккаунту и
+    валюте - покрывающий индекс позволяет агрегировать без чтения строк таблицы
+    (COUNT(DISTINCT ad_id) и сортировка итогов по сумме расходов по-прежнему
+    выполняются во временных B-деревьях, индекс их не устраняет).
+    Одноколоночные индексы прежнего init.sql - префиксы новых и удаляются.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ad_spend_profile_account_date "
+                   "ON ad_spend (profile_id, ad_account_id, date_start DESC, ad_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ad_spend_account_date "
+                   "ON ad_spend (ad_account_id, date_start DESC, ad_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ad_spend_date "
+                   "ON ad_spend (date_start DESC, ad_account_id, ad_id)")
+
+    if db_type == "sqlite":
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ad_spend_totals "
+                       "ON ad_spend (profile_id, ad_account_id, currency, date_start, date_end, "
+                       "ad_id, spend, impressions, clicks)")
+    else:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ad_spend_totals "
+                       "ON ad_spend (profile_id, ad_account_id, currency) "
+                       "INCLUDE (date_start, date_end, ad_id, spend, impressions, clicks)")
+
+    for index in ("idx_ad_spend_profile_id", "idx_ad_spend_ad_account_id",
+                  "idx_ad_spend_date_start", "idx_ad_spend_date_stop"):
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+def _v5_partition_ad_spend(cursor, db_type: str):
+    """
+    Секционирование ad_spend по месяцам date_start (только PostgreSQL)
+
+    Пустая таблица сразу заменяется секционированной; для непустой создается
+    секционированная копия, а данные переносит python partitioning.py migrate.
+    """
+    if db_type == "postgresql":
+        partitioning.prepare_partitioning(cursor)
+
+
+def _v6_profile_watermarks(cursor, db_type: str):
+    """
+    Отметки инкрементального сбора по профилю и аккаунту
+
+    Строки ad_spend принадлежат профилю, поэтому отметка только по аккаунту
+    не давала собрать историю новому профилю того же аккаунта. Прежняя отметка
+    переносится профилям, у которых есть данные аккаунта, но не дальше
+    последней сохраненной даты профиля.
+    """
+    cursor.execute("ALTER TABLE collection_watermarks RENAME TO collection_watermarks_old")
+    cursor.execute("""
+    CREATE TABLE collection_watermarks (
+        profile_id VARCHAR(255) NOT NULL,
+        ad_account_id VARCHAR(255) NOT NULL,
+        last_collected_date DATE NOT NULL,
+        last_run_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (profile_id, ad_account_id)
+    )
+    """)
+    cursor.execute("""
+    INSERT INTO collection_watermarks (profile_id, ad_account_id, last_collected_date, last_run_at)
+    SELECT s.profile_id, w.ad_account_id,
+           CASE WHEN MAX(s.date_end) < w.last_collected_date THEN MAX(s.date_end)
+                ELSE w.last_collected_date END,
+           w.last_run_at
+    FROM collection_watermarks_old w
+    JOIN ad_spend s ON s.ad_account_id = w.ad_account_id
+    GROUP BY s.profile_id, w.ad_account_id, w.last_collected_date, w.last_run_at
+    """)
+    cursor.execute("DROP TABLE collection_watermarks_old")
+
+
+# Миграции в порядке применения: (версия, описание, функция(cursor, db_type))
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "базовая схема", _v1_baseline),
+    (2, "ad_spend.date_stop переименована в date_end", _v2_date_stop_to_date_end),
+    (3, "колонки collection_mode, content_hash и счетчики журнала запусков", _v3_added_columns),
+    (4, "составные и покрывающие индексы ad_spend", _v4_query_indexes),
+    (5, "секционирование ad_spend по месяцам (PostgreSQL)", _v5_partition_ad_spend),
+    (6, "отметки инкрементального сбора по профилю и аккаунту", _v6_profile_watermarks),
+]
+
+
+def get_applied_versions(db_manager) -> Set[int]:
+    """
+    Возвращает примененные версии схемы
+
+    Args:
+        db_manager: Менеджер базы данных (DatabaseManager)
+
+    Returns:
+        Множество номеров версий
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP NOT NULL
+        )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(db_manager) -> int:
+    """
+    Применяет недостающие миграции схемы
+
+    Каждая миграция выполняется в отдельной транзакции под блокировкой
+    (BEGIN IMMEDIATE для SQLite, pg_advisory_xact_lock для PostgreSQL),
+    поэтому одновременный запуск нескольких процессов безопасен.
+
+    Args:
+        db_manager: Менеджер базы данных (DatabaseManager)
+
+    Returns:
+        Количество примененных миграций
+    """
+    applied = get_applied_versions(db_manager)
+    placeholder = "?" if db_manager.db_type == "sqlite" else "%s"
+    applied_count = 0
+
+    for version, description, apply in MIGRATIONS:
+        if version in applied:
+            continue
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            if db_manager.db_type == "sqlite":
+                cursor.execute("BEGIN IMMEDIATE")
+            else:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PG_MIGRATION_LOCK_KEY,))
+
+            # Миграцию мог применить другой процесс, пока мы ждали блокировку
+            cursor.execute(f"SELECT 1 FROM schema_migrations WHERE version = {placeholder}", (version,))
+            if cursor.fetchone():
+                continue
+
+            logger.info(f"Применяется миграция схемы {version}: {description}")
+            apply(cursor, db_manager.db_type)
+            cursor.execute(
+                f"INSERT INTO schema_migrations (version, description, applied_at) "
+                f"VALUES ({placeholder}, {placeholder}, {placeholder})",
+                (version, description, datetime.now())
+            )
+            applied_count += 1
+
+    return applied_count
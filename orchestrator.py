@@ -4,15 +4,28 @@
 Координирует работу всех модулей
 """
 
+import asyncio
 import json
 import logging
+import threading
 import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Iterator
 
 from anti_detect_browser_manager import AntiDetectBrowserManager
 from facebook_api_client import FacebookAPIClient
-from database_manager import DatabaseManager
+from async_facebook_api_client import AsyncFacebookAPIClient
+from rate_limiter import get_shared_rate_limiter
+from account_registry import AccountRegistry, get_shared_account_registry
+from token_status import get_shared_token_status
+from response_cache import get_shared_insights_cache
+from database_manager import DatabaseManager, SpendWriteError
+from pipeline import run_pipeline, run_pipeline_async
+from run_profiler import RunProfiler, get_profiles_dir
+import metrics
 from config_manager import config_manager # Импортируем глобальный экземпляр ConfigManager
 
 # Настройка логирования
@@ -47,15 +60,79 @@ class FacebookSpendOrchestrator:
             api_url=self.config.get('anti_detect_browser_api_url', 'http://localhost:3001/v1.0')
         )
         
+        # Общий для всех запусков с этим токеном ограничитель частоты запросов
+        self.rate_limiter = get_shared_rate_limiter(
+            self.config['facebook_access_token'],
+            max_rate=self.config.get('rate_limit_max_rps', 10),
+            burst=self.config.get('rate_limit_burst', 10),
+            slowdown_threshold=self.config.get('rate_limit_slowdown_pct', 75)
+        )
+        
+        # Общий для процесса кэш insights: завершенные дни не запрашиваются повторно
+        self.insights_cache = None
+        if self.config.get('insights_cache_enabled', True):
+            self.insights_cache = get_shared_insights_cache(
+                path=self.config.get('insights_cache_path', 'insights_cache.db'),
+                max_size_mb=self.config.get('insights_cache_max_mb', 512),
+                recent_ttl=self.config.get('insights_cache_recent_ttl', 3600),
+                attribution_window_days=self.config.get('attribution_window_days', 28)
+            )
+        
+        # Общий для процесса результат проверки токена
+        self.token_status = get_shared_token_status(self.config['facebook_access_token'])
+        
         self.facebook_client = FacebookAPIClient(
             access_token=self.config['facebook_access_token'],
-            api_version=self.config.get('facebook_api_version', 'v18.0')
+            api_version=self.config.get('facebook_api_version', 'v18.0'),
+            page_size=self.config.get('page_size', 500),
+            async_poll_interval=self.config.get('async_poll_interval', 5),
+            async_timeout=self.config.get('async_report_timeout', 3600),
+            rate_limiter=self.rate_limiter,
+            max_retries=self.config.get('api_max_retries', 3),
+            filter_chunk_size=self.config.get('insights_filter_chunk_size', 200),
+            max_parallel_chunks=self.config.get('insights_max_parallel', 4),
+            pool_maxsize=self.config.get('max_concurrent_profiles', 4) * self.config.get('insights_max_parallel', 4),
+            cache=self.insights_cache,
+            cache_buffer_rows=self.config.get('insights_cache_buffer_rows', 50000),
+            streaming_json=self.config.get('streaming_json', False),
+            stream_batch_size=self.config.get('stream_batch_size', 100),
+            token_status=self.token_status
         )
         
-        self.db_manager = DatabaseManager(
-            db_path=self.config.get('database_url', 'facebook_spend_data.db'), # Изменено на database_url
-            db_type=self.config.get('database_type', 'sqlite')
-        )
+        # Асинхронный клиент для получения insights: профили обрабатываются
+        # задачами одного цикла событий вместо потоков (требуется httpx)
+        self.async_client = None
+        if self.config.get('async_http_client', False):
+            self.async_client = AsyncFacebookAPIClient(
+                access_token=self.config['facebook_access_token'],
+                api_version=self.config.get('facebook_api_version', 'v18.0'),
+                page_size=self.config.get('page_size', 500),
+                async_poll_interval=self.config.get('async_poll_interval', 5),
+                async_timeout=self.config.get('async_report_timeout', 3600),
+                rate_limiter=self.rate_limiter,
+                max_retries=self.config.get('api_max_retries', 3),
+                filter_chunk_size=self.config.get('insights_filter_chunk_size', 200),
+                max_parallel_chunks=self.config.get('insights_max_parallel', 4),
+                cache=self.insights_cache,
+                cache_buffer_rows=self.config.get('insights_cache_buffer_rows', 50000),
+                streaming_json=self.config.get('streaming_json', False),
+                stream_batch_size=self.config.get('stream_batch_size', 100),
+                token_status=self.token_status,
+                max_connections=self.config.get('http_max_connections', 20),
+                max_keepalive_connections=self.config.get('http_max_connections', 20),
+                per_host_limit=self.config.get('http_per_host_limit', 10),
+                http2=self.config.get('http2', False)
+            )
+        
+        self.db_manager = DatabaseManager.from_config(self.config)
+        
+        # Общий для процесса реестр метаданных рекламных аккаунтов
+        self.account_registry = None
+        if self.config.get('account_registry_enabled', True):
+            self.account_registry = get_shared_account_registry(
+                self.config['facebook_access_token'],
+                ttl=self.config.get('account_registry_ttl', 21600)
+            )
         
     # Удаляем метод load_config, так как конфигурация теперь загружается через ConfigManager
     # def load_config(self, config_path: str) -> Dict[str, Any]:
@@ -97,10 +174,382 @@ class FacebookSpendOrchestrator:
         
         return start_date, end_date
         
+    def get_incremental_range(self, last_collected_date: Optional[str],
+                              start_date: str, end_date: str) -> Optional[tuple]:
+        """
+        Определяет диапазон дат для аккаунта по отметке последнего сбора
+        
+        Запрашиваются только дни после отметки и окно restatement_days перед
+        ними, в котором данные еще могут измениться из-за атрибуции.
+        
+        Args:
+            last_collected_date: Последняя полностью собранная дата (None - сбора еще не было)
+            start_date: Начальная дата периода по умолчанию (days_back)
+            end_date: Конечная дата периода
+            
+        Returns:
+            Кортеж (start_date, end_date) или None, если новых дней нет
+        """
+        if not last_collected_date:
+            return start_date, end_date
+        if last_collected_date >= end_date:
+            return None
+        
+        first_new_day = datetime.strptime(last_collected_date, '%Y-%m-%d') + timedelta(days=1)
+        restatement_days = self.config.get('restatement_days', 3)
+        return (first_new_day - timedelta(days=restatement_days)).strftime('%Y-%m-%d'), end_date
+        
+    def should_use_async_report(self, ad_count: int, start_date: str, end_date: str) -> bool:
+        """
+        Определяет, нужно ли получать данные через асинхронный отчет
+        
+        Оценивает размер ответа как количество объявлений, умноженное на
+        количество дней (при ежедневной разбивке), и сравнивает с порогом
+        async_report_threshold
+        
+        Args:
+            ad_count: Количество объявлений в запросе
+            start_date: Начальная дата периода (YYYY-MM-DD)
+            end_date: Конечная дата периода (YYYY-MM-DD)
+            
+        Returns:
+            True если следует использовать асинхронный отчет
+        """
+        threshold = self.config.get('async_report_threshold', 20000)
+        if not threshold:
+            return False
+        
+        days = 1
+        if self.config.get('daily_breakdown', True):
+            days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+        
+        return max(ad_count, 1) * max(days, 1) >= threshold
+        
+    def estimate_ad_count(self, ad_account_id: str, proxy_config: Optional[Dict[str, str]] = None) -> int:
+        """
+        Оценивает количество объявлений аккаунта по API (для аккаунтов без сохраненных данных)
+        
+        Args:
+            ad_account_id: ID рекламного аккаунта
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            
+        Returns:
+            Количество объявлений или 0, если получить его не удалось
+        """
+        try:
+            ad_count = self.facebook_client.count_ads(ad_account_id, proxy_config)
+            logger.info(f"Аккаунт {ad_account_id}: сохраненных данных нет, объявлений по API: {ad_count}")
+            return ad_count
+        except Exception as e:
+            logger.warning(f"Не удалось получить количество объявлений аккаунта {ad_account_id}: {e}")
+            return 0
+        
+    def prefetch_ad_ids(self, profiles: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """
+        Получает ad_ids для всех профилей без явно заданных объявлений
+        через batch-запросы (один HTTP-запрос на MAX_BATCH_SIZE аккаунтов)
+        
+        Используется только при account_level_insights=False: в режиме уровня
+        аккаунта ad_ids не запрашиваются вовсе.
+        
+        Args:
+            profiles: Список конфигураций профилей
+            
+        Returns:
+            Словарь {ad_account_id: список ad_id} для успешно обработанных аккаунтов
+        """
+        account_ids = list(dict.fromkeys(
+            p['ad_account_id'] for p in profiles if not p.get('ad_ids')
+        ))
+        if not account_ids:
+            return {}
+        
+        try:
+            ads_by_account = self.facebook_client.get_ads_batch(account_ids, limit=1000)
+        except Exception as e:
+            logger.error(f"Ошибка при пакетном получении объявлений: {e}")
+            return {}
+        
+        # Аккаунты с ошибкой не попадают в результат и будут запрошены
+        # обычным способом в process_profile
+        return {
+            account_id: [ad['id'] for ad in ads]
+            for account_id, ads in ads_by_account.items()
+            if isinstance(ads, list)
+        }
+        
+    def load_accounts(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Получает метаданные рекламных аккаунтов из реестра
+        
+        Returns:
+            Словарь {ad_account_id: метаданные}; пустой, если реестр отключен или недоступен
+        """
+        if not self.account_registry:
+            return {}
+        
+        try:
+            return self.account_registry.get_accounts(self.facebook_client, self.db_manager)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить реестр рекламных аккаунтов: {e}")
+            return {}
+        
+    def iter_records(self, insights: Iterable[Dict[str, Any]], profile_config: Dict[str, Any],
+                     start_date: str, end_date: str) -> Iterator[Dict[str, Any]]:
+        """
+        Преобразует записи insights в записи для сохранения в БД по одной,
+        не создавая промежуточный список
+        
+        Args:
+            insights: Записи, полученные из Facebook API
+            profile_config: Конфигурация профиля
+            start_date: Начальная дата периода сбора
+            end_date: Конечная дата периода сбора
+            
+        Yields:
+            Записи для DatabaseManager
+        """
+        for insight in insights:
+            yield {
+                'profile_id': profile_config['profile_id'],
+                'ad_account_id': profile_config['ad_account_id'],
+                'ad_id': insight.get('ad_id', ''),
+                'ad_name': insight.get('ad_name', ''),
+                'date_start': insight.get('date_start', start_date),
+                'date_end': insight.get('date_stop', end_date),
+                'spend': insight.get('spend', 0),
+                'currency': profile_config.get('currency', 'USD'),
+                'impressions': insight.get('impressions', 0),
+                'clicks': insight.get('clicks', 0),
+                'ctr': insight.get('ctr', 0),
+                'cpc': insight.get('cpc', 0),
+                'cpm': insight.get('cpm', 0)
+            }
+            
+    def build_records(self, insights: List[Dict[str, Any]], profile_config: Dict[str, Any],
+                      start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """
+        Преобразует записи insights в записи для сохранения в БД
+        
+        Args:
+            insights: Записи, полученные из Facebook API
+            profile_config: Конфигурация профиля
+            start_date: Начальная дата периода сбора
+            end_date: Конечная дата периода сбора
+            
+        Returns:
+            Список записей для DatabaseManager
+        """
+        return list(self.iter_records(insights, profile_config, start_date, end_date))
+        
+    def collect_profile(self, profile_config: Dict[str, Any], start_date: str, end_date: str,
+                        proxy_config: Optional[Dict[str, str]] = None) -> int:
+        """
+        Получает данные о расходах по аккаунту профиля и сохраняет их в БД
+        
+        Args:
+            profile_config: Конфигурация профиля
+            start_date: Начальная дата для сбора данных
+            end_date: Конечная дата для сбора данных
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            
+        Returns:
+            Количество сохраненных записей
+            
+        Raises:
+            requests.RequestException: При ошибке запроса к API
+            SpendWriteError: Если часть полученных записей не сохранена (ошибки
+                записи в БД только логируются, поэтому проверяется их количество)
+        """
+        profile_id = profile_config['profile_id']
+        ad_account_id = profile_config['ad_account_id']
+        
+        # 1. Получаем список объявлений (если нужны конкретные ad_ids)
+        ad_ids = profile_config.get('ad_ids')
+        if ad_ids:
+            ad_count = len(ad_ids)
+        elif self.config.get('account_level_insights', True):
+            # Insights уровня ad по всему аккаунту уже содержат все объявления
+            # с расходами и их названия, отдельный запрос /ads не нужен.
+            # Объем ответа оцениваем по ранее сохраненным данным, а при первом
+            # сборе аккаунта - по количеству объявлений из API
+            ad_ids = None
+            ad_count = self.db_manager.count_ads(ad_account_id)
+            if not ad_count and self.config.get('async_report_threshold', 20000):
+                ad_count = self.estimate_ad_count(ad_account_id, proxy_config)
+        else:
+            # Если ad_ids не указаны, получаем все объявления аккаунта
+            ads = self.facebook_client.get_ads(ad_account_id, limit=1000)
+            ad_ids = [ad['id'] for ad in ads]
+            ad_count = len(ad_ids)
+            logger.info(f"Получено {len(ad_ids)} объявлений для аккаунта {ad_account_id}")
+        
+        # 2. Получаем данные о расходах постранично
+        # Для больших объемов (объявления × дни) используем асинхронный отчет
+        use_async = self.should_use_async_report(ad_count, start_date, end_date)
+        if use_async:
+            logger.info(f"Аккаунт {ad_account_id}: используем асинхронный отчет")
+        
+        if self.config.get('daily_breakdown', True):
+            # Получаем ежедневную разбивку
+            pages = self.facebook_client.iter_daily_insights(
+                ad_account_id=ad_account_id,
+                start_date=start_date,
+                end_date=end_date,
+                ad_ids=ad_ids,
+                proxy_config=proxy_config,
+                use_async=use_async
+            )
+        else:
+            # Получаем общие данные за период
+            pages = self.facebook_client.iter_ad_insights(
+                ad_account_id=ad_account_id,
+                start_date=start_date,
+                end_date=end_date,
+                ad_ids=ad_ids,
+                proxy_config=proxy_config,
+                use_async=use_async
+            )
+        
+        # 3. Получение страниц, преобразование и запись пакетами выполняются
+        # конвейером: запись идет параллельно с получением следующих страниц,
+        # а ограниченные очереди удерживают память постоянной
+        fetched_count = 0
+        
+        def transform(page: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            nonlocal fetched_count
+            fetched_count += len(page)
+            metrics.record_collection(rows_fetched=len(page))
+            return self.iter_records(page, profile_config, start_date, end_date)
+        
+        saved_count = run_pipeline(
+            pages, transform, self.db_manager.insert_multiple_spend_data,
+            batch_size=self.config.get('write_batch_size', 500),
+            queue_size=self.config.get('pipeline_queue_size', 4)
+        )
+        
+        logger.info(f"Получено {fetched_count} записей о расходах")
+        logger.info(f"Сохранено {saved_count} записей для профиля {profile_id}")
+        if saved_count < fetched_count:
+            raise SpendWriteError(f"Сохранено {saved_count} из {fetched_count} записей о расходах "
+                                  f"профиля {profile_id} за {start_date} - {end_date}")
+        return saved_count
+        
+    async def collect_profile_async(self, profile_config: Dict[str, Any], start_date: str, end_date: str,
+                                    proxy_config: Optional[Dict[str, str]] = None) -> int:
+        """
+        Асинхронный вариант collect_profile: данные получает AsyncFacebookAPIClient,
+        запись в БД выполняется в отдельном потоке (см. run_pipeline_async)
+        
+        Args:
+            profile_config: Конфигурация профиля
+            start_date: Начальная дата для сбора данных
+            end_date: Конечная дата для сбора данных
+            proxy_config: Конфигурация прокси {"http": "...", "https": "..."}
+            
+        Returns:
+            Количество сохраненных записей
+            
+        Raises:
+            httpx.HTTPError: При ошибке запроса к API
+            SpendWriteError: Если часть полученных записей не сохранена
+        """
+        profile_id = profile_config['profile_id']
+        ad_account_id = profile_config['ad_account_id']
+        
+        ad_ids = profile_config.get('ad_ids')
+        if ad_ids:
+            ad_count = len(ad_ids)
+        elif self.config.get('account_level_insights', True):
+            ad_ids = None
+            ad_count = await asyncio.to_thread(self.db_manager.count_ads, ad_account_id)
+            if not ad_count and self.config.get('async_report_threshold', 20000):
+                try:
+                    ad_count = await self.async_client.count_ads(ad_account_id, proxy_config)
+                    logger.info(f"Аккаунт {ad_account_id}: сохраненных данных нет, объявлений по API: {ad_count}")
+                except Exception as e:
+                    logger.warning(f"Не удалось получить количество объявлений аккаунта {ad_account_id}: {e}")
+        else:
+            ads = await self.async_client.get_ads(ad_account_id, limit=1000)
+            ad_ids = [ad['id'] for ad in ads]
+            ad_count = len(ad_ids)
+        
+        use_async = self.should_use_async_report(ad_count, start_date, end_date)
+        if use_async:
+            logger.info(f"Аккаунт {ad_account_id}: используем асинхронный отчет")
+        
+        if self.config.get('daily_breakdown', True):
+            pages = self.async_client.iter_daily_insights(
+                ad_account_id=ad_account_id,
+                start_date=start_date,
+                end_date=end_date,
+                ad_ids=ad_ids,
+                proxy_config=proxy_config,
+                use_async=use_async
+            )
+        else:
+            pages = self.async_client.iter_ad_insights(
+                ad_account_id=ad_account_id,
+                start_date=start_date,
+                end_date=end_date,
+                ad_ids=ad_ids,
+                proxy_config=proxy_config,
+                use_async=use_async
+            )
+        
+        fetched_count = 0
+        
+        def transform(page: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            nonlocal fetched_count
+            fetched_count += len(page)
+            metrics.record_collection(rows_fetched=len(page))
+            return self.iter_records(page, profile_config, start_date, end_date)
+        
+        saved_count = await run_pipeline_async(
+            pages, transform, self.db_manager.insert_multiple_spend_data,
+            batch_size=self.config.get('write_batch_size', 500),
+            queue_size=self.config.get('pipeline_queue_size', 4)
+        )
+        
+        logger.info(f"Получено {fetched_count} записей о расходах")
+        logger.info(f"Сохранено {saved_count} записей для профиля {profile_id}")
+        if saved_count < fetched_count:
+            raise SpendWriteError(f"Сохранено {saved_count} из {fetched_count} записей о расходах "
+                                  f"профиля {profile_id} за {start_date} - {end_date}")
+        return saved_count
+        
+    def get_proxy_config(self, profile_config: Dict[str, Any],
+                         browser_info: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, str]]:
+        """
+        Определяет прокси для запросов профиля: proxy_url профиля или
+        локальный прокси запущенного антидетект-браузера
+        
+        Args:
+            profile_config: Конфигурация профиля
+            browser_info: Ответ launch_profile (None в режиме "direct")
+            
+        Returns:
+            Конфигурация прокси {"http": "...", "https": "..."} или None
+        """
+        proxy_url = profile_config.get('proxy_url')
+        if not proxy_url and browser_info and 'ws' in browser_info and 'port' in browser_info:
+            # Если антидетект-браузер предоставляет локальный прокси
+            proxy_url = f"socks5://127.0.0.1:{browser_info['port']}"
+        if not proxy_url:
+            return None
+        return {
+            'http': proxy_url,
+            'https': proxy_url
+        }
+        
     def process_profile(self, profile_config: Dict[str, Any], start_date: str, end_date: str) -> bool:
         """
         Обрабатывает один профиль: запускает браузер, собирает данные, сохраняет в БД
         
+        В режиме сбора "direct" (collection_mode профиля или конфигурации)
+        профиль антидетект-браузера не запускается: данные запрашиваются
+        напрямую через Graph API, при необходимости через proxy_url профиля.
+        
         Args:
             profile_config: Конфигурация профиля
             start_date: Начальная дата для сбора данных
@@ -111,9 +560,19 @@ class FacebookSpendOrchestrator:
         """
         profile_id = profile_config['profile_id']
         ad_account_id = profile_config['ad_account_id']
+        collection_mode = profile_config.get('collection_mode') or self.config.get('collection_mode', 'browser')
         
         logger.info(f"Начинаем обработку профиля {profile_id} для аккаунта {ad_account_id}")
         
+        if collection_mode == 'direct':
+            try:
+                self.collect_profile(profile_config, start_date, end_date, self.get_proxy_config(profile_config))
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка при обработке профиля {profile_id}: {e}")
+                metrics.record_collection_error(str(e))
+                return False
+        
         try:
             # 1. Запускаем профиль антидетект-браузера
             browser_info = self.browser_manager.launch_profile(profile_id)
@@ -123,97 +582,120 @@ class FacebookSpendOrchestrator:
             time.sleep(5)
             
             # 2. Настраиваем прокси для запросов (если доступен)
-            proxy_config = None
-            if 'proxy_url' in profile_config:
-                proxy_config = {
-                    'http': profile_config['proxy_url'],
-                    'https': profile_config['proxy_url']
-                }
-            elif 'ws' in browser_info and 'port' in browser_info:
-                # Если антидетект-браузер предоставляет локальный прокси
-                local_proxy = f"socks5://127.0.0.1:{browser_info['port']}"
-                proxy_config = {
-                    'http': local_proxy,
-                    'https': local_proxy
-                }
-            
-            # 3. Получаем список объявлений (если нужны конкретные ad_ids)
-            ad_ids = profile_config.get('ad_ids')
-            if not ad_ids:
-                # Если ad_ids не указаны, получаем все объявления аккаунта
-                ads = self.facebook_client.get_ads(ad_account_id, limit=1000)
-                ad_ids = [ad['id'] for ad in ads]
-                logger.info(f"Получено {len(ad_ids)} объявлений для аккаунта {ad_account_id}")
-            
-            # 4. Получаем данные о расходах
-            if self.config.get('daily_breakdown', True):
-                # Получаем ежедневную разбивку
-                insights = self.facebook_client.get_daily_insights(
-                    ad_account_id=ad_account_id,
-                    start_date=start_date,
-                    end_date=end_date,
-                    ad_ids=ad_ids,
-                    proxy_config=proxy_config
-                )
-            else:
-                # Получаем общие данные за период
-                insights = self.facebook_client.get_ad_insights(
-                    ad_account_id=ad_account_id,
-                    start_date=start_date,
-                    end_date=end_date,
-                    ad_ids=ad_ids,
-                    proxy_config=proxy_config
-                )
+            proxy_config = self.get_proxy_config(profile_config, browser_info)
             
-            logger.info(f"Получено {len(insights)} записей о расходах")
-            
-            # 5. Подготавливаем данные для сохранения в БД
-            db_records = []
-            for insight in insights:
-                record = {
-                    'profile_id': profile_id,
-                    'ad_account_id': ad_account_id,
-                    'ad_id': insight.get('ad_id', ''),
-                    'ad_name': insight.get('ad_name', ''),
-                    'date_start': insight.get('date_start', start_date),
-                    'date_end': insight.get('date_stop', end_date),
-                    'spend': insight.get('spend', 0),
-                    'currency': profile_config.get('currency', 'USD'),
-                    'impressions': insight.get('impressions', 0),
-                    'clicks': insight.get('clicks', 0),
-                    'ctr': insight.get('ctr', 0),
-                    'cpc': insight.get('cpc', 0),
-                    'cpm': insight.get('cpm', 0)
-                }
-                db_records.append(record)
-            
-            # 6. Сохраняем данные в базу данных
-            saved_count = self.db_manager.insert_multiple_spend_data(db_records)
-            logger.info(f"Сохранено {saved_count} записей для профиля {profile_id}")
+            # 3. Получаем и сохраняем данные о расходах
+            self.collect_profile(profile_config, start_date, end_date, proxy_config)
             
             return True
             
         except Exception as e:
             logger.error(f"Ошибка при обработке профиля {profile_id}: {e}")
+            metrics.record_collection_error(str(e))
             return False
             
         finally:
-            # 7. Закрываем профиль антидетект-браузера
+            # 4. Закрываем профиль антидетект-браузера
             try:
                 self.browser_manager.close_profile(profile_id)
                 logger.info(f"Профиль {profile_id} закрыт")
             except Exception as e:
                 logger.error(f"Ошибка при закрытии профиля {profile_id}: {e}")
                 
+    async def process_profile_async(self, profile_config: Dict[str, Any], start_date: str, end_date: str) -> bool:
+        """
+        Асинхронный вариант process_profile (используется при async_http_client);
+        вызовы API антидетект-браузера выполняются в отдельном потоке
+        
+        Args:
+            profile_config: Конфигурация профиля
+            start_date: Начальная дата для сбора данных
+            end_date: Конечная дата для сбора данных
+            
+        Returns:
+            True если обработка прошла успешно
+        """
+        profile_id = profile_config['profile_id']
+        ad_account_id = profile_config['ad_account_id']
+        collection_mode = profile_config.get('collection_mode') or self.config.get('collection_mode', 'browser')
+        
+        logger.info(f"Начинаем обработку профиля {profile_id} для аккаунта {ad_account_id}")
+        
+        try:
+            browser_info = None
+            if collection_mode != 'direct':
+                browser_info = await asyncio.to_thread(self.browser_manager.launch_profile, profile_id)
+                logger.info(f"Профиль {profile_id} запущен")
+                await asyncio.sleep(5)
+            
+            await self.collect_profile_async(profile_config, start_date, end_date,
+                                             self.get_proxy_config(profile_config, browser_info))
+            return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка при обработке профиля {profile_id}: {e}")
+            metrics.record_collection_error(str(e))
+            return False
+            
+        finally:
+            if collection_mode != 'direct':
+                try:
+                    await asyncio.to_thread(self.browser_manager.close_profile, profile_id)
+                    logger.info(f"Профиль {profile_id} закрыт")
+                except Exception as e:
+                    logger.error(f"Ошибка при закрытии профиля {profile_id}: {e}")
+                    
+    async def process_profiles_async(self, items: List[tuple], process, workers: int) -> int:
+        """
+        Обрабатывает профили задачами одного цикла событий
+        
+        Args:
+            items: Пары (номер, конфигурация профиля)
+            process: Корутина обработки одной пары, возвращающая признак успеха
+            workers: Максимальное количество одновременно обрабатываемых профилей
+            
+        Returns:
+            Количество успешно обработанных профилей
+        """
+        semaphore = asyncio.Semaphore(workers)
+        
+        async def bounded(item) -> bool:
+            async with semaphore:
+                return await process(item)
+        
+        try:
+            return sum(await asyncio.gather(*(bounded(item) for item in items)))
+        finally:
+            await self.async_client.close()
+            
     def run(self):
         """
         Главный метод запуска сбора данных
+        
+        При включенном profile_runs запуск профилируется, отчеты сохраняются
+        рядом с логами под ID запуска (self.run_id)
+        """
+        self.run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        
+        if self.config.get('profile_runs', False):
+            with RunProfiler(self.run_id, get_profiles_dir(self.config)):
+                return self._run()
+        return self._run()
+        
+    def _run(self):
         """
-        logger.info("Запуск системы сбора данных Facebook Ad Spend")
+        Выполняет сбор данных по всем профилям (вызывается из run)
+        """
+        logger.info(f"Запуск системы сбора данных Facebook Ad Spend (запуск {self.run_id})")
+        run_started = time.perf_counter()
+        # Кэш общий для запусков процесса: в лог выводятся счетчики этого запуска
+        cache_before = self.insights_cache.get_stats() if self.insights_cache else None
         
         try:
-            # Тестируем подключение к Facebook API
-            self.facebook_client.test_connection()
+            # Проверяем токен (запрос к API только если прошлая проверка устарела
+            # или после ошибки авторизации)
+            with metrics.PHASE_DURATION.time(phase='token_check'):
+                self.token_status.ensure_valid(self.facebook_client)
             
             # Получаем диапазон дат для сбора
             start_date, end_date = self.get_date_range()
@@ -221,25 +703,167 @@ class FacebookSpendOrchestrator:
             
             # Обрабатываем каждый профиль
             profiles = self.config.get('profiles', [])
+            total_profiles = len(profiles)
             successful_profiles = 0
             
-            for i, profile_config in enumerate(profiles, 1):
+            # Метаданные аккаунтов (валюта, статус) берем из реестра без запросов
+            # на каждый аккаунт; отключенные аккаунты пропускаем
+            with metrics.PHASE_DURATION.time(phase='account_registry'):
+                accounts = self.load_accounts()
+            active_profiles = []
+            for profile_config in profiles:
+                account = accounts.get(profile_config['ad_account_id'])
+                if not AccountRegistry.is_active(account):
+                    logger.info(f"Аккаунт {profile_config['ad_account_id']} отключен "
+                                f"(статус {account['account_status']}), профиль {profile_config['profile_id']} пропущен")
+                    metrics.PROFILES_PROCESSED.inc(result='skipped_disabled')
+                    continue
+                if account and account.get('currency'):
+                    profile_config = dict(profile_config, currency=account['currency'])
+                active_profiles.append(profile_config)
+            profiles = active_profiles
+            
+            # Для инкрементального сбора сужаем период каждого аккаунта по отметке
+            # последнего сбора; аккаунты без новых дней не требуют запросов к API
+            date_ranges = {}
+            if self.config.get('incremental_collection', True):
+                watermarks = self.db_manager.get_watermarks()
+                pending_profiles = []
+                for profile_config in profiles:
+                    date_range = self.get_incremental_range(
+                        watermarks.get((profile_config['profile_id'], profile_config['ad_account_id'])),
+                        start_date, end_date
+                    )
+                    if date_range is None:
+                        logger.info(f"Аккаунт {profile_config['ad_account_id']} уже собран по {end_date}, "
+                                    f"профиль {profile_config['profile_id']} пропущен")
+                        successful_profiles += 1
+                        metrics.PROFILES_PROCESSED.inc(result='up_to_date')
+                        continue
+                    date_ranges[profile_config['profile_id']] = date_range
+                    pending_profiles.append(profile_config)
+                profiles = pending_profiles
+            
+            # Заранее получаем объявления всех аккаунтов пакетными запросами.
+            # Список объявлений нужен только при сборе по ad_ids: insights уровня
+            # аккаунта (account_level_insights, по умолчанию) обходятся без него
+            prefetched_ad_ids = {}
+            if self.config.get('batch_requests', True) and not self.config.get('account_level_insights', True):
+                with metrics.PHASE_DURATION.time(phase='prefetch_ads'):
+                    prefetched_ad_ids = self.prefetch_ad_ids(profiles)
+            
+            # Итоги запуска по всем аккаунтам (счетчики metrics.CollectionStats)
+            run_totals = Counter()
+            run_totals_lock = threading.Lock()
+            
+            def prepare(item):
+                i, profile_config = item
                 logger.info(f"Обработка профиля {i}/{len(profiles)}")
                 
-                if self.process_profile(profile_config, start_date, end_date):
-                    successful_profiles += 1
+                if not profile_config.get('ad_ids') and profile_config['ad_account_id'] in prefetched_ad_ids:
+                    profile_config = dict(profile_config, ad_ids=prefetched_ad_ids[profile_config['ad_account_id']])
                 
-                # Пауза между профилями для снижения нагрузки
-                delay = self.config.get('delay_between_profiles', 10)
-                if i < len(profiles):  # Не делаем паузу после последнего профиля
-                    logger.info(f"Пауза {delay} секунд перед следующим профилем")
-                    time.sleep(delay)
+                profile_start, profile_end = date_ranges.get(profile_config['profile_id'], (start_date, end_date))
+                if profile_start != start_date:
+                    logger.info(f"Аккаунт {profile_config['ad_account_id']}: инкрементальный сбор за {profile_start} - {profile_end}")
+                return profile_config, profile_start, profile_end
+            
+            def process(item):
+                profile_config, profile_start, profile_end = prepare(item)
+                started_at = datetime.now()
+                started = time.perf_counter()
+                with metrics.collection_stats() as stats, metrics.PHASE_DURATION.time(phase='profile'):
+                    success = self.process_profile(profile_config, profile_start, profile_end)
+                return finish(profile_config, profile_start, profile_end, success, stats, started_at, started)
             
-            logger.info(f"Обработка завершена. Успешно обработано {successful_profiles}/{len(profiles)} профилей")
+            async def process_async(item):
+                profile_config, profile_start, profile_end = prepare(item)
+                started_at = datetime.now()
+                started = time.perf_counter()
+                with metrics.collection_stats() as stats, metrics.PHASE_DURATION.time(phase='profile'):
+                    success = await self.process_profile_async(profile_config, profile_start, profile_end)
+                return await asyncio.to_thread(finish, profile_config, profile_start, profile_end,
+                                               success, stats, started_at, started)
+            
+            def finish(profile_config, profile_start, profile_end, success, stats, started_at, started):
+                metrics.PROFILES_PROCESSED.inc(result='success' if success else 'failed')
+                
+                # Журнал запусков: результат и счетчики сбора аккаунта
+                self.db_manager.record_collection_run(dict(
+                    stats.to_dict(),
+                    run_id=self.run_id,
+                    profile_id=profile_config['profile_id'],
+                    ad_account_id=profile_config['ad_account_id'],
+                    status='success' if success else 'failed',
+                    started_at=started_at,
+                    finished_at=datetime.now(),
+                    duration_seconds=time.perf_counter() - started,
+                    date_start=profile_start,
+                    date_end=profile_end,
+                    error=stats.error
+                ))
+                with run_totals_lock:
+                    run_totals.update(stats.to_dict())
+                if not success:
+                    return False
+                
+                # Отметка сдвигается только после сохранения всех записей профиля:
+                # при ошибках записи collect_profile завершается SpendWriteError
+                if self.config.get('incremental_collection', True):
+                    self.db_manager.set_watermark(profile_config['profile_id'], profile_config['ad_account_id'],
+                                                  profile_end)
+                return True
+            
+            workers = max(1, min(self.config.get('max_concurrent_profiles', 4), len(profiles)))
+            if self.async_client and profiles:
+                # Профили обрабатываются задачами одного цикла событий: запросы
+                # ограничены пулом соединений, лимитом на хост и rate_limiter токена
+                logger.info(f"Асинхронная обработка профилей: до {workers} одновременно")
+                successful_profiles += asyncio.run(
+                    self.process_profiles_async(list(enumerate(profiles, 1)), process_async, workers)
+                )
+            elif workers > 1:
+                # Профили обрабатываются параллельно; темп запросов общий для всех
+                # потоков и регулируется rate_limiter токена, ошибки изолированы
+                # в process_profile
+                logger.info(f"Параллельная обработка профилей: {workers} потоков")
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    successful_profiles += sum(executor.map(process, enumerate(profiles, 1)))
+            else:
+                for i, profile_config in enumerate(profiles, 1):
+                    if process((i, profile_config)):
+                        successful_profiles += 1
+                    
+                    # Темп запросов регулирует rate_limiter по заголовкам использования
+                    # лимитов; фиксированная пауза между профилями нужна только если задана явно
+                    delay = self.config.get('delay_between_profiles', 0)
+                    if delay and i < len(profiles):  # Не делаем паузу после последнего профиля
+                        logger.info(f"Пауза {delay} секунд перед следующим профилем")
+                        time.sleep(delay)
+            
+            # Контрольная точка WAL и статистика планировщика SQLite после записи
+            with metrics.PHASE_DURATION.time(phase='db_maintenance'):
+                self.db_manager.maintain()
+            
+            logger.info(f"Обработка завершена. Успешно обработано {successful_profiles}/{total_profiles} профилей")
+            logger.info(f"Записи о расходах: новых {run_totals['rows_inserted']}, измененных {run_totals['rows_changed']}, "
+                        f"без изменений {run_totals['rows_unchanged']}")
+            
+            if self.insights_cache:
+                self.insights_cache.flush()
+                stats = self.insights_cache.get_stats()
+                logger.info(f"Кэш insights: {stats['hits'] - cache_before['hits']} попаданий, "
+                            f"{stats['misses'] - cache_before['misses']} промахов, "
+                            f"{stats['evictions'] - cache_before['evictions']} вытеснений, "
+                            f"{stats['entries']} записей")
             
         except Exception as e:
             logger.error(f"Критическая ошибка в работе оркестратора: {e}")
             raise
+        
+        finally:
+            metrics.RUN_DURATION.observe(time.perf_counter() - run_started)
+            metrics.LAST_RUN_TIMESTAMP.set(time.time())
 
 def run_orchestrator():
     """Функция для запуска оркестратора (используется в main.py)"""
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Скрипт и модуль секционирования таблицы ad_spend в PostgreSQL
+Таблица делится на секции по месяцам date_start (декларативное секционирование
+по диапазону), поэтому запросы с фильтром по дате читают только нужные секции,
+а старые секции отсоединяются без перезаписи данных
+
+Перевод существующей таблицы выполняется без остановки сбора:
+миграция схемы 5 создает секционированную копию ad_spend_partitioned и триггер,
+повторяющий в ней все изменения ad_spend; команда migrate копирует данные
+пакетами по id и в короткой транзакции меняет таблицы местами.
+
+Пример:
+    python partitioning.py migrate --batch-size 10000
+    python partitioning.py list
+    python partitioning.py detach --before 2023-01 --drop
+"""
+
+import argparse
+import os
+import re
+import sys
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = "ad_spend"
+# Секционированная копия на время переноса данных
+SHADOW_TABLE = "ad_spend_partitioned"
+# Прежняя таблица после переноса (удаляется вручную после проверки)
+LEGACY_TABLE = "ad_spend_legacy"
+
+# На сколько месяцев вперед секции создаются заранее
+PARTITION_MONTHS_AHEAD = 3
+
+# Через сколько секунд DatabaseManager заново проверяет секции уже
+# проверенных месяцев (их могли отсоединить из другого процесса)
+PARTITION_CACHE_TTL = 300
+
+# Ключ блокировки pg_advisory_xact_lock при создании секций
+PG_PARTITION_LOCK_KEY = 7281946302
+
+KEY_COLUMNS = ("profile_id", "ad_account_id", "ad_id", "date_start", "date_end")
+
+# Индексы секционированной таблицы (см. migrations._v4_query_indexes),
+# создаются на родительской таблице и наследуются секциями
+PARTITIONED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_ad_spend_p_profile_account_date "
+    "ON {table} (profile_id, ad_account_id, date_start DESC, ad_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ad_spend_p_account_date "
+    "ON {table} (ad_account_id, date_start DESC, ad_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ad_spend_p_date "
+    "ON {table} (date_start DESC, ad_account_id, ad_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ad_spend_p_totals "
+    "ON {table} (profile_id, ad_account_id, currency) "
+    "INCLUDE (date_start, date_end, ad_id, spend, impressions, clicks)",
+]
+
+_PARTITION_NAME_RE = re.compile(r"^ad_spend_y(\d{4})m(\d{2})$")
+
+
+def month_start(value) -> date:
+    """Возвращает первый день месяца даты (date, datetime или строки YYYY-MM-DD)"""
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        value = datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    return value.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    """Возвращает первый день следующего месяца"""
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_range(first: date, last: date) -> List[date]:
+    """Возвращает первые дни месяцев с first по last включительно"""
+    months = []
+    current = month_start(first)
+    while current <= last:
+        months.append(current)
+        current = next_month(current)
+    return months
+
+
+def months_ahead(count: int = PARTITION_MONTHS_AHEAD) -> List[date]:
+    """Возвращает текущий месяц и count следующих"""
+    months = [month_start(date.today())]
+    for _ in range(count):
+        months.append(next_month(months[-1]))
+    return months
+
+
+def partition_name(month: date) -> str:
+    """Имя секции месяца, например ad_spend_y2024m01"""
+    return f"ad_spend_y{month.year}m{month.month:02d}"
+
+
+def get_partitioned_table(cursor) -> Optional[str]:
+    """
+    Определяет секционированную таблицу расходов
+
+    Returns:
+        "ad_spend" после переноса, "ad_spend_partitioned" во время переноса
+        или None, если таблица не секционирована
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname IN (%s, %s) AND pg_table_is_visible(c.oid)",
+        (PARTITIONED_TABLE, SHADOW_TABLE)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(cursor, table: str = PARTITIONED_TABLE) -> List[Tuple[str, date]]:
+    """
+    Возвращает месячные секции таблицы
+
+    Returns:
+        Список (имя секции, первый день месяца), старые первыми
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s AND pg_table_is_visible(p.oid) ORDER BY c.relname",
+        (table,)
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return partitions
+
+
+def create_partitions(cursor, months: Iterable[date], table: Optional[str] = None) -> List[str]:
+    """
+    Создает недостающие месячные секции
+
+    Args:
+        cursor: Курсор PostgreSQL
+        months: Первые дни месяцев
+        table: Секционированная таблица (по умолчанию определяется get_partitioned_table)
+
+    Returns:
+        Имена созданных секций
+    """
+    table = table or get_partitioned_table(cursor)
+    if not table:
+        return []
+
+    # Несколько процессов могут одновременно получить данные за новый месяц
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PG_PARTITION_LOCK_KEY,))
+    existing = {name for name, _ in list_partitions(cursor, table)}
+
+    created = []
+    for month in sorted(set(months)):
+        name = partition_name(month)
+        if name in existing:
+            continue
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (month, next_month(month))
+        )
+        created.append(name)
+
+    if created:
+        logger.info(f"Созданы секции {table}: {', '.join(created)}")
+    return created
+
+
+def _table_columns(cursor, table: str) -> List[str]:
+    """Возвращает колонки таблицы в порядке определения"""
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+        (table,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _install_mirror_trigger(cursor):
+    """Создает триггер, повторяющий изменения ad_spend в секционированной копии"""
+    columns = _table_columns(cursor, PARTITIONED_TABLE)
+    updates = [column for column in columns if column not in KEY_COLUMNS + ("id", "created_at")]
+
+    cursor.execute(f"""
+    CREATE OR REPLACE FUNCTION ad_spend_mirror() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM {SHADOW_TABLE} WHERE id = OLD.id AND date_start = OLD.date_start;
+            RETURN OLD;
+        END IF;
+        INSERT INTO {SHADOW_TABLE} ({", ".join(columns)})
+        VALUES ({", ".join(f"NEW.{column}" for column in columns)})
+        ON CONFLICT ({", ".join(KEY_COLUMNS)}) DO UPDATE SET
+            {", ".join(f"{column} = EXCLUDED.{column}" for column in updates)};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """)
+    cursor.execute(f"CREATE TRIGGER ad_spend_mirror AFTER INSERT OR UPDATE OR DELETE ON {PARTITIONED_TABLE} "
+                   f"FOR EACH ROW EXECUTE FUNCTION ad_spend_mirror()")
+
+
+def swap_tables(cursor, copied_up_to_id: Optional[int] = None, drop_legacy: bool = False):
+    """
+    Заменяет ad_spend секционированной копией (в транзакции вызывающей стороны)
+
+    Args:
+        cursor: Курсор PostgreSQL
+        copied_up_to_id: Строки с id больше этого значения докопируются под блокировкой
+        drop_legacy: Удалить прежнюю таблицу (для пустой таблицы)
+    """
+    columns = ", ".join(_table_columns(cursor, PARTITIONED_TABLE))
+    cursor.execute(f"LOCK TABLE {PARTITIONED_TABLE} IN ACCESS EXCLUSIVE MODE")
+
+    if copied_up_to_id is not None:
+        cursor.execute(
+            f"INSERT INTO {SHADOW_TABLE} ({columns}) SELECT {columns} FROM {PARTITIONED_TABLE} "
+            f"WHERE id > %s ON CONFLICT DO NOTHING",
+            (copied_up_to_id,)
+        )
+
+    cursor.execute(f"DROP TRIGGER IF EXISTS ad_spend_mirror ON {PARTITIONED_TABLE}")
+    cursor.execute("DROP FUNCTION IF EXISTS ad_spend_mirror()")
+
+    # Последовательность id (ad_spend_id_seq) переходит к новой таблице
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (PARTITIONED_TABLE,))
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {LEGACY_TABLE}")
+    cursor.execute(f"ALTER TABLE {SHADOW_TABLE} RENAME TO {PARTITIONED_TABLE}")
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {PARTITIONED_TABLE}.id")
+
+    if drop_legacy:
+        cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+    logger.info(f"Таблица {PARTITIONED_TABLE} заменена секционированной по месяцам date_start")
+
+
+def prepare_partitioning(cursor, months_ahead_count: int = PARTITION_MONTHS_AHEAD):
+    """
+    Готовит секционирование ad_spend (миграция схемы 5)
+
+    Создает секционированную копию с индексами и секциями для месяцев
+    имеющихся данных и months_ahead_count месяцев вперед. Пустая таблица
+    заменяется сразу; для непустой создается триггер, а данные переносит
+    команда migrate.
+
+    Args:
+        cursor: Курсор PostgreSQL
+        months_ahead_count: Количество месяцев, для которых секции создаются заранее
+    """
+    if get_partitioned_table(cursor):
+        return
+
+    cursor.execute(f"CREATE TABLE {SHADOW_TABLE} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS) "
+                   f"PARTITION BY RANGE (date_start)")
+    # Ограничения уникальности секционированной таблицы должны включать ключ секционирования
+    cursor.execute(f"ALTER TABLE {SHADOW_TABLE} ADD PRIMARY KEY (id, date_start)")
+    cursor.execute(f"ALTER TABLE {SHADOW_TABLE} ADD UNIQUE ({', '.join(KEY_COLUMNS)})")
+    for index_sql in PARTITIONED_INDEXES:
+        cursor.execute(index_sql.format(table=SHADOW_TABLE))
+
+    cursor.execute(f"SELECT MIN(date_start), MAX(date_start) FROM {PARTITIONED_TABLE}")
+    first, last = cursor.fetchone()
+    months = set(months_ahead(months_ahead_count))
+    if first:
+        months.update(month_range(first, last))
+    create_partitions(cursor, months, table=SHADOW_TABLE)
+
+    if not first:
+        swap_tables(cursor, drop_legacy=True)
+        return
+
+    _install_mirror_trigger(cursor)
+    logger.warning(f"Создана секционированная копия {SHADOW_TABLE}; для переноса данных "
+                   f"выполните: python partitioning.py migrate")
+
+
+def migrate_data(db_manager, batch_size: int = 10000, pause: float = 0.0) -> int:
+    """
+    Переносит данные ad_spend в секционированную копию пакетами и меняет таблицы местами
+
+    Каждый пакет (диапазон id) копируется отдельной транзакцией, изменения,
+    сделанные во время переноса, повторяет триггер. Таблицы меняются местами
+    в короткой транзакции под блокировкой.
+
+    Args:
+        db_manager: Менеджер базы данных (DatabaseManager)
+        batch_size: Количество id в одном пакете
+        pause: Пауза между пакетами (секунды), чтобы снизить нагрузку
+
+    Returns:
+        Количество скопированных строк
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        if get_partitioned_table(cursor) != SHADOW_TABLE:
+            logger.info("Перенос не требуется: секционированная копия ad_spend отсутствует")
+            return 0
+        cursor.execute(f"SELECT MIN(id), MAX(id) FROM {PARTITIONED_TABLE}")
+        first_id, last_id = cursor.fetchone()
+        columns = ", ".join(_table_columns(cursor, PARTITIONED_TABLE))
+
+    copied = 0
+    current = (first_id or 1) - 1
+    last_id = last_id or 0
+    started_at = time.monotonic()
+
+    while current < last_id:
+        upper = current + batch_size
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            # Строки, уже записанные триггером, новее копируемых
+            cursor.execute(
+                f"INSERT INTO {SHADOW_TABLE} ({columns}) SELECT {columns} FROM {PARTITIONED_TABLE} "
+                f"WHERE id > %s AND id <= %s ON CONFLICT DO NOTHING",
+                (current, upper)
+            )
+            copied += cursor.rowcount
+        current = upper
+
+        elapsed = time.monotonic() - started_at
+        print(f"[{min(current, last_id)}/{last_id}] скопировано {copied} строк, "
+              f"{copied / elapsed if elapsed else 0:.0f} строк/с", flush=True)
+        if pause:
+            time.sleep(pause)
+
+    with db_manager.get_connection() as conn:
+        swap_tables(conn.cursor(), copied_up_to_id=last_id)
+
+    logger.info(f"Перенос завершен: {copied} строк. Прежняя таблица сохранена как {LEGACY_TABLE}")
+    return copied
+
+
+def detach_partitions(db_manager, before: str, drop: bool = False) -> List[str]:
+    """
+    Отсоединяет секции месяцев раньше указанного
+
+    Отсоединение меняет только метаданные и не переписывает данные; секция
+    остается отдельной таблицей (для архивации) или удаляется при drop.
+
+    Args:
+        db_manager: Менеджер базы данных (DatabaseManager)
+        before: Первый сохраняемый месяц (YYYY-MM)
+        drop: Удалить отсоединенные секции
+
+    Returns:
+        Имена отсоединенных секций
+    """
+    first_kept = month_start(f"{before}-01")
+    detached = []
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        if get_partitioned_table(cursor) != PARTITIONED_TABLE:
+            raise ValueError("Таблица ad_spend не секционирована (выполните python partitioning.py migrate)")
+
+        for name, month in list_partitions(cursor):
+            if month >= first_kept:
+                continue
+            cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}")
+            if drop:
+                cursor.execute(f"DROP TABLE {name}")
+            detached.append(name)
+
+    # Секции отсоединенных месяцев при следующей записи нужно создать заново
+    db_manager.forget_partitions()
+    logger.info(f"{'Удалено' if drop else 'Отсоединено'} секций: {len(detached)}")
+    return detached
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Секционирование таблицы ad_spend в PostgreSQL")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help="Перенести данные в секционированную таблицу")
+    migrate_parser.add_argument('--batch-size', type=int, default=10000, help="Количество id в одном пакете")
+    migrate_parser.add_argument('--pause', type=float, default=0.0, help="Пауза между пакетами (секунды)")
+
+    subparsers.add_parser('list', help="Показать секции")
+
+    detach_parser = subparsers.add_parser('detach', help="Отсоединить секции старых месяцев")
+    detach_parser.add_argument('--before', required=True, help="Первый сохраняемый месяц (YYYY-MM)")
+    detach_parser.add_argument('--drop', action='store_true', help="Удалить отсоединенные секции")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # Добавляем текущую директорию в PYTHONPATH
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from config_manager import config_manager
+    from database_manager import DatabaseManager
+
+    if config_manager.get('database_type') != 'postgresql':
+        print("Секционирование поддерживается только для PostgreSQL")
+        sys.exit(1)
+
+    try:
+        db_manager = DatabaseManager.from_config(config_manager.get_all())
+        if args.command == 'migrate':
+            migrate_data(db_manager, batch_size=args.batch_size, pause=args.pause)
+        elif args.command == 'list':
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                table = get_partitioned_table(cursor)
+                for name, _ in list_partitions(cursor, table) if table else []:
+                    print(name)
+        elif args.command == 'detach':
+            for name in detach_partitions(db_manager, args.before, drop=args.drop):
+                print(name)
+    except Exception as e:
+        logging.error(f"Ошибка в partitioning.py: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# pipeline.py
+"""
+Модуль конвейерной обработки данных
+Получение страниц, преобразование в записи и запись в БД выполняются
+в отдельных потоках, связанных ограниченными очередями
+(или в цикле событий asyncio для асинхронного клиента Graph API)
+"""
+
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List, Any, Iterable, AsyncIterable
+
+logger = logging.getLogger(__name__)
+
+# Признак окончания данных в очереди
+_DONE = object()
+
+
+class _StageError:
+    """Исключение, переданное следующей стадии конвейера"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """
+    Помещает элемент в очередь, ожидая свободного места, пока конвейер не остановлен
+
+    Returns:
+        False если конвейер остановлен и элемент не помещен
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_pipeline(pages: Iterable[List[Dict[str, Any]]],
+                 transform: Callable[[List[Dict[str, Any]]], Iterable[Dict[str, Any]]],
+                 write: Callable[[List[Dict[str, Any]]], int],
+                 batch_size: int = 500, queue_size: int = 4) -> int:
+    """
+    Выполняет конвейер: получение страниц -> преобразование -> запись пакетами
+
+    Получение и преобразование выполняются в фоновых потоках, запись - в
+    вызывающем. Между стадиями стоят очереди на queue_size элементов, поэтому
+    в памяти одновременно находится ограниченное число страниц и пакетов,
+    а запись идет параллельно с получением следующих страниц.
+
+    Args:
+        pages: Итератор страниц записей (например, iter_daily_insights)
+        transform: Преобразует страницу в записи для БД
+        write: Сохраняет пакет записей и возвращает количество сохраненных
+        batch_size: Количество записей в одном пакете записи
+        queue_size: Емкость каждой очереди между стадиями
+
+    Returns:
+        Количество сохраненных записей
+
+    Raises:
+        Исключение любой стадии (после остановки остальных стадий)
+    """
+    page_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    batch_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def fetch():
+        try:
+            for page in pages:
+                if not _put(page_queue, page, stop):
+                    return
+        except BaseException as e:
+            _put(page_queue, _StageError(e), stop)
+            return
+        finally:
+            # Закрываем генератор страниц, если конвейер остановлен досрочно
+            close = getattr(pages, 'close', None)
+            if stop.is_set() and close:
+                close()
+        _put(page_queue, _DONE, stop)
+
+    def convert():
+        batch = []
+        while not stop.is_set():
+            try:
+                item = page_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if item is _DONE or isinstance(item, _StageError):
+                if batch and item is _DONE:
+                    _put(batch_queue, batch, stop)
+                _put(batch_queue, item, stop)
+                return
+
+            try:
+                for record in transform(item):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        if not _put(batch_queue, batch, stop):
+                            return
+                        batch = []
+            except BaseException as e:
+                _put(batch_queue, _StageError(e), stop)
+                return
+
+    # Стадии выполняются в копии контекста вызывающего потока, чтобы
+    # счетчики сбора аккаунта (metrics.collection_stats) учитывали их запросы
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(fetch,), name="pipeline-fetch", daemon=True),
+        threading.Thread(target=contextvars.copy_context().run, args=(convert,), name="pipeline-convert", daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+
+    saved_count = 0
+    try:
+        while True:
+            item = batch_queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.error
+            saved_count += write(item)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return saved_count
+
+
+async def run_pipeline_async(pages: AsyncIterable[List[Dict[str, Any]]],
+                             transform: Callable[[List[Dict[str, Any]]], Iterable[Dict[str, Any]]],
+                             write: Callable[[List[Dict[str, Any]]], int],
+                             batch_size: int = 500, queue_size: int = 4) -> int:
+    """
+    Асинхронный вариант run_pipeline для страниц AsyncFacebookAPIClient
+
+    Страницы получаются и преобразуются в цикле событий, а блокирующая запись
+    пакетов выполняется в отдельном потоке, так что она идет параллельно
+    с получением следующих страниц. Очередь на queue_size пакетов
+    ограничивает память.
+
+    Args:
+        pages: Асинхронный итератор страниц записей (например, iter_daily_insights)
+        transform: Преобразует страницу в записи для БД
+        write: Сохраняет пакет записей и возвращает количество сохраненных
+        batch_size: Количество записей в одном пакете записи
+        queue_size: Емкость очереди пакетов
+
+    Returns:
+        Количество сохраненных записей
+
+    Raises:
+        Исключение любой стадии (после остановки остальных стадий)
+    """
+    batch_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def write_batches() -> int:
+        saved_count = 0
+        while True:
+            batch = await batch_queue.get()
+            if batch is _DONE:
+                return saved_count
+            # asyncio.to_thread копирует контекст: счетчики сбора аккаунта учитывают запись
+            saved_count += await asyncio.to_thread(write, batch)
+
+    writer = asyncio.ensure_future(write_batches())
+
+    async def put(item: Any):
+        # Ожидаем место в очереди, пока запись не завершилась ошибкой
+        putter = asyncio.ensure_future(batch_queue.put(item))
+        await asyncio.wait({putter, writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not putter.done():
+            putter.cancel()
+        if writer.done():
+            writer.result()
+
+    try:
+        batch = []
+        async for page in pages:
+            for record in transform(page):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    await put(batch)
+                    batch = []
+        if batch:
+            await put(batch)
+        await put(_DONE)
+        return await writer
+    finally:
+        if not writer.done():
+            writer.cancel()
+        # Закрываем генератор страниц, если конвейер остановлен досрочно
+        close = getattr(pages, 'aclose', None)
+        if close:
+            await close()
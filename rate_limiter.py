@@ -0,0 +1,267 @@
+# rate_limiter.py
+"""
+Модуль адаптивного ограничения частоты запросов к Facebook Graph API
+Темп запросов регулируется по заголовкам использования лимитов
+(X-App-Usage, X-Ad-Account-Usage, X-Business-Use-Case-Usage)
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Коды ошибок Graph API, означающие превышение лимитов
+THROTTLE_ERROR_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+
+# Через сколько секунд без новых заголовков использование лимита учитываться перестает
+DEFAULT_USAGE_TTL = 300.0
+
+_AD_ACCOUNT_RE = re.compile(r"/act_(\d+)")
+
+
+class AdaptiveRateLimiter:
+    """
+    Потокобезопасный token bucket, скорость которого снижается
+    по мере приближения использования лимитов Graph API к 100%
+
+    Использование хранится отдельно для приложения, каждого рекламного
+    аккаунта и каждого бизнеса/типа лимита; темп определяется максимальным
+    из них, так что ответы по малозагруженному аккаунту не отменяют
+    замедление, вызванное другим аккаунтом с тем же токеном.
+    """
+
+    def __init__(self, max_rate: float = 10.0, burst: int = 10,
+                 slowdown_threshold: float = 75.0, min_rate_factor: float = 0.05,
+                 default_block_seconds: float = 60.0,
+                 usage_ttl: float = DEFAULT_USAGE_TTL):
+        """
+        Инициализация ограничителя
+
+        Args:
+            max_rate: Максимальная скорость запросов (запросов в секунду)
+            burst: Емкость корзины (максимальное количество запросов подряд)
+            slowdown_threshold: Процент использования лимита, с которого начинается замедление
+            min_rate_factor: Минимальная доля от max_rate при высоком использовании
+            default_block_seconds: Пауза при достижении лимита, если API не сообщил время восстановления
+            usage_ttl: Время, после которого использование лимита без новых заголовков не учитывается (секунды)
+        """
+        self.max_rate = max_rate
+        self.burst = burst
+        self.slowdown_threshold = slowdown_threshold
+        self.min_rate_factor = min_rate_factor
+        self.default_block_seconds = default_block_seconds
+        self.usage_ttl = usage_ttl
+
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.usage_pct = 0.0
+        # {лимит: (процент использования, время получения)}, см. parse_usage_by_scope
+        self._usage: Dict[str, Tuple[float, float]] = {}
+        self.blocked_until = 0.0
+        self.throttle_count = 0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """Пополняет корзину в соответствии с текущей скоростью"""
+        elapsed = now - self._last_refill
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self) -> float:
+        """
+        Пытается получить разрешение на запрос без ожидания
+
+        Returns:
+            0 если запрос разрешен, иначе время ожидания до следующей попытки (секунды)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Блокирует вызывающий поток до момента, когда можно отправить запрос
+        """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def update_from_headers(self, headers: Dict[str, str], url: Optional[str] = None):
+        """
+        Обновляет темп запросов по заголовкам использования лимитов
+
+        Ответы без заголовков использования темп не меняют.
+
+        Args:
+            headers: Заголовки ответа Graph API
+            url: URL запроса (по нему X-Ad-Account-Usage относится к аккаунту)
+        """
+        usage, regain_seconds = parse_usage_by_scope(headers, ad_account_from_url(url))
+        if not usage:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            for scope, pct in usage.items():
+                self._usage[scope] = (pct, now)
+            # Устаревшие значения (лимиты, по которым давно не было ответов) не учитываются
+            self._usage = {scope: entry for scope, entry in self._usage.items()
+                           if now - entry[1] <= self.usage_ttl}
+            usage_pct = max(pct for pct, _ in self._usage.values())
+            self.usage_pct = usage_pct
+
+            if max(usage.values()) >= 100 or regain_seconds > 0:
+                self._block(regain_seconds or self.default_block_seconds)
+
+            if usage_pct <= self.slowdown_threshold:
+                factor = 1.0
+            else:
+                factor = (100 - usage_pct) / (100 - self.slowdown_threshold)
+            self.rate = self.max_rate * max(self.min_rate_factor, min(1.0, factor))
+
+    def penalize(self, seconds: Optional[float] = None):
+        """
+        Приостанавливает запросы после ответа о превышении лимита
+
+        Args:
+            seconds: Время паузы (по умолчанию default_block_seconds)
+        """
+        with self._lock:
+            self.throttle_count += 1
+            self._block(seconds or self.default_block_seconds)
+
+    def _block(self, seconds: float):
+        """Запрещает запросы на указанное время (вызывается под блокировкой)"""
+        blocked_until = time.monotonic() + seconds
+        if blocked_until > self.blocked_until:
+            self.blocked_until = blocked_until
+            logger.warning(f"Лимит Graph API почти исчерпан, пауза {seconds:.0f} секунд")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает текущее состояние ограничителя
+
+        Returns:
+            Словарь с текущей скоростью, использованием лимита (максимальным
+            и по отдельным лимитам) и числом блокировок
+        """
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'usage_pct': self.usage_pct,
+                'usage_by_scope': {scope: pct for scope, (pct, _) in self._usage.items()},
+                'blocked_for': max(0.0, self.blocked_until - time.monotonic()),
+                'throttle_count': self.throttle_count
+            }
+
+
+def ad_account_from_url(url: Optional[str]) -> Optional[str]:
+    """Возвращает ID рекламного аккаунта из URL запроса (.../act_<id>/...) или None"""
+    match = _AD_ACCOUNT_RE.search(url or "")
+    return match.group(1) if match else None
+
+
+def parse_usage_by_scope(headers: Dict[str, str],
+                         ad_account_id: Optional[str] = None) -> Tuple[Dict[str, float], float]:
+    """
+    Извлекает процент использования по каждому лимиту и время восстановления доступа
+
+    Args:
+        headers: Заголовки ответа Graph API
+        ad_account_id: ID аккаунта запроса (X-Ad-Account-Usage не содержит его)
+
+    Returns:
+        Кортеж ({лимит: usage_pct}, regain_seconds); лимиты - "app",
+        "ad_account:<id>" и "business:<id>:<тип>"; пустой словарь,
+        если заголовков использования в ответе нет
+    """
+    usage: Dict[str, float] = {}
+    regain_seconds = 0.0
+
+    app_usage = _load_header(headers, 'x-app-usage')
+    if isinstance(app_usage, dict):
+        usage['app'] = max([0.0] + [float(v) for v in app_usage.values() if isinstance(v, (int, float))])
+
+    account_usage = _load_header(headers, 'x-ad-account-usage')
+    if isinstance(account_usage, dict):
+        account_pct = float(account_usage.get('acc_id_util_pct', 0))
+        usage[f"ad_account:{ad_account_id or 'unknown'}"] = account_pct
+        if account_pct >= 100:
+            regain_seconds = max(regain_seconds, float(account_usage.get('reset_time_duration', 0)))
+
+    business_usage = _load_header(headers, 'x-business-use-case-usage')
+    if isinstance(business_usage, dict):
+        for business_id, entries in business_usage.items():
+            for entry in entries or []:
+                scope = f"business:{business_id}:{entry.get('type', '')}"
+                usage[scope] = max([usage.get(scope, 0.0)] + [float(entry.get(key, 0))
+                                    for key in ('call_count', 'total_cputime', 'total_time')])
+                # estimated_time_to_regain_access указывается в минутах
+                regain_seconds = max(regain_seconds, float(entry.get('estimated_time_to_regain_access', 0)) * 60)
+
+    return usage, regain_seconds
+
+
+def parse_usage_headers(headers: Dict[str, str]) -> tuple:
+    """
+    Извлекает максимальный процент использования лимитов и время восстановления доступа
+
+    Args:
+        headers: Заголовки ответа Graph API
+
+    Returns:
+        Кортеж (usage_pct, regain_seconds)
+    """
+    usage, regain_seconds = parse_usage_by_scope(headers)
+    return max(usage.values(), default=0.0), regain_seconds
+
+
+def _load_header(headers: Dict[str, str], name: str) -> Any:
+    """Разбирает JSON-заголовок использования лимитов (None при отсутствии или ошибке)"""
+    value = headers.get(name)
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        logger.debug(f"Не удалось разобрать заголовок {name}: {value}")
+        return None
+
+
+# Общие ограничители по access token: все клиенты с одним токеном
+# расходуют один и тот же лимит Graph API
+_shared_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_shared_limiters_lock = threading.Lock()
+
+
+def get_shared_rate_limiter(access_token: str, **kwargs) -> AdaptiveRateLimiter:
+    """
+    Возвращает общий для процесса ограничитель для указанного токена
+
+    Args:
+        access_token: Facebook Access Token
+        **kwargs: Параметры AdaptiveRateLimiter (используются при первом создании)
+
+    Returns:
+        Экземпляр AdaptiveRateLimiter
+    """
+    with _shared_limiters_lock:
+        limiter = _shared_limiters.get(access_token)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(**kwargs)
+            _shared_limiters[access_token] = limiter
+        return limiter
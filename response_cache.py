@@ -0,0 +1,237 @@
+# response_cache.py
+"""
+Модуль дискового кэша ответов Facebook Graph API
+Хранит дневные insights: записи за завершенные дни (старше окна атрибуции)
+не устаревают, записи за недавние дни хранятся ограниченное время
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Сколько отложенных обновлений last_access накапливается до записи без вызова put
+ACCESS_FLUSH_THRESHOLD = 1000
+
+
+class InsightsCache:
+    """Дисковый LRU-кэш дневных insights на SQLite"""
+
+    def __init__(self, path: str = "insights_cache.db", max_size_mb: float = 512,
+                 recent_ttl: float = 3600, attribution_window_days: int = 28):
+        """
+        Инициализация кэша
+
+        Args:
+            path: Путь к файлу кэша
+            max_size_mb: Максимальный размер сохраненных данных (МБ)
+            recent_ttl: Время жизни записей за незавершенные дни (секунды)
+            attribution_window_days: Окно атрибуции - дни старше него считаются завершенными
+        """
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.recent_ttl = recent_ttl
+        self.attribution_window_days = attribution_window_days
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Время последнего обращения к записям, найденным get: записывается
+        # в файл пакетом (в put, flush или по ACCESS_FLUSH_THRESHOLD), чтобы
+        # попадания в кэш не выполняли запись и commit
+        self._pending_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS insights_cache (
+                cache_key TEXT PRIMARY KEY,
+                ad_account_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_insights_cache_last_access ON insights_cache(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(ad_account_id: str, level: str, fields: str, day: str,
+                 ad_ids: Optional[List[str]] = None) -> str:
+        """
+        Формирует ключ кэша
+
+        Args:
+            ad_account_id: ID рекламного аккаунта
+            level: Уровень insights (ad, adset, campaign, account)
+            fields: Список полей через запятую
+            day: Дата в формате YYYY-MM-DD
+            ad_ids: Фильтр по ID объявлений (None - весь аккаунт)
+
+        Returns:
+            Строковый ключ
+        """
+        raw = json.dumps([ad_account_id, level, fields, day, sorted(ad_ids) if ad_ids else None])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def is_finalized(self, day: str) -> bool:
+        """
+        Проверяет, вышел ли день за пределы окна атрибуции
+
+        Args:
+            day: Дата в формате YYYY-MM-DD
+
+        Returns:
+            True если данные за день больше не изменятся
+        """
+        cutoff = datetime.now().date() - timedelta(days=self.attribution_window_days)
+        return datetime.strptime(day, '%Y-%m-%d').date() < cutoff
+
+    def get(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Возвращает записи из кэша
+
+        Args:
+            cache_key: Ключ кэша
+
+        Returns:
+            Список записей или None, если записи нет или она устарела
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM insights_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+
+            self._pending_access[cache_key] = now
+            if len(self._pending_access) >= ACCESS_FLUSH_THRESHOLD:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, cache_key: str, ad_account_id: str, day: str, rows: List[Dict[str, Any]]):
+        """
+        Сохраняет записи за день в кэш
+
+        Args:
+            cache_key: Ключ кэша
+            ad_account_id: ID рекламного аккаунта
+            day: Дата в формате YYYY-MM-DD
+            rows: Записи insights за этот день
+        """
+        payload = json.dumps(rows, separators=(',', ':'))
+        now = time.time()
+        expires_at = None if self.is_finalized(day) else now + self.recent_ttl
+
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO insights_cache
+                (cache_key, ad_account_id, day, payload, size, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (cache_key, ad_account_id, day, payload, len(payload), expires_at, now))
+            self._pending_access.pop(cache_key, None)
+            # Порядок вытеснения учитывает отложенные обращения
+            self._flush_access()
+            self._evict()
+            self._conn.commit()
+
+    def flush(self):
+        """Записывает отложенные обновления времени последнего обращения"""
+        with self._lock:
+            if self._pending_access:
+                self._flush_access()
+                self._conn.commit()
+
+    def _flush_access(self):
+        """Переносит отложенные last_access в таблицу без commit (вызывается под блокировкой)"""
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE insights_cache SET last_access = ? WHERE cache_key = ?",
+            [(accessed_at, cache_key) for cache_key, accessed_at in self._pending_access.items()]
+        )
+        self._pending_access.clear()
+
+    def _evict(self):
+        """Удаляет устаревшие и давно неиспользуемые записи сверх лимита (вызывается под блокировкой)"""
+        self._conn.execute("DELETE FROM insights_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+
+        total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM insights_cache").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        for cache_key, size in self._conn.execute(
+            "SELECT cache_key, size FROM insights_cache ORDER BY last_access"
+        ).fetchall():
+            self._conn.execute("DELETE FROM insights_cache WHERE cache_key = ?", (cache_key,))
+            self.evictions += 1
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику кэша
+
+        Returns:
+            Словарь с количеством попаданий, промахов, вытеснений, записей и размером
+        """
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM insights_cache"
+            ).fetchone()
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': size
+        }
+
+
+_shared_caches: Dict[str, InsightsCache] = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_insights_cache(path: str = "insights_cache.db", **kwargs) -> InsightsCache:
+    """
+    Возвращает общий для процесса кэш insights с указанным файлом
+
+    Оркестратор создается на каждый запуск (запрос веб-приложения, срабатывание
+    планировщика), поэтому кэш и его соединение с SQLite переиспользуются,
+    а не открываются заново при каждом запуске.
+
+    Args:
+        path: Путь к файлу кэша
+        **kwargs: Параметры InsightsCache (используются при первом создании)
+
+    Returns:
+        Экземпляр InsightsCache
+    """
+    key = os.path.abspath(path)
+    with _shared_caches_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = InsightsCache(path=path, **kwargs)
+            _shared_caches[key] = cache
+        return cache
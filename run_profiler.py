@@ -0,0 +1,263 @@
+# run_profiler.py
+"""
+Модуль профилирования запусков сбора данных
+Снимает выборочный CPU-профиль потоков запуска и статистику выделения
+памяти (tracemalloc) и сохраняет отчеты с ID запуска
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Количество строк в текстовых отчетах
+TOP_ENTRIES = 50
+
+# tracemalloc глобален для процесса: профилировщики одновременных запусков
+# учитываются счетчиком, и отслеживание останавливает только последний из них
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    """Включает tracemalloc для профилировщика (если он еще не включен)"""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                _tracemalloc_owned = True
+            # Пик сбрасывается только первым профилировщиком: у одновременных
+            # запусков он общий и включает выделения всех запусков
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    """Останавливает tracemalloc, если его включили профилировщики и этот был последним"""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+class RunProfiler:
+    """
+    Выборочный профилировщик: с заданным интервалом снимает стеки потоков
+    запуска (потока, вызвавшего start, и созданных после него потоков пула
+    профилей и конвейера), что cProfile для многопоточного запуска не умеет
+
+    Потоки, существовавшие до запуска (веб-сервер, планировщик), не
+    учитываются. Каждый стек получает время процессора, потраченное потоком
+    с предыдущего снимка (/proc/self/task/<tid>/schedstat в Linux), поэтому
+    потоки, ожидающие очередь, блокировку или ответ сети, в CPU-профиль не
+    попадают. Если время процессора потоков недоступно, отчет строится по
+    реальному времени (wall-clock) и включает ожидание.
+    """
+
+    def __init__(self, run_id: str, output_dir: str, interval: float = 0.01):
+        """
+        Инициализация профилировщика
+
+        Args:
+            run_id: ID запуска (используется в именах файлов отчетов)
+            output_dir: Каталог для отчетов
+            interval: Интервал между снимками стеков (секунды)
+        """
+        self.run_id = run_id
+        self.output_dir = output_dir
+        self.interval = interval
+
+        # Стек -> время процессора (мкс) или количество снимков (wall-clock)
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._cpu_mode = False
+        self._excluded_threads: set = set()
+        self._cpu_times: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._tracemalloc_acquired = False
+
+    def __enter__(self) -> 'RunProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        """Запускает сбор стеков и отслеживание выделения памяти"""
+        _acquire_tracemalloc()
+        self._tracemalloc_acquired = True
+
+        own_id = threading.get_ident()
+        self._excluded_threads = {thread.ident for thread in threading.enumerate()} - {own_id}
+        self._cpu_mode = self._thread_cpu_ns(threading.current_thread().native_id) is not None
+
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="run-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Профилирование запуска {self.run_id} включено")
+
+    @staticmethod
+    def _thread_cpu_ns(native_id: Optional[int]) -> Optional[int]:
+        """Возвращает время процессора потока (наносекунды) или None, если оно недоступно"""
+        if native_id is None:
+            return None
+        try:
+            with open(f"/proc/self/task/{native_id}/schedstat", 'r') as f:
+                return int(f.read().split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _sample_loop(self):
+        """Периодически снимает стеки потоков запуска"""
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            native_ids = {thread.ident: thread.native_id for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or thread_id in self._excluded_threads:
+                    continue
+
+                weight = 1
+                if self._cpu_mode:
+                    cpu_ns = self._thread_cpu_ns(native_ids.get(thread_id))
+                    if cpu_ns is None:
+                        continue
+                    previous = self._cpu_times.get(thread_id)
+                    self._cpu_times[thread_id] = cpu_ns
+                    # Первый снимок потока - точка отсчета; простаивавший поток не учитывается
+                    weight = (cpu_ns - previous) // 1000 if previous is not None else 0
+                    if weight <= 0:
+                        continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self._stacks[tuple(reversed(stack))] += weight
+            self._samples += 1
+
+    def stop(self) -> List[str]:
+        """
+        Останавливает профилирование и сохраняет отчеты
+
+        Returns:
+            Список путей к сохраненным файлам
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        duration = time.perf_counter() - self._started_at
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._tracemalloc_acquired:
+            self._tracemalloc_acquired = False
+            _release_tracemalloc()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        files = [
+            self._write_cpu_report(duration),
+            self._write_collapsed_stacks(),
+            self._write_alloc_report(snapshot, current, peak)
+        ]
+        logger.info(f"Профиль запуска {self.run_id} сохранен: {', '.join(os.path.basename(f) for f in files)}")
+        return files
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.output_dir, f"{self.run_id}.{suffix}")
+
+    def _write_cpu_report(self, duration: float) -> str:
+        """Сохраняет функции с наибольшим временем (собственным и суммарным)"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self._stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+
+        if self._cpu_mode:
+            mode = "время процессора потоков запуска, мкс (ожидание не учитывается)"
+        else:
+            mode = "реальное время (wall-clock), снимков стеков потоков запуска, включая ожидание"
+
+        path = self._path("cpu.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Запуск: {self.run_id}\nДлительность: {duration:.1f} с\n"
+                    f"Снимков: {self._samples} (интервал {self.interval * 1000:.0f} мс)\n"
+                    f"Единица: {mode}\n\n")
+            f.write("Собственное время (верх стека):\n")
+            for function, count in own.most_common(TOP_ENTRIES):
+                f.write(f"{count:>8}  {function}\n")
+            f.write("\nСуммарное время (функция в стеке):\n")
+            for function, count in total.most_common(TOP_ENTRIES):
+                f.write(f"{count:>8}  {function}\n")
+        return path
+
+    def _write_collapsed_stacks(self) -> str:
+        """Сохраняет стеки в формате collapsed (flamegraph.pl, speedscope)"""
+        path = self._path("collapsed")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(";".join(stack) + f" {count}\n")
+        return path
+
+    def _write_alloc_report(self, snapshot: tracemalloc.Snapshot, current: int, peak: int) -> str:
+        """Сохраняет места с наибольшим объемом выделенной и не освобожденной памяти"""
+        path = self._path("alloc.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Запуск: {self.run_id}\nТекущий объем: {current / 1024 / 1024:.1f} МБ\n"
+                    f"Пиковый объем: {peak / 1024 / 1024:.1f} МБ\n\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ENTRIES]:
+                f.write(f"{stat.size / 1024:>10.1f} КБ {stat.count:>8} блоков  {stat.traceback}\n")
+        return path
+
+
+def list_profiles(output_dir: str) -> List[Dict[str, Any]]:
+    """
+    Возвращает сохраненные отчеты профилирования
+
+    Args:
+        output_dir: Каталог отчетов
+
+    Returns:
+        Список файлов (имя, размер, время изменения), новые первыми
+    """
+    if not os.path.isdir(output_dir):
+        return []
+
+    files = []
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            files.append({'name': name, 'size': stat.st_size, 'modified': stat.st_mtime})
+    return sorted(files, key=lambda f: f['modified'], reverse=True)
+
+
+def get_profiles_dir(config: Dict[str, Any]) -> str:
+    """
+    Определяет каталог отчетов профилирования (рядом с лог-файлом)
+
+    Args:
+        config: Конфигурация
+
+    Returns:
+        Путь к каталогу
+    """
+    if config.get('profiling_dir'):
+        return config['profiling_dir']
+    log_dir = os.path.dirname(config.get('log_file') or '') or 'logs'
+    return os.path.join(log_dir, 'profiles')
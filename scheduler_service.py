@@ -30,13 +30,12 @@ class SchedulerService:
     
     def __init__(self):
         """Инициализация планировщика"""
-        self.db_manager = DatabaseManager(
-            db_path=config_manager.get('database_url'),
-            db_type=config_manager.get('database_type')
-        )
+        self.db_manager = DatabaseManager.from_config(config_manager.get_all())
         self.interval_hours = config_manager.get('scheduler_interval_hours', 6)
         self.enabled = config_manager.get('scheduler_enabled', True)
-        self.last_run = None
+        # Время последнего запуска берем из журнала, чтобы перезапуск сервиса
+        # не приводил к внеочередному сбору
+        self.last_run = self.get_last_run_time()
         
         logger.info(f"Планировщик инициализирован. Интервал: {self.interval_hours} часов, Включен: {self.enabled}")
     
@@ -62,6 +61,20 @@ class SchedulerService:
             logger.error(f"Ошибка при получении активных профилей: {e}")
             return []
     
+    def get_last_run_time(self):
+        """Возвращает время начала последнего запуска из журнала collection_runs"""
+        runs = self.db_manager.get_collection_runs(limit=1)
+        if not runs:
+            return None
+        
+        started_at = runs[0]['started_at']
+        if isinstance(started_at, datetime):
+            return started_at
+        try:
+            return datetime.fromisoformat(str(started_at))
+        except ValueError:
+            return None
+    
     def should_run(self) -> bool:
         """Проверяет, нужно ли запускать сбор данных"""
         if not self.enabled:
@@ -96,6 +109,7 @@ class SchedulerService:
                     'ad_account_id': profile['ad_account_id'],
                     'currency': profile.get('currency', 'USD'),
                     'proxy_url': profile.get('proxy_url', ''),
+                    'collection_mode': profile.get('collection_mode'),
                     'ad_ids': profile.get('ad_ids', '').split(',') if profile.get('ad_ids') else []
                 }
                 config['profiles'].append(profile_config)
@@ -0,0 +1,154 @@
+# token_status.py
+"""
+Модуль кэширования состояния Facebook Access Token
+Действительность и срок жизни токена определяются одним запросом /debug_token
+(или /me, если /debug_token не принимает токен) и переиспользуются
+до истечения токена или до первой ошибки авторизации
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Коды ошибок Graph API, означающие недействительный токен
+AUTH_ERROR_CODES = {102, 190}
+
+
+class InvalidTokenError(requests.RequestException):
+    """Токен доступа недействителен или истек"""
+
+
+class TokenStatus:
+    """Потокобезопасный кэш результата проверки токена"""
+
+    def __init__(self):
+        """Инициализация кэша (до первой проверки токен считается непроверенным)"""
+        self.is_valid: Optional[bool] = None
+        self.expires_at: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.scopes: list = []
+        self.error: Optional[str] = None
+        # RLock: ошибка авторизации в запросе /debug_token вызывает mark_invalid из ensure_valid
+        self._lock = threading.RLock()
+
+    def _is_fresh(self, now: float) -> bool:
+        """Проверяет, можно ли использовать сохраненный результат (вызывается под блокировкой)"""
+        if not self.is_valid:
+            return False
+        return not self.expires_at or now < self.expires_at
+
+    def ensure_valid(self, facebook_client) -> Dict[str, Any]:
+        """
+        Проверяет токен, используя сохраненный результат, если он еще актуален
+        
+        /debug_token принимает только токены приложения и его разработчиков;
+        если он отклоняет токен не ошибкой авторизации, токен проверяется
+        запросом /me и считается действительным без известного срока жизни.
+
+        Args:
+            facebook_client: Клиент Graph API (FacebookAPIClient)
+
+        Returns:
+            Состояние токена (см. to_dict)
+
+        Raises:
+            InvalidTokenError: Если токен недействителен или истек
+            requests.RequestException: При ошибке запроса к API
+        """
+        with self._lock:
+            now = time.time()
+            if not self._is_fresh(now):
+                try:
+                    data = facebook_client.debug_token()
+                except requests.HTTPError as e:
+                    code = _error_code(e.response)
+                    if code is None or code in AUTH_ERROR_CODES:
+                        raise
+                    logger.info(f"/debug_token недоступен для токена (код {code}), проверяем токен запросом /me")
+                    facebook_client.test_connection()
+                    data = {'is_valid': True}
+                expires_at = data.get('expires_at') or 0
+
+                self.is_valid = bool(data.get('is_valid')) and (not expires_at or now < expires_at)
+                self.expires_at = float(expires_at) or None
+                self.checked_at = now
+                self.scopes = data.get('scopes', [])
+                self.error = data.get('error', {}).get('message')
+                logger.info(f"Токен проверен: {'действителен' if self.is_valid else 'недействителен'}, "
+                            f"истекает: {self._format_time(self.expires_at) or 'никогда'}")
+
+            if not self.is_valid:
+                raise InvalidTokenError(f"Токен Facebook недействителен: {self.error or 'истек срок действия'}")
+
+        return self.to_dict()
+
+    def mark_invalid(self, error: Optional[str] = None):
+        """
+        Сбрасывает результат проверки после ошибки авторизации
+
+        Args:
+            error: Сообщение об ошибке от API
+        """
+        with self._lock:
+            if self.is_valid is not False:
+                logger.warning(f"Ошибка авторизации Graph API, токен будет проверен повторно: {error}")
+            self.is_valid = False
+            self.error = error
+
+    @staticmethod
+    def _format_time(timestamp: Optional[float]) -> Optional[str]:
+        """Преобразует Unix time в строку ISO 8601"""
+        return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние токена без обращения к API
+
+        Returns:
+            Словарь с признаком действительности, сроком жизни, временем проверки и разрешениями
+        """
+        return {
+            'is_valid': self.is_valid,
+            'expires_at': self._format_time(self.expires_at),
+            'checked_at': self._format_time(self.checked_at),
+            'scopes': list(self.scopes),
+            'error': self.error
+        }
+
+
+def _error_code(response: Optional[requests.Response]) -> Optional[int]:
+    """Возвращает код ошибки Graph API из ответа (None, если ответа или кода нет)"""
+    if response is None:
+        return None
+    try:
+        return response.json().get('error', {}).get('code')
+    except ValueError:
+        return None
+
+
+_shared_statuses: Dict[str, TokenStatus] = {}
+_shared_statuses_lock = threading.Lock()
+
+
+def get_shared_token_status(access_token: str) -> TokenStatus:
+    """
+    Возвращает общий для процесса кэш состояния указанного токена
+
+    Args:
+        access_token: Facebook Access Token
+
+    Returns:
+        Экземпляр TokenStatus
+    """
+    with _shared_statuses_lock:
+        status = _shared_statuses.get(access_token)
+        if status is None:
+            status = TokenStatus()
+            _shared_statuses[access_token] = status
+        return status
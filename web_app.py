@@ -3,7 +3,7 @@
 Flask веб-приложение для управления системой сбора данных Facebook Ad Spend
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_from_directory
 from flask_cors import CORS
 import logging
 import os
@@ -13,6 +13,9 @@ from typing import Dict, List, Any
 from config_manager import config_manager
 from database_manager import DatabaseManager
 from orchestrator import FacebookSpendOrchestrator
+from token_status import get_shared_token_status
+from metrics import render_metrics
+from run_profiler import list_profiles, get_profiles_dir
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,52 +33,14 @@ app.secret_key = config_manager.get('flask_secret_key')
 CORS(app)
 
 # Инициализация менеджера базы данных
-db_manager = DatabaseManager(
-    db_path=config_manager.get('database_url'),
-    db_type=config_manager.get('database_type')
-)
+db_manager = DatabaseManager.from_config(config_manager.get_all())
 
 class ProfileManager:
     """Менеджер для работы с профилями в базе данных"""
     
     def __init__(self, db_manager: DatabaseManager):
+        # Таблица profiles создается миграциями схемы (migrations.py)
         self.db_manager = db_manager
-        self._create_profiles_table()
-    
-    def _create_profiles_table(self):
-        """Создает таблицу профилей если она не существует"""
-        if self.db_manager.db_type == "sqlite":
-            create_sql = """
-            CREATE TABLE IF NOT EXISTS profiles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                profile_id TEXT UNIQUE NOT NULL,
-                ad_account_id TEXT NOT NULL,
-                currency TEXT DEFAULT 'USD',
-                proxy_url TEXT,
-                ad_ids TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        else:  # PostgreSQL
-            create_sql = """
-            CREATE TABLE IF NOT EXISTS profiles (
-                id SERIAL PRIMARY KEY,
-                profile_id VARCHAR(255) UNIQUE NOT NULL,
-                ad_account_id VARCHAR(255) NOT NULL,
-                currency VARCHAR(10) DEFAULT 'USD',
-                proxy_url TEXT,
-                ad_ids TEXT,
-                is_active BOOLEAN DEFAULT true,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        
-        with self.db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(create_sql)
     
     def get_all_profiles(self) -> List[Dict[str, Any]]:
         """Получает все профили"""
@@ -100,11 +65,11 @@ class ProfileManager:
     def add_profile(self, profile_data: Dict[str, Any]) -> bool:
         """Добавляет новый профиль"""
         insert_sql = """
-        INSERT INTO profiles (profile_id, ad_account_id, currency, proxy_url, ad_ids, is_active, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO profiles (profile_id, ad_account_id, currency, proxy_url, ad_ids, collection_mode, is_active, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """ if self.db_manager.db_type == "sqlite" else """
-        INSERT INTO profiles (profile_id, ad_account_id, currency, proxy_url, ad_ids, is_active, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        INSERT INTO profiles (profile_id, ad_account_id, currency, proxy_url, ad_ids, collection_mode, is_active, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
         
         try:
@@ -116,6 +81,7 @@ class ProfileManager:
                     profile_data.get('currency', 'USD'),
                     profile_data.get('proxy_url', ''),
                     profile_data.get('ad_ids', ''),
+                    profile_data.get('collection_mode') or None,
                     profile_data.get('is_active', True),
                     datetime.now()
                 ))
@@ -128,11 +94,11 @@ class ProfileManager:
         """Обновляет существующий профиль"""
         update_sql = """
         UPDATE profiles 
-        SET ad_account_id = ?, currency = ?, proxy_url = ?, ad_ids = ?, is_active = ?, updated_at = ?
+        SET ad_account_id = ?, currency = ?, proxy_url = ?, ad_ids = ?, collection_mode = ?, is_active = ?, updated_at = ?
         WHERE profile_id = ?
         """ if self.db_manager.db_type == "sqlite" else """
         UPDATE profiles 
-        SET ad_account_id = %s, currency = %s, proxy_url = %s, ad_ids = %s, is_active = %s, updated_at = %s
+        SET ad_account_id = %s, currency = %s, proxy_url = %s, ad_ids = %s, collection_mode = %s, is_active = %s, updated_at = %s
         WHERE profile_id = %s
         """
         
@@ -144,6 +110,7 @@ class ProfileManager:
                     profile_data.get('currency', 'USD'),
                     profile_data.get('proxy_url', ''),
                     profile_data.get('ad_ids', ''),
+                    profile_data.get('collection_mode') or None,
                     profile_data.get('is_active', True),
                     datetime.now(),
                     profile_id
@@ -308,12 +275,17 @@ def api_run_collection():
         config = config_manager.to_legacy_format()
         config['profiles'] = []
         
+        # Профилирование можно включить для отдельного запуска: {"profile": true}
+        if (request.get_json(silent=True) or {}).get('profile'):
+            config['profile_runs'] = True
+        
         for profile in active_profiles:
             profile_config = {
                 'profile_id': profile['profile_id'],
                 'ad_account_id': profile['ad_account_id'],
                 'currency': profile.get('currency', 'USD'),
                 'proxy_url': profile.get('proxy_url', ''),
+                'collection_mode': profile.get('collection_mode'),
                 'ad_ids': profile.get('ad_ids', '').split(',') if profile.get('ad_ids') else []
             }
             config['profiles'].append(profile_config)
@@ -322,7 +294,7 @@ def api_run_collection():
         orchestrator = FacebookSpendOrchestrator(config_dict=config)
         orchestrator.run()
         
-        return jsonify({'message': 'Сбор данных успешно запущен'})
+        return jsonify({'message': 'Сбор данных успешно запущен', 'run_id': orchestrator.run_id})
         
     except Exception as e:
         logger.error(f"Ошибка при запуске сбора данных: {e}")
@@ -338,6 +310,8 @@ def api_get_stats():
         stats = {
             'total_profiles': profiles_count,
             'total_spend_data': total_spend_data,
+            'token': get_shared_token_status(config_manager.get('facebook_access_token')).to_dict(),
+            'db_pool': db_manager.pool.get_stats(),
             'last_update': datetime.now().isoformat()
         }
         
@@ -347,6 +321,45 @@ def api_get_stats():
         logger.error(f"Ошибка при получении статистики: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/runs', methods=['GET'])
+def api_get_runs():
+    """API: Журнал запусков сбора (фильтры: run_id, profile_id, ad_account_id, status, since, until, limit)"""
+    try:
+        runs = db_manager.get_collection_runs(
+            run_id=request.args.get('run_id'),
+            profile_id=request.args.get('profile_id'),
+            ad_account_id=request.args.get('ad_account_id'),
+            status=request.args.get('status'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=min(request.args.get('limit', 100, type=int), 1000)
+        )
+        return jsonify(runs)
+        
+    except Exception as e:
+        logger.error(f"Ошибка при получении журнала запусков: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/profiling', methods=['GET'])
+def api_get_profiling():
+    """API: Список сохраненных отчетов профилирования"""
+    try:
+        return jsonify(list_profiles(get_profiles_dir(config_manager.get_all())))
+    except Exception as e:
+        logger.error(f"Ошибка при получении отчетов профилирования: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/profiling/<path:filename>', methods=['GET'])
+def download_profiling(filename):
+    """Скачивание отчета профилирования"""
+    profiles_dir = os.path.abspath(get_profiles_dir(config_manager.get_all()))
+    return send_from_directory(profiles_dir, filename, as_attachment=True)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики производительности в текстовом формате Prometheus"""
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 if __name__ == '__main__':
     # Создаем директории если они не существуют
     os.makedirs('logs', exist_ok=True)